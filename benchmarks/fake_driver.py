@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# 不连接数据库的DB-API 2.0模块替身: execute不做任何事, fetch返回预设的结果,
+# 用于测量sql_client.base中与驱动无关的开销(paramstyle改写, standardize_args, 分块, 重试/计时钩子等)
+
+import sys
+from typing import Union, Optional
+
+from sql_client.base import SqlClient as BaseSqlClient, Paramstyle, RetryPolicy, Instrumentation
+
+apilevel = '2.0'
+threadsafety = 1
+paramstyle = 'format'
+
+
+class Error(Exception):
+    pass
+
+
+class InterfaceError(Error):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class ProgrammingError(DatabaseError):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+class DataError(DatabaseError):
+    pass
+
+
+class Cursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self._rows = ()
+        self._position = 0
+
+    def execute(self, query, args=None):
+        rows = self.connection.rows
+        self.description = self.connection.description if query.lstrip()[:6].lower() == 'select' else None
+        self._rows = rows if self.description is not None else ()
+        self._position = 0
+        self.rowcount = len(self._rows) if self.description is not None else 1
+
+    def executemany(self, query, args):
+        count = 0
+        for _ in args:
+            count += 1
+        self.description = None
+        self._rows = ()
+        self.rowcount = count
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def close(self):
+        pass
+
+
+class DictCursor(Cursor):
+    def fetchall(self):
+        keys = [column[0] for column in self.description]
+        return [dict(zip(keys, row)) for row in super().fetchall()]
+
+
+class cursors(object):
+    DictCursor = DictCursor
+    SSCursor = Cursor
+    SSDictCursor = DictCursor
+
+
+class Connection(object):
+    def __init__(self, rows=((1, 'a'),), description=(('id',), ('a',)), autocommit=True, **kwargs):
+        self.rows = tuple(rows)
+        self.description = description
+        self.autocommit = autocommit
+
+    def cursor(self, cursor_class=None):
+        return (cursor_class or Cursor)(self)
+
+    def ping(self, *args):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def connect(**kwargs):
+    return Connection(**kwargs)
+
+
+class SqlClient(BaseSqlClient):
+    lib = sys.modules[__name__]
+    dialect = None
+
+    def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = None, user: Optional[str] = None,
+                 password: Optional[str] = None, database: Optional[str] = None, charset: Optional[str] = None,
+                 autocommit: bool = True, connect_now: bool = True, log: bool = True, table: Optional[str] = None,
+                 statement_save_data: str = 'INSERT INTO', dictionary: bool = False, escape_auto_format: bool = False,
+                 escape_formatter: str = '{}', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
+                 to_paramstyle: Optional[Paramstyle] = Paramstyle.format, try_reconnect: bool = True,
+                 try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 pool_size: Optional[int] = None, pool_timeout: Union[int, float, None] = 30,
+                 pool_max_lifetime: Union[int, float, None] = None, pool_max_idle: Union[int, float, None] = None,
+                 retry_policy: Optional[RetryPolicy] = None, instrumentation: Optional[Instrumentation] = None,
+                 rows: tuple = ((1, 'a'),)):
+        # rows: select语句返回的结果(各列名为description)
+        self.rows = rows
+        super().__init__(host, port, user, password, database, charset, autocommit, connect_now, log, table,
+                         statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
+                         args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
+                         exc_info, query_cache_size, pool_size, pool_timeout, pool_max_lifetime, pool_max_idle,
+                         retry_policy, instrumentation)
+
+    def connect(self) -> None:
+        self.connection = self.lib.connect(rows=self.rows, description=tuple(
+            (str(i),) for i in range(len(self.rows[0]) if self.rows else 0)), autocommit=self._autocommit)
+        self.connected = True
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+
+# 性能基准: python -m benchmarks.run [--scale quick|default|full] [-k NAME] [--output PATH] [--compare PATH]
+# 不依赖数据库服务器: sqlalchemy + SQLite(临时文件), 以及不连接数据库的DB-API替身(benchmarks/fake_driver.py)
+# 每项取repeat次中最快一次(同timeit, 计时期间关闭gc); 结果以JSON写入benchmarks/results/<commit>.json,
+# --compare传入另一次的结果文件时逐项打印耗时比值, 比值超过--threshold的项标为REGRESSION(并以返回码1退出)
+
+import os
+import sys
+import gc
+import time
+import json
+import argparse
+import platform
+import subprocess
+import tempfile
+import datetime
+from typing import Any, Optional, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sql_client.sqlalchemy
+from sql_client import HistogramInstrumentation
+from sql_client._records import RecordCollection, records
+from benchmarks import fake_driver
+
+# 各规模下standardize_args, 记录转换等大批量测试的行数 (standardize_args的1e6行需--scale full)
+SCALES = {'quick': 10000, 'default': 100000, 'full': 1000000}
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+_benchmarks = []
+
+
+def benchmark(name: str, repeat: int = 5) -> Callable:
+    # 注册基准: 被装饰函数接收行数rows, return (每次计时执行的函数, 每次执行的操作数[, 每次计时前执行的函数])
+    def decorator(fn: Callable) -> Callable:
+        _benchmarks.append((name, repeat, fn))
+        return fn
+    return decorator
+
+
+def _timeit(fn: Callable, setup: Optional[Callable], repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _sqlite(path: str, **kwargs) -> sql_client.sqlalchemy.SqlClient:
+    return sql_client.sqlalchemy.SqlClient('sqlite:///' + path, try_times_connect=1, raise_error=True, log=False,
+                                           **kwargs)
+
+
+def _rows(n: int) -> list:
+    return [(i, str(i), '' if i % 10 == 0 else 'x', i * 0.5) for i in range(n)]
+
+
+KEYS = ('id', 'a', 'b', 'c')
+_tempdir = tempfile.mkdtemp(prefix='sql_client_bench_')
+
+
+# query每次调用的开销 ----------------------------------------------------------------------------------------
+
+@benchmark('query.fake.format_args')
+def _(rows):
+    db = fake_driver.SqlClient(log=False)
+    n = max(rows // 10, 1000)
+
+    def run():
+        for i in range(n):
+            db.query('select id, a from t where id=%s and a=%s', (i, 'a'))
+    return run, n
+
+
+@benchmark('query.fake.named_args')
+def _(rows):
+    db = fake_driver.SqlClient(log=False)
+    n = max(rows // 10, 1000)
+
+    def run():
+        for i in range(n):
+            db.query('select id, a from t where id=:id and a=:a', {'id': i, 'a': 'a'})
+    return run, n
+
+
+@benchmark('query.fake.instrumented')
+def _(rows):
+    db = fake_driver.SqlClient(log=False, instrumentation=HistogramInstrumentation())
+    n = max(rows // 10, 1000)
+
+    def run():
+        for i in range(n):
+            db.query('select id, a from t where id=%s and a=%s', (i, 'a'))
+    return run, n
+
+
+@benchmark('query.sqlite.point_select')
+def _(rows):
+    db = _sqlite(os.path.join(_tempdir, 'query.db'))
+    db.query('create table if not exists t (id integer primary key, a varchar(255))', fetchall=False)
+    db.query('delete from t', fetchall=False)
+    db.save_data([(i, str(i)) for i in range(100)], 't', not_one_by_one=True)
+    n = max(rows // 20, 500)
+
+    def run():
+        for i in range(n):
+            db.query('select id, a from t where id=:id', {'id': i % 100})
+    return run, n
+
+
+@benchmark('query.sqlite.point_select_prepare')
+def _(rows):
+    db = _sqlite(os.path.join(_tempdir, 'query.db'), prepare=True)
+    n = max(rows // 20, 500)
+
+    def run():
+        for i in range(n):
+            db.query('select id, a from t where id=:id', {'id': i % 100})
+    return run, n
+
+
+# standardize_args: 各输入形式 --------------------------------------------------------------------------------
+
+def _standardize(name: str, make_args: Callable[[int], Any], empty_string_to_none: bool = False,
+                 args_to_dict: Any = None, keys: Optional[tuple] = None, nums: Optional[tuple] = None) -> None:
+    @benchmark('standardize_args.' + name, repeat=3)
+    def _(rows):
+        db = fake_driver.SqlClient(connect_now=False, log=False)
+        args = make_args(rows)
+
+        def run():
+            db.standardize_args(args, True, empty_string_to_none, args_to_dict, False, keys, nums)
+        return run, rows
+
+
+_standardize('tuples', _rows)
+_standardize('tuples.empty_string_to_none', _rows, True)
+_standardize('tuples.to_dict', _rows, False, True, KEYS)
+_standardize('tuples.numeric_reorder', _rows, False, False, None, (3, 0, 2, 1))
+_standardize('tuples.numeric_reorder.empty_string_to_none', _rows, True, False, None, (3, 0, 2, 1))
+_standardize('dicts', lambda n: [dict(zip(KEYS, row)) for row in _rows(n)])
+_standardize('dicts.empty_string_to_none', lambda n: [dict(zip(KEYS, row)) for row in _rows(n)], True)
+_standardize('dicts.to_tuple', lambda n: [dict(zip(KEYS, row)) for row in _rows(n)], False, False)
+_standardize('dicts.to_tuple.empty_string_to_none', lambda n: [dict(zip(KEYS, row)) for row in _rows(n)], True,
+             False)
+_standardize('generators', lambda n: [iter(row) for row in _rows(n)], True)
+
+
+# save_data: 各批量方式 ----------------------------------------------------------------------------------------
+
+def _save_data(name: str, rows_factor: float, make_args: Callable[[int], Any] = _rows, **kwargs) -> None:
+    @benchmark('save_data.sqlite.' + name, repeat=3)
+    def _(rows):
+        db = _sqlite(os.path.join(_tempdir, 'save_data.db'))
+        db.query('create table if not exists t (id integer primary key, a varchar(255), b varchar(255), c real)',
+                 fetchall=False)
+        n = max(int(rows * rows_factor), 100)
+        args = make_args(n)
+
+        def setup():
+            db.query('delete from t', fetchall=False)
+
+        def run():
+            db.save_data(args, 't', **kwargs)
+        return run, n, setup
+
+
+_save_data('one_by_one', 0.1)
+_save_data('executemany', 1, not_one_by_one=True)
+_save_data('values', 1, batch_mode='values')
+_save_data('dicts.executemany', 1, lambda n: [dict(zip(KEYS, row)) for row in _rows(n)], not_one_by_one=True)
+
+
+@benchmark('save_data.fake.executemany', repeat=3)
+def _(rows):
+    db = fake_driver.SqlClient(log=False)
+    args = [dict(zip(KEYS, row)) for row in _rows(rows)]
+
+    def run():
+        db.save_data(args, 't', not_one_by_one=True)
+    return run, rows
+
+
+@benchmark('save_data.fake.values', repeat=3)
+def _(rows):
+    db = fake_driver.SqlClient(log=False)
+    args = _rows(rows)
+
+    def run():
+        db.save_data(args, 't', batch_mode='values')
+    return run, rows
+
+
+@benchmark('save_data.fake.generator', repeat=3)
+def _(rows):
+    db = fake_driver.SqlClient(log=False)
+
+    def run():
+        db.save_data(((i, str(i), '', i * 0.5) for i in range(rows)), 't', not_one_by_one=True)
+    return run, rows
+
+
+# select_to_try/end_try领取速率 -------------------------------------------------------------------------------
+
+def _claim(name: str, batch: int) -> None:
+    @benchmark('select_to_try.sqlite.' + name, repeat=3)
+    def _(rows):
+        db = _sqlite(os.path.join(_tempdir, 'claim.db'))
+        db.query('create table if not exists t (id integer primary key, a varchar(255), tried int default 1, '
+                 'finished int default 0)', fetchall=False)
+        db.query('delete from t', fetchall=False)
+        n = max(rows // 20, 200)
+        db.save_data([{'a': str(i)} for i in range(n)], 't', not_one_by_one=True)
+
+        def setup():
+            db.query('update t set tried=1, finished=0', fetchall=False)
+
+        def run():
+            while True:
+                result = db.select_to_try('t', batch, extra_fields='a', tried_field='tried', lock=False)
+                if not result:
+                    return
+                db.end_try(result, 't', tried_field='tried', finished_field='finished')
+        return run, n, setup
+
+
+_claim('batch_1', 1)
+_claim('batch_100', 100)
+
+
+# Record/RecordCollection转换 ---------------------------------------------------------------------------------
+
+@benchmark('records.collection', repeat=3)
+def _(rows):
+    data = _rows(rows)
+
+    def run():
+        RecordCollection(records(KEYS, data))
+    return run, rows
+
+
+@benchmark('records.all_as_dict', repeat=3)
+def _(rows):
+    collection = RecordCollection(records(KEYS, _rows(rows)))
+
+    def run():
+        collection.all(as_dict=True)
+    return run, rows
+
+
+@benchmark('records.dataset', repeat=3)
+def _(rows):
+    collection = RecordCollection(records(KEYS, _rows(rows)))
+
+    def run():
+        collection.dataset
+    return run, rows
+
+
+@benchmark('records.sqlite.query_dictionary', repeat=3)
+def _(rows):
+    db = _sqlite(os.path.join(_tempdir, 'records.db'))
+    db.query('create table if not exists t (id integer primary key, a varchar(255), b varchar(255), c real)',
+             fetchall=False)
+    db.query('delete from t', fetchall=False)
+    n = max(rows // 10, 1000)
+    db.save_data(_rows(n), 't', not_one_by_one=True)
+
+    def run():
+        db.query('select id, a, b, c from t', dictionary=True)
+    return run, n
+
+
+# 运行与比较 --------------------------------------------------------------------------------------------------
+
+def _git(*args: str) -> Optional[str]:
+    try:
+        return subprocess.run(('git',) + args, cwd=os.path.dirname(RESULTS_DIR), stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scale: str = 'default', keyword: Optional[str] = None, verbose: bool = True) -> dict:
+    rows = SCALES[scale]
+    results = {}
+    for name, repeat, fn in _benchmarks:
+        if keyword is not None and keyword not in name:
+            continue
+        prepared = fn(rows)
+        seconds = _timeit(prepared[0], prepared[2] if len(prepared) > 2 else None, repeat)
+        n = prepared[1]
+        results[name] = {'seconds': round(seconds, 6), 'n': n, 'us_per_op': round(seconds / n * 1e6, 4),
+                         'ops_per_sec': round(n / seconds, 1) if seconds else None}
+        if verbose:
+            print('{:<60} {:>10.4f}s {:>10} ops {:>12.3f} us/op'.format(name, seconds, n, seconds / n * 1e6))
+    commit = _git('rev-parse', '--short', 'HEAD')
+    return {'commit': commit, 'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'), 'scale': scale,
+            'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+
+
+def compare(current: dict, baseline: dict, threshold: float = 1.2) -> list:
+    # 按us_per_op逐项比较, return比值超过threshold的项名
+    regressions = []
+    print('\n{:<60} {:>12} {:>12} {:>8}  (baseline: {}, scale {})'.format(
+        'benchmark', 'baseline', 'current', 'ratio', baseline.get('commit'), baseline.get('scale')))
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print('{:<60} {:>12} {:>12.3f}'.format(name, '-', result['us_per_op']))
+            continue
+        ratio = result['us_per_op'] / old['us_per_op'] if old['us_per_op'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        print('{:<60} {:>12.3f} {:>12.3f} {:>8.2f}{}'.format(name, old['us_per_op'], result['us_per_op'], ratio,
+                                                               flag))
+    return regressions
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description='sql_client benchmarks')
+    parser.add_argument('--scale', choices=tuple(SCALES), default='default')
+    parser.add_argument('-k', dest='keyword', help='only run benchmarks whose name contains KEYWORD')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<commit>.json, "-" to skip)')
+    parser.add_argument('--compare', help='previous result file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio reported as a regression')
+    options = parser.parse_args(argv)
+    current = run(options.scale, options.keyword)
+    if options.output != '-':
+        path = options.output
+        if path is None:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            path = os.path.join(RESULTS_DIR, '{}{}-{}.json'.format(
+                current['commit'] or 'unknown', '-dirty' if current['dirty'] else '', options.scale))
+        with open(path, 'w') as f:
+            json.dump(current, f, indent=2)
+        print('\nresults written to {}'.format(path))
+    if options.compare is not None:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, options.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
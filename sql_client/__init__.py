@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
-from .base import SqlClient, Paramstyle, NOTSET, Notset
+from .base import (SqlClient, Paramstyle, NOTSET, Notset, RetryPolicy, CircuitOpenError, Instrumentation,
+                   HistogramInstrumentation, StatementStats, fingerprint)
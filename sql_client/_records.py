@@ -3,20 +3,54 @@ from inspect import isclass
 
 import tablib
 
+class RecordSchema(object):
+    """The column names shared by all Records of a query result."""
+    __slots__ = ('_keys', '_index', '_duplicates')
+
+    def __init__(self, keys):
+        self._keys = list(keys)
+        self._index = {}
+        self._duplicates = set()
+
+        # Build the name -> index map once, remembering duplicate names.
+        for i, key in enumerate(self._keys):
+            if key in self._index:
+                self._duplicates.add(key)
+            else:
+                self._index[key] = i
+
+    def keys(self):
+        """Returns the list of column names."""
+        return self._keys
+
+    def index(self, key):
+        """Returns the position of a column name, or raises KeyError."""
+        if key in self._duplicates:
+            raise KeyError("Record contains multiple '{}' fields.".format(key))
+        try:
+            return self._index[key]
+        except (KeyError, TypeError):
+            raise KeyError("Record contains no '{}' field.".format(key))
+
+    def __len__(self):
+        return len(self._keys)
+
+
 class Record(object):
     """A row, from a query, from a database."""
-    __slots__ = ('_keys', '_values')
+    __slots__ = ('_schema', '_values')
 
     def __init__(self, keys, values):
-        self._keys = keys
+        # Records of the same result should share one RecordSchema.
+        self._schema = keys if isinstance(keys, RecordSchema) else RecordSchema(keys)
         self._values = values
 
         # Ensure that lengths match properly.
-        assert len(self._keys) == len(self._values)
+        assert len(self._schema) == len(self._values)
 
     def keys(self):
         """Returns the list of column names from the query."""
-        return self._keys
+        return self._schema.keys()
 
     def values(self):
         """Returns the list of values from the query."""
@@ -28,16 +62,10 @@ class Record(object):
     def __getitem__(self, key):
         # Support for index-based lookup.
         if isinstance(key, int):
-            return self.values()[key]
+            return self._values[key]
 
         # Support for string-based lookup.
-        if key in self.keys():
-            i = self.keys().index(key)
-            if self.keys().count(key) > 1:
-                raise KeyError("Record contains multiple '{}' fields.".format(key))
-            return self.values()[i]
-
-        raise KeyError("Record contains no '{}' field.".format(key))
+        return self._values[self._schema.index(key)]
 
     def __getattr__(self, key):
         try:
@@ -45,6 +73,10 @@ class Record(object):
         except KeyError as e:
             raise AttributeError(e)
 
+    def __reduce__(self):
+        # Pickle by constructor so unpickling never reaches __getattr__.
+        return Record, (self._schema, self._values)
+
     def __dir__(self):
         standard = dir(super(Record, self))
         # Merge standard attrs with generated ones (from column names).
@@ -160,6 +192,13 @@ class RecordCollection(list):
         return row[0] if row else default
 
 
+def records(keys, rows):
+    """Yields Records sharing one RecordSchema built from keys."""
+    schema = RecordSchema(keys)
+    for row in rows:
+        yield Record(schema, tuple(row))
+
+
 def isexception(obj):
     """Given an object, return a boolean indicating whether it is an instance
     or subclass of :py:class:`Exception`.
@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import functools
+import itertools
+import time
+import inspect
+from typing import Any, Union, Optional, Tuple, Iterable, Collection, Callable, Generator, AsyncGenerator
+
+from .base import SqlClient as BaseSqlClient, Paramstyle, NOTSET, Notset, RetryPolicy, Instrumentation, fingerprint
+
+
+class AsyncSqlClient(BaseSqlClient):
+    # SqlClient的异步版本: query, save_data, select_to_try, end_try, fail_try, cancel_try, reclaim_expired,
+    # query_file, begin, commit, rollback, connect, try_connect, close, ping等均需await; transaction为async with;
+    # retrying_transaction等均需await, 其fn需为协程函数; 重试间隔使用asyncio.sleep
+    # 参数标准化, paramstyle改写与auto_format复用SqlClient.query, 仅执行层为异步
+    # 不支持: query的stream, columnar参数, call_proc, load_data, save_data的method参数
+    # 子类需实现connect, _before_query_and_get_async_cursor(以及按需覆盖begin, close, ping, format)
+
+    # lib模块的以下属性被下列方法使用：
+    # lib.ProgrammingError: close
+    # lib.InterfaceError(可无), lib.OperationalError: ping, try_connect, try_execute
+    # lib.connect: connect
+
+    def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = None, user: Optional[str] = None,
+                 password: Optional[str] = None, database: Optional[str] = None, charset: Optional[str] = None,
+                 autocommit: bool = True, connect_now: bool = True, log: bool = True, table: Optional[str] = None,
+                 statement_save_data: str = 'INSERT INTO', dictionary: bool = False, escape_auto_format: bool = False,
+                 escape_formatter: str = '{}', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
+                 to_paramstyle: Optional[Paramstyle] = Paramstyle.format, try_reconnect: bool = True,
+                 try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 retry_policy: Optional[RetryPolicy] = None, instrumentation: Optional[Instrumentation] = None):
+        # connect_now: __init__中无法await, 故不在此连接, 首次执行语句时自动连接(也可先await try_connect())
+        super().__init__(host, port, user, password, database, charset, autocommit, False, log, table,
+                         statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
+                         args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
+                         exc_info, query_cache_size, retry_policy=retry_policy,
+                         instrumentation=instrumentation)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def _retry_errors(self) -> tuple:
+        # try_connect, try_execute重试的异常类型
+        return tuple(getattr(self.lib, name) for name in ('InterfaceError', 'OperationalError')
+                     if hasattr(self.lib, name))
+
+    async def query(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
+                    chunksize: Optional[int] = None, not_one_by_one: bool = True, auto_format: bool = False,
+                    keys: Union[str, Collection[str], None] = None, commit: Optional[bool] = None,
+                    escape_auto_format: Optional[bool] = None, escape_formatter: Optional[str] = None,
+                    empty_string_to_none: Optional[bool] = None, args_to_dict: Union[bool, Notset, None] = NOTSET,
+                    to_paramstyle: Union[Paramstyle, Notset, None] = NOTSET, keep_cursor: Optional[bool] = False,
+                    cursor: Any = None, try_times_connect: Union[int, float, None] = None,
+                    time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                    exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None
+                    ) -> Union[Union[int, list, tuple, AsyncGenerator],
+                               Tuple[Union[int, list, tuple, AsyncGenerator], Any]]:
+        # 参数同SqlClient.query; chunksize: fetchall=True时返回异步生成器(async for)
+        # call: 协程函数, 参数同try_execute, 默认为try_execute
+        if args is not None and not hasattr(args, '__getitem__') and hasattr(args, '__iter__'):  # set, Generator, range
+            args, rows = self._peek_rows(args)
+            if rows is not None and (fetchall or keep_cursor):
+                args = tuple(rows)
+            elif rows is not None:  # 按chunksize条分块执行, 见SqlClient.query
+                count = 0
+                for chunk in iter(lambda: tuple(itertools.islice(rows, chunksize or 10000)), ()):
+                    if auto_format and keys is None and isinstance(chunk[0], dict):
+                        keys = tuple(chunk[0])
+                    count += await self.query(query, chunk, False, dictionary, chunksize, not_one_by_one, auto_format,
+                                              keys, commit, escape_auto_format, escape_formatter,
+                                              empty_string_to_none, args_to_dict, to_paramstyle, False, cursor,
+                                              try_times_connect, time_sleep_connect, raise_error, exc_info, call)
+                return count
+        if call is None:
+            call = self.try_execute
+        plan = []
+        planned = object()
+
+        def record(*params):
+            # SqlClient.query完成参数标准化与改写后, 此处只记录每次执行的参数, 之后依次await执行
+            plan.append(params[:8] + (cursor,) + params[9:])
+            result = planned if params[2] else 0
+            return (result, None) if params[7] else result
+
+        result = super().query(query, args, fetchall, dictionary, chunksize, not_one_by_one, auto_format, keys, commit,
+                               escape_auto_format, escape_formatter, empty_string_to_none, args_to_dict, to_paramstyle,
+                               keep_cursor, None, try_times_connect, time_sleep_connect, raise_error, exc_info, record)
+        if keep_cursor:
+            result = result[0]
+        if result is planned:  # 执行一次
+            return await call(*plan[0])
+        # 依次执行
+        result = [] if fetchall else 0
+        temp_cursor = None
+        for params in plan:
+            temp_result = await call(*params)
+            if keep_cursor:
+                if temp_cursor is not None and (chunksize is None or not fetchall):
+                    await temp_cursor.close()
+                temp_result, temp_cursor = temp_result
+            if fetchall:
+                result.append(temp_result)
+            else:
+                result += temp_result
+        if keep_cursor:
+            return result, temp_cursor
+        return result
+
+    async def save_data(self, args: Any, table: Optional[str] = None, statement: Optional[str] = None,
+                        extra: Optional[str] = None, not_one_by_one: Optional[bool] = False,
+                        keys: Union[str, Collection[str], None] = None, commit: Optional[bool] = None,
+                        escape_auto_format: Optional[bool] = None, escape_formatter: Optional[str] = None,
+                        empty_string_to_none: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
+                        time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                        exc_info: Union[bool, Notset, None] = NOTSET, batch_mode: Optional[str] = None,
+                        method: Optional[str] = None, chunksize: int = 10000) -> Union[int, tuple, list]:
+        # 参数同SqlClient.save_data; batch_mode='values'时按not_one_by_one=True执行(由异步库的executemany批量执行)
+        if method is not None:
+            raise ValueError(method)
+        if batch_mode == 'values':
+            not_one_by_one = True
+        elif batch_mode is not None:
+            raise ValueError(batch_mode)
+        return await self._await(super().save_data(
+            args, table, statement, extra, not_one_by_one, keys, commit, escape_auto_format, escape_formatter,
+            empty_string_to_none, try_times_connect, time_sleep_connect, raise_error, exc_info, None, None, chunksize))
+
+    def load_data(self, args: Any, table: Optional[str] = None, statement: Optional[str] = None,
+                  keys: Union[str, Collection[str], None] = None, commit: Optional[bool] = None,
+                  escape_auto_format: Optional[bool] = None, escape_formatter: Optional[str] = None,
+                  empty_string_to_none: Optional[bool] = None, chunksize: int = 10000,
+                  try_times_connect: Union[int, float, None] = None,
+                  time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                  exc_info: Union[bool, Notset, None] = NOTSET) -> int:
+        # 不支持: SqlClient.load_data的执行层为同步(临时文件与LOAD DATA LOCAL INFILE), 调用时直接raise
+        raise NotImplementedError('load_data')
+
+    async def select_to_try(self, table: Optional[str] = None, num: Union[int, str, None] = 1,
+                            key_fields: Union[str, Iterable[str]] = 'id',
+                            extra_fields: Union[str, Iterable[str], None] = '', tried_field: Optional[str] = None,
+                            tried: Union[int, str, Notset, None] = 'between', tried_min: Union[int, str, None] = 1,
+                            tried_max: Union[int, str, None] = 5, tried_after: Union[int, str, Notset, None] = '-',
+                            finished_field: Optional[str] = None, finished: Union[int, str, None] = 0,
+                            next_time_field: Optional[str] = None,
+                            next_time: Union[int, float, str, Notset, None] = None,
+                            next_time_after: Union[int, float, str, Notset, None] = NOTSET, lock: bool = True,
+                            dictionary: Optional[bool] = None, autocommit_after: Optional[bool] = None,
+                            select_where: Optional[str] = None, select_extra: str = '',
+                            set_extra: Optional[str] = '', update_set: Optional[str] = None,
+                            update_where: Optional[str] = None, update_extra: str = '',
+                            empty_string_to_none: Optional[bool] = None,
+                            try_times_connect: Union[int, float, None] = None,
+                            time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                            exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None,
+                            skip_locked: bool = False, nowait: bool = False, returning: bool = False,
+                            lease_seconds: Union[int, float, None] = None) -> Union[int, tuple, list]:
+        # 参数同SqlClient.select_to_try
+        return await self._await(super().select_to_try(
+            table, num, key_fields, extra_fields, tried_field, tried, tried_min, tried_max, tried_after, finished_field,
+            finished, next_time_field, next_time, next_time_after, lock, dictionary, autocommit_after, select_where,
+            select_extra, set_extra, update_set, update_where, update_extra, empty_string_to_none, try_times_connect,
+            time_sleep_connect, raise_error, exc_info, call, skip_locked, nowait, returning, lease_seconds))
+
+    async def end_try(self, result: Optional[Iterable], table: Optional[str] = None,
+                      key_fields: Union[str, Iterable[str], None] = None, tried_field: Optional[str] = None,
+                      tried: Union[int, str, None] = 0, finished_field: Optional[str] = None,
+                      finished: Union[int, str, None] = 1, next_time_field: Optional[str] = None,
+                      next_time: Union[int, float, str, None] = '=0', commit: bool = True,
+                      set_extra: Optional[str] = '', update_set: Optional[str] = None,
+                      update_where: Optional[str] = None, update_extra: str = '',
+                      empty_string_to_none: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
+                      time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                      exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None) -> int:
+        # 参数同SqlClient.end_try; fail_try, cancel_try复用end_try, 同样需await
+        return await self._await(super().end_try(
+            result, table, key_fields, tried_field, tried, finished_field, finished, next_time_field, next_time,
+            commit, set_extra, update_set, update_where, update_extra, empty_string_to_none, try_times_connect,
+            time_sleep_connect, raise_error, exc_info, call))
+
+    async def reclaim_expired(self, table: Optional[str] = None, tried_field: Optional[str] = None,
+                              next_time_field: Optional[str] = None, tried: Union[int, str, None] = '-+1',
+                              next_time: Union[int, float, str, Notset, None] = NOTSET,
+                              finished_field: Optional[str] = None, finished: Union[int, str, None] = 0,
+                              set_extra: Optional[str] = '', update_extra: str = '', commit: bool = True,
+                              try_times_connect: Union[int, float, None] = None,
+                              time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                              exc_info: Union[bool, Notset, None] = NOTSET) -> int:
+        # 参数同SqlClient.reclaim_expired
+        return await self._await(super().reclaim_expired(
+            table, tried_field, next_time_field, tried, next_time, finished_field, finished, set_extra, update_extra,
+            commit, try_times_connect, time_sleep_connect, raise_error, exc_info))
+
+    async def _run_steps(self, steps: Generator[Callable, Any, Any]) -> Any:
+        # 以await驱动步骤生成器(_select_to_try_steps, _end_try_steps)
+        result = None
+        while True:
+            try:
+                step = steps.send(result)
+            except StopIteration as e:
+                return e.value
+            result = await self._await(step())
+
+    async def close(self, try_close: bool = True) -> None:
+        self.connected = False
+        if try_close:
+            try:
+                await self._await(self.connection.close())
+            except (self.lib.ProgrammingError, AttributeError):
+                # AttributeError: 'NoneType' object has no attribute 'close'
+                pass
+        else:
+            await self._await(self.connection.close())
+
+    @property
+    def autocommit(self) -> bool:
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value: bool):
+        # 异步库设置autocommit多为协程, 此处只记录, 由_before_query_and_get_async_cursor在执行语句前同步到连接
+        self._autocommit = value
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        # yield: None or transaction
+        transaction = await self.begin()
+        try:
+            yield transaction
+            await self.commit(transaction)
+        except Exception as e:
+            await self.rollback(transaction)
+            raise e
+
+    async def retrying_transaction(self, fn: Callable, retries: int = 3,
+                                   backoff: Union[int, float, Callable[[int], Union[int, float]], None] = 0.1,
+                                   args: Iterable = (), kwargs: Optional[dict] = None) -> Any:
+        if kwargs is None:
+            kwargs = {}
+        local = self._local
+        retrying = local.retrying
+        try_count = 0
+        while True:
+            local.retrying = True
+            try:
+                async with self.transaction():
+                    return await fn(*args, **kwargs)
+            except Exception as e:
+                if retrying or not self.is_transaction_conflict(e) or try_count >= retries:
+                    raise e
+                try_count += 1
+                sleep = self._transaction_backoff(backoff, try_count)
+                if self.log:
+                    self.logger.warning('{}(retry transaction({}), sleep {}): {}'.format(
+                        str(type(e))[8:-2], try_count, sleep, e))
+                if sleep:
+                    await asyncio.sleep(sleep)
+            finally:
+                local.retrying = retrying
+
+    def retry_transaction(self, retries: int = 3,
+                          backoff: Union[int, float, Callable[[int], Union[int, float]], None] = 0.1) -> Callable:
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                return await self.retrying_transaction(fn, retries, backoff, args, kwargs)
+            return wrapper
+        return decorator
+
+    async def begin(self) -> None:
+        self.temp_autocommit = self._autocommit
+        self.autocommit = False
+        await self.set_connection()
+        await self.connection.begin()
+
+    async def commit(self, transaction=None) -> None:
+        await self.connection.commit()
+        if self.temp_autocommit is not None:
+            self.autocommit = self.temp_autocommit
+            self.temp_autocommit = None
+
+    async def rollback(self, transaction=None) -> None:
+        if self.connection is not None:
+            await self.connection.rollback()
+        if self.temp_autocommit is not None:
+            self.autocommit = self.temp_autocommit
+            self.temp_autocommit = None
+
+    async def connect(self) -> None:
+        self.connection = await self.lib.connect(host=self.host, port=self.port, user=self.user,
+                                                 password=self.password, database=self.database, charset=self.charset,
+                                                 autocommit=self._autocommit)
+        self.connected = True
+
+    async def reconnect(self, exc_info: Union[bool, Notset, None] = NOTSET) -> None:
+        await self.connect()
+
+    async def set_connection(self) -> None:
+        if self.instrumentation is not None:
+            started = time.perf_counter()
+        if not self.connected or self.connection is None:
+            await self.try_connect()
+        if self.instrumentation is not None:
+            self._instrument('connect', None, started)
+
+    async def try_connect(self, try_reconnect: Optional[bool] = None,
+                          try_times_connect: Union[int, float, None] = None,
+                          time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                          exc_info: Union[bool, Notset, None] = NOTSET) -> None:
+        if try_reconnect is None:
+            try_reconnect = self.try_reconnect
+        if try_times_connect is None:
+            try_times_connect = self.try_times_connect
+        if time_sleep_connect is None:
+            time_sleep_connect = self.time_sleep_connect
+        if raise_error is None:
+            raise_error = self.raise_error
+        if exc_info is NOTSET:
+            exc_info = self.exc_info
+        policy = self.retry_policy
+        started = time.monotonic()
+        try_count_connect = 0
+        while True:
+            try:
+                if policy is not None:
+                    policy.check()
+                if try_reconnect:
+                    await self.reconnect()
+                else:
+                    await self.connect()
+                if policy is not None:
+                    policy.success()
+                return
+            except self._retry_errors as e:
+                try_count_connect += 1
+                give_up, sleep, _ = self._retry_decision(e, try_count_connect, try_times_connect,
+                                                         time_sleep_connect, started, connecting=True)
+                if give_up:
+                    if self.log:
+                        self.logger.error('{}(max retry({})): {}  (in try_connect)'.format(
+                            str(type(e))[8:-2], try_count_connect, e),
+                            exc_info=not raise_error if exc_info is None else exc_info)
+                    if raise_error:
+                        raise e
+                    return
+                if self.log:
+                    self.logger.error('{}(retry({}), sleep {}): {}  (in try_connect)'.format(
+                        str(type(e))[8:-2], try_count_connect, sleep, e),
+                        exc_info=True if exc_info is None else exc_info)
+                if self.instrumentation is not None:
+                    self.instrumentation.record('reconnect', None, sleep or 0)
+                if sleep:
+                    await asyncio.sleep(sleep)
+            except Exception as e:
+                if self.log:
+                    self.logger.error('{}: {}  (in try_connect)'.format(str(type(e))[8:-2], e),
+                                      exc_info=not raise_error if exc_info is None else exc_info)
+                if raise_error:
+                    raise e
+                return
+
+    async def try_execute(self, query: str, args: Any = None, fetchall: bool = True,
+                          dictionary: Optional[bool] = None, chunksize: Optional[int] = None, many: bool = False,
+                          commit: Optional[bool] = None, keep_cursor: Optional[bool] = False, cursor: Any = None,
+                          try_times_connect: Union[int, float, None] = None,
+                          time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                          exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None
+                          ) -> Union[Union[int, list, tuple, AsyncGenerator],
+                                     Tuple[Union[int, list, tuple, AsyncGenerator], Any]]:
+        # fetchall=False: return成功执行语句数(executemany模式按数据条数)
+        # call: 协程函数, 默认为execute
+        if try_times_connect is None:
+            try_times_connect = self.try_times_connect
+        if time_sleep_connect is None:
+            time_sleep_connect = self.time_sleep_connect
+        if raise_error is None:
+            raise_error = self.raise_error
+        if exc_info is NOTSET:
+            exc_info = self.exc_info
+        if call is None:
+            call = self.execute
+        if self._local.retrying:  # retrying_transaction中: 出错即raise, 由其重新执行整个事务
+            try_times_connect = 1
+            raise_error = True
+        policy = self.retry_policy
+        started = time.monotonic()
+        try_count_connect = 0
+        reconnect = False
+        while True:
+            try:
+                if policy is not None:
+                    policy.check()
+                    if reconnect:  # 连接已断开: 关闭后由call重建连接
+                        reconnect = False
+                        try:
+                            await self.close()
+                        except Exception:
+                            pass
+                result = await call(query, args, fetchall, dictionary, chunksize, many, commit, keep_cursor, cursor)
+                if policy is not None:
+                    policy.success()
+                if self.instrumentation is not None:
+                    self._record_statement(query, args, cursor, started, result, keep_cursor, try_count_connect)
+                return result
+            except self._retry_errors as e:
+                try_count_connect += 1
+                give_up, sleep, reconnect = self._retry_decision(
+                    e, try_count_connect, try_times_connect, time_sleep_connect, started,
+                    not self._autocommit or cursor is not None)
+                if give_up:
+                    if self.log:
+                        self.logger.error('{}(max retry({})): {}  {}'.format(
+                            str(type(e))[8:-2], try_count_connect, e, self._query_log_text(query, args, cursor)),
+                            exc_info=not raise_error if exc_info is None else exc_info)
+                    if self.instrumentation is not None:
+                        self._record_statement(query, args, cursor, started, None, False, try_count_connect - 1, e)
+                    if raise_error:
+                        raise e
+                    break
+                if self.log:
+                    self.logger.error('{}(retry({}), sleep {}): {}  {}'.format(
+                        str(type(e))[8:-2], try_count_connect, sleep, e,
+                        self._query_log_text(query, args, cursor)), exc_info=True if exc_info is None else exc_info)
+                if self.instrumentation is not None:
+                    self.instrumentation.record('retry', fingerprint(query), sleep or 0)
+                if sleep:
+                    await asyncio.sleep(sleep)
+            except Exception as e:
+                await self.rollback()
+                if self.log:
+                    self.logger.error('{}: {}  {}'.format(
+                        str(type(e))[8:-2], e, self._query_log_text(query, args, cursor)),
+                        exc_info=not raise_error if exc_info is None else exc_info)
+                if self.instrumentation is not None:
+                    self._record_statement(query, args, cursor, started, None, False, try_count_connect, e)
+                if raise_error:
+                    raise e
+                break
+        if fetchall:
+            return ()
+        return 0
+
+    async def execute(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
+                      chunksize: Optional[int] = None, many: bool = False, commit: Optional[bool] = None,
+                      keep_cursor: Optional[bool] = False, cursor: Any = None
+                      ) -> Union[Union[int, list, tuple, AsyncGenerator],
+                                 Tuple[Union[int, list, tuple, AsyncGenerator], Any]]:
+        # fetchall=False: return成功执行语句数(executemany模式按数据条数)
+        ori_cursor = cursor
+        if cursor is None:
+            cursor = await self._before_query_and_get_async_cursor(fetchall, dictionary)
+        timing = self.instrumentation is not None
+        if timing:
+            started = time.perf_counter()
+        if not many:
+            await cursor.execute(query, args)
+        else:
+            await cursor.executemany(query, args)
+        if commit and not self._autocommit:
+            await self.commit()
+        if timing:
+            started = self._instrument('execute', query, started, cursor.rowcount, len(query))
+        if not fetchall:
+            result = len(args) if many and hasattr(args, '__len__') else 1
+        elif chunksize is None:
+            result = await cursor.fetchall()
+            if timing:
+                self._instrument('fetch', query, started, len(result))
+        else:
+            result = self._fetchmany_async_generator(cursor, chunksize, keep_cursor)
+        if keep_cursor:
+            return result, cursor
+        if ori_cursor is None and (chunksize is None or not fetchall):
+            await cursor.close()
+        return result
+
+    async def _execute_rowcount(self, query: str, args: Any = None, fetchall: bool = True,
+                                dictionary: Optional[bool] = None, chunksize: Optional[int] = None, many: bool = False,
+                                commit: Optional[bool] = None, keep_cursor: Optional[bool] = False, cursor: Any = None
+                                ) -> int:
+        # 执行语句并return影响行数(cursor.rowcount), 由try_execute调用
+        ori_cursor = cursor
+        if cursor is None:
+            cursor = await self._before_query_and_get_async_cursor(False, dictionary)
+        if self.instrumentation is not None:
+            started = time.perf_counter()
+        await cursor.execute(query, args)
+        if commit and not self._autocommit:
+            await self.commit()
+        result = cursor.rowcount
+        if self.instrumentation is not None:
+            self._instrument('execute', query, started, result, len(query))
+        if ori_cursor is None:
+            await cursor.close()
+        return result
+
+    @staticmethod
+    async def _fetchmany_async_generator(cursor, chunksize, keep_cursor):
+        while True:
+            result = await cursor.fetchmany(chunksize)
+            if not result:
+                if not keep_cursor:
+                    await cursor.close()
+                return
+            yield result
+
+    @staticmethod
+    async def _await(result: Any) -> Any:
+        # 兼容同步返回值与awaitable(各异步库的部分方法为同步方法)
+        if inspect.isawaitable(result):
+            return await result
+        return result
+
+    async def ping(self) -> None:
+        await self.set_connection()
+        try:
+            await self.connection.ping()
+        except self._retry_errors:
+            await self.close()
+            await self.try_connect()
+        except AttributeError:
+            await self.try_connect()
+
+    def _before_query_and_get_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None) -> None:
+        # SqlClient.query只用于记录执行参数, cursor由_before_query_and_get_async_cursor创建
+        return None
+
+    def _before_query_and_get_stream_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None,
+                                            chunksize: Optional[int] = None) -> None:
+        return None
+
+    async def _before_query_and_get_async_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None
+                                                 ) -> Any:
+        raise NotImplementedError
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from typing import Union, Optional
+
+import aiomysql
+
+from .aiobase import AsyncSqlClient as BaseAsyncSqlClient
+from .base import Paramstyle, NOTSET, Notset, RetryPolicy, Instrumentation
+
+
+class AsyncSqlClient(BaseAsyncSqlClient):
+    lib = aiomysql
+    dialect = 'mysql'
+
+    def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = 3306, user: Optional[str] = None,
+                 password: Optional[str] = None, database: Optional[str] = None, charset: Optional[str] = 'utf8mb4',
+                 autocommit: bool = True, connect_now: bool = True, log: bool = True, table: Optional[str] = None,
+                 statement_save_data: str = 'REPLACE', dictionary: bool = False, escape_auto_format: bool = True,
+                 escape_formatter: str = '`{}`', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
+                 to_paramstyle: Optional[Paramstyle] = Paramstyle.format, try_reconnect: bool = True,
+                 try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 retry_policy: Optional[RetryPolicy] = None, instrumentation: Optional[Instrumentation] = None):
+        super().__init__(host, port, user, password, database, charset, autocommit, connect_now, log, table,
+                         statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
+                         args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
+                         exc_info, query_cache_size, retry_policy, instrumentation)
+
+    async def close(self, try_close: bool = True) -> None:
+        # aiomysql.Connection.close为同步方法且不等待连接关闭, 使用ensure_closed
+        self.connected = False
+        if try_close:
+            try:
+                await self.connection.ensure_closed()
+            except (self.lib.ProgrammingError, AttributeError):
+                pass
+        else:
+            await self.connection.ensure_closed()
+
+    async def connect(self) -> None:
+        self.connection = await self.lib.connect(host=self.host, port=self.port, user=self.user,
+                                                 password=self.password, db=self.database, charset=self.charset,
+                                                 autocommit=self._autocommit)
+        self.connected = True
+
+    async def reconnect(self, exc_info: Union[bool, Notset, None] = NOTSET) -> None:
+        if self.connection is not None:
+            try:
+                await self.connection.ping(reconnect=True)
+                self.connected = True
+                return
+            except self._retry_errors:
+                pass
+        await self.connect()
+
+    async def _before_query_and_get_async_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None
+                                                 ) -> aiomysql.Cursor:
+        await self.set_connection()
+        if self.connection.get_autocommit() != self._autocommit:
+            await self.connection.autocommit(self._autocommit)
+        if fetchall and (self.dictionary if dictionary is None else dictionary):
+            return await self.connection.cursor(self.lib.DictCursor)
+        return await self.connection.cursor()
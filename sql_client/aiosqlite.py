@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from typing import Any, Union, Optional
+
+import aiosqlite
+
+from .aiobase import AsyncSqlClient as BaseAsyncSqlClient
+from .base import Paramstyle, RetryPolicy, Instrumentation
+
+
+def _dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class AsyncSqlClient(BaseAsyncSqlClient):
+    lib = aiosqlite
+    dialect = 'sqlite'
+
+    def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = None, user: Optional[str] = None,
+                 password: Optional[str] = None, database: Optional[str] = ':memory:', charset: Optional[str] = None,
+                 autocommit: bool = True, connect_now: bool = True, log: bool = True, table: Optional[str] = None,
+                 statement_save_data: str = 'INSERT INTO', dictionary: bool = False, escape_auto_format: bool = True,
+                 escape_formatter: str = '"{}"', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
+                 to_paramstyle: Optional[Paramstyle] = Paramstyle.qmark, try_reconnect: bool = True,
+                 try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 retry_policy: Optional[RetryPolicy] = None, instrumentation: Optional[Instrumentation] = None):
+        # database: 数据库文件路径, 默认为内存数据库; host, port, user, password, charset无效
+        super().__init__(host, port, user, password, database, charset, autocommit, connect_now, log, table,
+                         statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
+                         args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
+                         exc_info, query_cache_size, retry_policy, instrumentation)
+
+    async def begin(self) -> None:
+        # sqlite3库无begin; BEGIN IMMEDIATE在事务开始时即获取写锁, select_to_try(需lock=False)借此互斥
+        self.temp_autocommit = self._autocommit
+        self.autocommit = False
+        await self.set_connection()
+        if not self.connection.in_transaction:
+            await self.connection.execute('BEGIN IMMEDIATE')
+
+    async def connect(self) -> None:
+        # 连接始终处于sqlite3的autocommit模式(isolation_level=None), 事务由begin或执行语句前的BEGIN显式开启
+        self.connection = await self.lib.connect(self.database, isolation_level=None)
+        self.connected = True
+
+    async def ping(self) -> None:
+        # sqlite没有ping
+        await self.set_connection()
+
+    def format(self, query: str, args: Any, raise_error: Optional[bool] = None, cursor: Any = None) -> str:
+        # sqlite3库没有literal和escape, 仅附上参数
+        return query if args is None else '{}  {}'.format(query, args)
+
+    async def _before_query_and_get_async_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None
+                                                 ) -> aiosqlite.Cursor:
+        await self.set_connection()
+        if not self._autocommit and not self.connection.in_transaction:
+            await self.connection.execute('BEGIN')
+        cursor = await self.connection.cursor()
+        if fetchall and (self.dictionary if dictionary is None else dictionary):
+            cursor.row_factory = _dict_factory
+        return cursor
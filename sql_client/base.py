@@ -7,6 +7,18 @@ import enum
 import re
 import itertools
 import functools
+import operator
+import threading
+import collections
+import tempfile
+import weakref
+import inspect
+import array
+import queue
+import random
+import bisect
+import heapq
+import json
 from typing import Any, Union, Optional, Tuple, Iterable, Collection, Callable, Sequence, Generator
 
 
@@ -25,6 +37,608 @@ class Paramstyle(enum.IntEnum):
     qmark = 4
 
 
+_load_data_escape_table = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+
+def _load_data_encode(value: Any, encoding: str = 'utf-8') -> bytes:
+    # 按LOAD DATA默认格式(FIELDS ESCAPED BY '\\')编码单个值
+    if value is None:
+        return b'\\N'
+    if isinstance(value, str):
+        return value.translate(_load_data_escape_table).encode(encoding)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n').replace(
+            b'\r', b'\\r').replace(b'\0', b'\\0')
+    if isinstance(value, bool):
+        return b'1' if value else b'0'
+    return str(value).translate(_load_data_escape_table).encode(encoding)
+
+
+def _items_getter(items: Sequence) -> Callable[[Any], tuple]:
+    # 按items(dict的key或序列下标)取值, 与operator.itemgetter不同的是总是return tuple
+    if len(items) == 1:
+        item = items[0]
+        return lambda row: (row[item],)
+    return operator.itemgetter(*items) if items else lambda row: ()
+
+
+def _empty_to_none(row: Sequence) -> Sequence:
+    # 空字符串转为None; 不含空字符串时直接return原记录(in检查在C层完成, 不逐个值构建新tuple)
+    return tuple([None if value == '' else value for value in row]) if '' in row else row
+
+
+def _dict_empty_to_none(row: dict) -> dict:
+    return {key: None if value == '' else value for key, value in row.items()} if '' in row.values() else row
+
+
+def _call_with_tuple(convert: Callable[[Sequence], Any], row: Iterable) -> Any:
+    return convert(tuple(row))
+
+
+class QueryCache(object):
+    # 有界LRU缓存, 用于缓存query方法的paramstyle检测与改写结果(预处理计划), 重复query可跳过全部正则处理
+    # maxsize: 最大缓存条数, 为0或None时不缓存
+    # hits, misses: 命中与未命中次数
+
+    def __init__(self, maxsize: Optional[int] = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'maxsize': self.maxsize, 'currsize': len(self._data)}
+
+
+class ColumnTable(object):
+    # query(columnar=True)的结果: 按列存储, columns[i]为第i列所有值
+    # 全为int的列存为array('q'), 含float的数值列存为array('d'), 其余列(含bool, Decimal, 超出int64的int等)存为list
+    # 数值列中的None以0填充, 并在masks对应位置标记为1; list列的masks为None, None值直接保留在列中
+    # numpy=True: 数值列与masks转为numpy数组(共享缓冲区, 不复制), list列不变
+
+    def __init__(self, keys: Sequence[str], columns: Sequence, masks: Optional[Sequence] = None):
+        self.keys = list(keys)
+        self.columns = list(columns)
+        self.masks = [None] * len(self.columns) if masks is None else list(masks)
+        self._index = {}
+        for i, key in enumerate(self.keys):
+            self._index.setdefault(key, i)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, key: Union[int, str]) -> Any:
+        return self.columns[key if isinstance(key, int) else self._index[key]]
+
+    def __repr__(self):
+        return '<ColumnTable {} rows x {} columns>'.format(len(self), len(self.columns))
+
+    def mask(self, key: Union[int, str]) -> Any:
+        return self.masks[key if isinstance(key, int) else self._index[key]]
+
+    def column(self, key: Union[int, str]) -> list:
+        # 返回还原了None值的列
+        i = key if isinstance(key, int) else self._index[key]
+        column, mask = self.columns[i], self.masks[i]
+        if mask is None or not any(mask):
+            return list(column)
+        return [None if m else v for v, m in zip(column, mask)]
+
+    def rows(self) -> list:
+        return list(zip(*(self.column(i) for i in range(len(self.columns)))))
+
+    def to_dict(self) -> dict:
+        return {key: self.column(i) for i, key in enumerate(self.keys)}
+
+    @classmethod
+    def from_chunks(cls, keys: Iterable[str], chunks: Iterable[Sequence[Sequence]], numpy: bool = False
+                    ) -> 'ColumnTable':
+        # chunks: 逐块的行记录(如fetchmany的结果), 每块转置后追加到各列缓冲区, 不保留行对象
+        keys = list(keys)
+        columns = [array.array('q') for _ in keys]
+        masks = [bytearray() for _ in keys]
+        none_type = type(None)
+        for chunk in chunks:
+            for i, values in enumerate(zip(*chunk)):
+                column, mask = columns[i], masks[i]
+                if mask is not None:
+                    types = set(map(type, values))
+                    has_none = none_type in types
+                    types.discard(none_type)
+                    if column.typecode == 'q' and types and types <= {int, float} and not types <= {int}:
+                        column = columns[i] = array.array('d', column)
+                    if types <= ({int} if column.typecode == 'q' else {int, float}):
+                        size = len(column)
+                        try:
+                            column.extend([0 if v is None else v for v in values] if has_none else values)
+                        except OverflowError:
+                            del column[size:]
+                        else:
+                            mask.extend([v is None for v in values] if has_none else bytes(len(values)))
+                            continue
+                    # 出现非数值类型, 该列退化为list
+                    column = columns[i] = [None if m else v for v, m in zip(column, mask)]
+                    masks[i] = None
+                column.extend(values)
+        if numpy:
+            import numpy as np
+            for i, column in enumerate(columns):
+                if masks[i] is not None:
+                    columns[i] = np.frombuffer(column, dtype=np.int64 if column.typecode == 'q' else np.float64)
+                    masks[i] = np.frombuffer(masks[i], dtype=np.bool_)
+        return cls(keys, columns, masks)
+
+
+class _ConnectionState(object):
+    # SqlClient的连接状态(connection, connected, _autocommit, temp_autocommit); 连接池模式下每个线程各自一份
+    # checked_out: 本线程是否占用连接池的槽位; created: 连接创建时间; depth: _pool_session嵌套层数
+    # retrying: 是否处于retrying_transaction中(此时try_execute出错即raise, 不单独重试语句)
+
+    def __init__(self, autocommit: bool = True):
+        self.connection = None
+        self.connected = False
+        self.autocommit = autocommit
+        self.temp_autocommit = None
+        self.checked_out = False
+        self.created = None
+        self.depth = 0
+        self.retrying = False
+
+
+class _ThreadConnectionState(_ConnectionState, threading.local):
+    pass
+
+
+class ConnectionPool(object):
+    # SqlClient连接池模式(pool_size)使用的有界连接池, 后进先出: 最近归还的连接优先复用, 多余的连接空闲老化后被回收
+    # 每个槽位为None(尚未创建连接)或(connection, 创建时间, 归还时间, autocommit)
+    # timeout: 取连接的最长等待秒数, 为None时一直等待
+    # max_lifetime: 连接最长使用秒数; max_idle: 连接最长空闲秒数; 超出的连接在取出时关闭, 由取出者重建
+
+    def __init__(self, size: int, timeout: Union[int, float, None] = 30,
+                 max_lifetime: Union[int, float, None] = None, max_idle: Union[int, float, None] = None):
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self._slots = queue.LifoQueue(size)
+        for _ in range(size):
+            self._slots.put(None)
+
+    def get(self) -> Optional[tuple]:
+        # 超时raise queue.Empty
+        entry = self._slots.get(timeout=self.timeout)
+        if entry is not None:
+            now = time.time()
+            if (self.max_lifetime is not None and now - entry[1] > self.max_lifetime or
+                    self.max_idle is not None and now - entry[2] > self.max_idle):
+                self._close(entry[0])
+                return None
+        return entry
+
+    def put(self, entry: Optional[tuple]) -> None:
+        self._slots.put_nowait(entry)
+
+    def clear(self) -> None:
+        # 关闭所有空闲连接(使用中的连接不受影响)
+        entries = []
+        while True:
+            try:
+                entries.append(self._slots.get_nowait())
+            except queue.Empty:
+                break
+        for entry in entries:
+            if entry is not None:
+                self._close(entry[0])
+            self._slots.put_nowait(None)
+
+    def info(self) -> dict:
+        idle = sum(entry is not None for entry in tuple(self._slots.queue))
+        free = self._slots.qsize()
+        return {'size': self.size, 'in_use': self.size - free, 'idle': idle}
+
+    @staticmethod
+    def _close(connection: Any) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+class _PoolLease(object):
+    # 连接池模式下query返回生成器或保留cursor时, 本线程的连接移交给返回值, 由返回值归还:
+    # count个生成器均耗尽/关闭, 或cursor关闭后归还; 返回值未使用即被回收时由weakref.finalize归还(只归还一次)
+
+    def __init__(self, pool: ConnectionPool, entry: Optional[tuple], count: int = 1):
+        self._count = count
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, pool.put, entry)
+
+    def release(self) -> None:
+        with self._lock:
+            self._count -= 1
+            if self._count > 0:
+                return
+        self._finalizer()
+
+    def generator(self, generator: Generator) -> Generator:
+        try:
+            yield from generator
+        finally:
+            self.release()
+
+
+class _LeasedCursor(object):
+    # query(keep_cursor=True)在连接池模式下返回的cursor: 关闭时归还连接, 其余属性同原cursor
+
+    def __init__(self, cursor: Any, lease: _PoolLease):
+        self._cursor = cursor
+        self._lease = lease
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self) -> None:
+        try:
+            self._cursor.close()
+        finally:
+            self._lease.release()
+
+
+class CircuitOpenError(Exception):
+    # RetryPolicy熔断期间try_connect, try_execute不再连接数据库, 直接raise本异常
+    pass
+
+
+def error_code(e: BaseException) -> Union[int, str, None]:
+    # 驱动异常的错误码: mysql, sqlserver为args[0], postgresql为SQLSTATE(pgcode), oracle为ORA-xxxxx的数字(args[0].code),
+    # sqlite为sqlite_errorcode; sqlalchemy异常取其orig
+    e = getattr(e, 'orig', None) or e
+    code = getattr(e, 'pgcode', None)
+    if code is None:
+        code = getattr(e, 'sqlite_errorcode', None)
+    if code is None and e.args:
+        code = getattr(e.args[0], 'code', e.args[0])
+        if not isinstance(code, int) or isinstance(code, bool):
+            return None
+    return code
+
+
+class RetryPolicy(object):
+    # try_connect, try_execute的重试策略(SqlClient的retry_policy参数), 可被多个SqlClient和线程共用
+    # 按错误码(error_code)将lib.InterfaceError, lib.OperationalError分为:
+    #   deadlock: 死锁/锁等待超时, 第一次立即重试, 之后退避(事务中或传入cursor时不重试, 同disconnect)
+    #   disconnect: 连接断开, 关闭连接后退避重试(事务中或传入cursor时不重试, 整个事务的重试见retrying_transaction)
+    #   fatal: 语法错误, 表/字段不存在, 认证失败等, 不重试
+    #   retry: 其余错误, 退避重试
+    # 退避为full jitter: 第n次重试前等待random.uniform(0, min(cap, base * 2 ** (n - 1)))秒
+    # 重试次数仍由try_times_connect限制; max_elapsed: 自第一次执行起的最长重试秒数, 为None时不限
+    # error_codes: {错误码: 分类}, 覆盖_error_codes中的默认分类; postgresql的SQLSTATE也可只写前两位(类别)
+    # breaker_threshold: 连续breaker_threshold次连接失败(disconnect或try_connect失败)后熔断, breaker_reset秒内直接raise
+    #                    CircuitOpenError, 之后只放行一次尝试(半开, 其余调用仍raise), 成功则恢复, 失败则再次熔断;
+    #                    该尝试breaker_reset秒内未报告成功或失败时再放行一次; 为None时不熔断
+    DEADLOCK = 'deadlock'
+    DISCONNECT = 'disconnect'
+    FATAL = 'fatal'
+    RETRY = 'retry'
+    _error_codes = {
+        'mysql': {1205: DEADLOCK, 1213: DEADLOCK,
+                  2003: DISCONNECT, 2006: DISCONNECT, 2013: DISCONNECT, 2055: DISCONNECT, 4031: DISCONNECT,
+                  1045: FATAL, 1049: FATAL, 1054: FATAL, 1064: FATAL, 1146: FATAL},
+        'postgresql': {'40001': DEADLOCK, '40P01': DEADLOCK, '55P03': DEADLOCK,
+                       '08': DISCONNECT, '57P01': DISCONNECT, '57P02': DISCONNECT, '57P03': DISCONNECT,
+                       '28000': FATAL, '28P01': FATAL, '3D000': FATAL, '42601': FATAL, '42703': FATAL,
+                       '42P01': FATAL},
+        'mssql': {1205: DEADLOCK, 1222: DEADLOCK,
+                  10054: DISCONNECT, 20006: DISCONNECT, 20009: DISCONNECT, 20047: DISCONNECT,
+                  102: FATAL, 156: FATAL, 207: FATAL, 208: FATAL, 18456: FATAL},
+        'oracle': {54: DEADLOCK, 60: DEADLOCK, 8177: DEADLOCK, 30006: DEADLOCK,
+                   28: DISCONNECT, 3113: DISCONNECT, 3114: DISCONNECT, 3135: DISCONNECT, 12514: DISCONNECT,
+                   12541: DISCONNECT,
+                   900: FATAL, 904: FATAL, 942: FATAL, 1017: FATAL},
+        'sqlite': {5: DEADLOCK, 6: DEADLOCK, 261: DEADLOCK, 517: DEADLOCK, 1: FATAL}
+    }
+
+    def __init__(self, base: Union[int, float] = 0.5, cap: Union[int, float] = 30,
+                 max_elapsed: Union[int, float, None] = None, error_codes: Optional[dict] = None,
+                 breaker_threshold: Optional[int] = None, breaker_reset: Union[int, float] = 30):
+        self.base = base
+        self.cap = cap
+        self.max_elapsed = max_elapsed
+        self.error_codes = error_codes or {}
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    def classify(self, client: 'SqlClient', e: BaseException) -> str:
+        code = error_code(e)
+        if code is not None:
+            for codes in (self.error_codes, self._error_codes.get(client.dialect, {})):
+                kind = codes.get(code) or isinstance(code, str) and codes.get(code[:2])
+                if kind:
+                    return kind
+        interface_error = getattr(client.lib, 'InterfaceError', None)
+        if interface_error is not None and isinstance(e, interface_error):
+            return self.DISCONNECT
+        return self.RETRY
+
+    def backoff(self, attempt: int) -> float:
+        return round(random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1))), 3)
+
+    def next_delay(self, client: 'SqlClient', e: BaseException, attempt: int, started: float,
+                   tries: Union[int, float, None] = None, connecting: bool = False) -> Tuple[str, Optional[float]]:
+        # attempt: 已失败次数; started: 第一次执行时的time.monotonic(); connecting: 是否为try_connect
+        # return (分类, 重试前等待秒数), 不再重试时等待秒数为None
+        kind = self.classify(client, e)
+        if connecting and kind != self.FATAL:
+            kind = self.DISCONNECT
+        if kind == self.DISCONNECT:
+            self.failure()
+        if kind == self.FATAL or tries and attempt >= tries:
+            return kind, None
+        delay = 0 if kind == self.DEADLOCK and attempt == 1 else self.backoff(attempt)
+        if self.max_elapsed is not None and time.monotonic() + delay - started > self.max_elapsed:
+            return kind, None
+        return kind, delay
+
+    def check(self) -> None:
+        # 熔断中raise CircuitOpenError; 超过breaker_reset秒后只放行一次尝试(半开), 其结果报告前其余调用仍raise
+        if self._opened_at is None and self._probe_at is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._opened_at is not None:
+                if now - self._opened_at < self.breaker_reset:
+                    raise CircuitOpenError('circuit breaker open after {} consecutive connection errors'.format(
+                        self._failures))
+                self._opened_at = None
+                self._failures = self.breaker_threshold - 1
+            elif self._probe_at is None:
+                return
+            elif now - self._probe_at < self.breaker_reset:
+                raise CircuitOpenError('circuit breaker half-open, waiting for the probe after {} consecutive '
+                                       'connection errors'.format(self._failures + 1))
+            self._probe_at = now
+
+    def failure(self) -> None:
+        if self.breaker_threshold is None:
+            return
+        with self._lock:
+            self._failures += 1
+            self._probe_at = None
+            if self._failures >= self.breaker_threshold:
+                self._opened_at = time.monotonic()
+
+    def success(self) -> None:
+        if self._failures or self._probe_at is not None:
+            with self._lock:
+                self._failures = 0
+                self._opened_at = None
+                self._probe_at = None
+
+
+_fingerprint_patterns = ((re.compile(r"'(?:[^']|'')*'"), '?'),
+                         (re.compile(r'%\([\w$]+\)s|%s|(?<![:\w$]):(?:[a-zA-Z_$][\w$]*|\d+)|\?'), '?'),
+                         (re.compile(r'(?<![\w$.])\d+(?:\.\d*)?(?:e[+-]?\d+)?(?![\w$])', re.I), '?'),
+                         (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?)'),
+                         (re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+'), '(?)'),
+                         (re.compile(r'\s+'), ' '))
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(query: str) -> str:
+    # 语句指纹: 字符串与数字字面量, 各paramstyle的参数标记替换为?, IN列表与多行VALUES合并为(?), 连续空白合并为一个空格
+    for pattern, repl in _fingerprint_patterns:
+        query = pattern.sub(repl, query)
+    return query.strip()
+
+
+_default_buckets = tuple(1e-6 * 2 ** i for i in range(27))
+
+
+def _bucket_percentile(buckets: Sequence[float], counts: Sequence[int], total_count: int, max_value: float,
+                       q: float) -> float:
+    # 由直方图估计第q(0~100)百分位: 所在桶的上界(不超过最大值)
+    rank = total_count * q / 100
+    total = 0
+    for bound, count in zip(buckets, counts):
+        total += count
+        if total >= rank and total:
+            return min(bound, max_value)
+    return max_value
+
+
+class Instrumentation(object):
+    # SqlClient的instrumentation参数: 各阶段耗时的回调接口, 子类覆盖record; instrumentation为None(默认)时不计时
+    # phase: paramstyle(检测与改写), standardize(standardize_args), connect(set_connection, 含连接池取连接),
+    #        execute(服务器执行, 含commit), fetch(取结果), convert(RecordCollection/dict/dataset转换),
+    #        retry(语句出错后重试前的等待), reconnect(连接出错后重试前的等待)
+    # fingerprint: 语句指纹(见fingerprint), connect, reconnect为None; elapsed: 秒
+    # rows: standardize为记录数, execute为影响行数(cursor.rowcount), fetch, convert为返回行数; nbytes: execute为语句长度
+    PHASES = ('paramstyle', 'standardize', 'connect', 'execute', 'fetch', 'convert', 'retry', 'reconnect')
+
+    def record(self, phase: str, fingerprint: Optional[str], elapsed: float, rows: Optional[int] = None,
+               nbytes: Optional[int] = None) -> None:
+        pass
+
+    def record_statement(self, client: 'SqlClient', query: str, args: Any, cursor: Any, elapsed: float,
+                         rows: Optional[int] = None, retries: int = 0, error: Optional[BaseException] = None) -> None:
+        # try_execute每条语句结束(成功或最终失败)时调用: query为paramstyle改写后的语句, elapsed含重试等待,
+        # rows为返回行数(fetchall=False时为影响行数或执行语句数), retries为重试次数, error为最终失败的异常
+        pass
+
+
+class HistogramInstrumentation(Instrumentation):
+    # 进程内聚合: 按(fingerprint, phase)累计次数, 总耗时, 最大耗时, 行数, 字节数及耗时直方图
+    # buckets: 直方图各桶的耗时上界(秒), 默认1微秒起按2倍递增(最后一桶约67秒), 超出的计入最后一桶
+    # max_statements: 最多记录的指纹数, 超出后新指纹计入'<other>'
+
+    def __init__(self, buckets: Optional[Sequence[float]] = None, max_statements: int = 1000):
+        self.buckets = tuple(buckets) if buckets is not None else _default_buckets
+        self.max_statements = max_statements
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, fingerprint: Optional[str], elapsed: float, rows: Optional[int] = None,
+               nbytes: Optional[int] = None) -> None:
+        index = min(bisect.bisect_left(self.buckets, elapsed), len(self.buckets) - 1)
+        with self._lock:
+            phases = self._stats.get(fingerprint)
+            if phases is None:
+                if len(self._stats) >= self.max_statements:
+                    fingerprint = '<other>'
+                phases = self._stats.setdefault(fingerprint, {})
+            stat = phases.get(phase)
+            if stat is None:
+                stat = phases[phase] = {'count': 0, 'total': 0.0, 'max': 0.0, 'rows': 0, 'bytes': 0,
+                                        'buckets': [0] * len(self.buckets)}
+            stat['count'] += 1
+            stat['total'] += elapsed
+            if elapsed > stat['max']:
+                stat['max'] = elapsed
+            if rows is not None and rows > 0:
+                stat['rows'] += rows
+            if nbytes is not None:
+                stat['bytes'] += nbytes
+            stat['buckets'][index] += 1
+
+    def snapshot(self) -> dict:
+        # return {fingerprint: {phase: {'count', 'total', 'max', 'rows', 'bytes', 'buckets'}}}的副本
+        with self._lock:
+            return {fingerprint: {phase: dict(stat, buckets=list(stat['buckets'])) for phase, stat in phases.items()}
+                    for fingerprint, phases in self._stats.items()}
+
+    def percentile(self, fingerprint: Optional[str], phase: str, q: float) -> Optional[float]:
+        # 第q(0~100)百分位耗时, 以所在桶的上界估计; 无记录时return None
+        with self._lock:
+            stat = self._stats.get(fingerprint, {}).get(phase)
+            if stat is None:
+                return None
+            return _bucket_percentile(self.buckets, stat['buckets'], stat['count'], stat['max'], q)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class StatementStats(Instrumentation):
+    # pg_stat_statements式的语句统计, 作为SqlClient的instrumentation使用: 按fingerprint(paramstyle改写后的语句指纹)记录
+    # 调用次数, 总/平均/最大耗时, p95/p99耗时(按直方图估计), 返回或影响的行数, 重试次数与出错次数; 耗时含重试等待
+    # max_statements: 最多保留的指纹数, 超出时淘汰总耗时最少的十分之一(保留耗时最多的语句), evicted为累计淘汰数
+    # slow_threshold: 耗时不少于该秒数的语句以SqlClient的logger.warning记录格式化后的语句, 为None时不记录
+    # buckets: 同HistogramInstrumentation
+
+    def __init__(self, max_statements: int = 1000, slow_threshold: Union[int, float, None] = None,
+                 buckets: Optional[Sequence[float]] = None):
+        self.max_statements = max_statements
+        self.slow_threshold = slow_threshold
+        self.buckets = tuple(buckets) if buckets is not None else _default_buckets
+        self.evicted = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record_statement(self, client: 'SqlClient', query: str, args: Any, cursor: Any, elapsed: float,
+                         rows: Optional[int] = None, retries: int = 0, error: Optional[BaseException] = None) -> None:
+        key = fingerprint(query)
+        index = min(bisect.bisect_left(self.buckets, elapsed), len(self.buckets) - 1)
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                if len(self._stats) >= self.max_statements:
+                    self._evict()
+                stat = self._stats[key] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0, 'retries': 0,
+                                           'errors': 0, 'buckets': [0] * len(self.buckets)}
+            stat['calls'] += 1
+            stat['total'] += elapsed
+            if elapsed > stat['max']:
+                stat['max'] = elapsed
+            if rows is not None and rows > 0:
+                stat['rows'] += rows
+            stat['retries'] += retries
+            if error is not None:
+                stat['errors'] += 1
+            stat['buckets'][index] += 1
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold and client.log:
+            client.logger.warning('slow query({:.3f}s): {}'.format(elapsed,
+                                                                  client._query_log_text(query, args, cursor)))
+
+    def _evict(self) -> None:
+        count = max(len(self._stats) // 10, 1)
+        for key in heapq.nsmallest(count, self._stats, key=lambda key: self._stats[key]['total']):
+            del self._stats[key]
+        self.evicted += count
+
+    def _entry(self, key: str, stat: dict) -> dict:
+        return {'fingerprint': key, 'calls': stat['calls'], 'total': stat['total'],
+                'mean': stat['total'] / stat['calls'], 'max': stat['max'],
+                'p95': _bucket_percentile(self.buckets, stat['buckets'], stat['calls'], stat['max'], 95),
+                'p99': _bucket_percentile(self.buckets, stat['buckets'], stat['calls'], stat['max'], 99),
+                'rows': stat['rows'], 'retries': stat['retries'], 'errors': stat['errors']}
+
+    def get(self, query: str) -> Optional[dict]:
+        # query: 语句或其指纹
+        with self._lock:
+            key = fingerprint(query)
+            stat = self._stats.get(key)
+            return None if stat is None else self._entry(key, stat)
+
+    def top(self, n: Optional[int] = 10, key: str = 'total') -> list:
+        # 按key('calls', 'total', 'mean', 'max', 'p95', 'p99', 'rows', 'retries', 'errors')降序的前n条, n为None时返回全部
+        with self._lock:
+            entries = [self._entry(fingerprint, stat) for fingerprint, stat in self._stats.items()]
+        entries.sort(key=lambda entry: entry[key], reverse=True)
+        return entries if n is None else entries[:n]
+
+    def dump(self, path: Optional[str] = None, key: str = 'total') -> str:
+        # 全部统计(按key降序)的JSON文本, 传入path时同时写入文件
+        text = json.dumps(self.top(None, key), ensure_ascii=False, indent=2)
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self.evicted = 0
+
+
 class SqlClient(object):
     lib = None
     _pattern = {Paramstyle.pyformat: re.compile(r'(?<![%\\])%\(([\w$]+)\)s'),
@@ -47,11 +661,34 @@ class SqlClient(object):
                     Paramstyle.named: r':{}',
                     Paramstyle.numeric: r':{}',
                     Paramstyle.qmark: None}
+    dialect = None
+    # save_data(batch_mode='values')每条语句的上限: (最大记录数, 最大参数数, 最大估算字节数), None表示不支持多行VALUES
+    _values_batch_limits = {None: (1000, 999, 1024000),
+                            'mysql': (None, 65535, 1024000),
+                            'postgresql': (None, 65535, 4096000),
+                            'mssql': (1000, 2000, 1024000),
+                            'sqlite': (None, 999, 1024000),
+                            'oracle': None}
+    # end_try, select_to_try的update一句按key_fields定位记录时每条语句的上限: (最大记录数, 最大参数数),
+    # 以及复合key能否使用(k1,k2) IN ((..),(..)) (否则以OR连接)
+    _key_predicate_limits = {None: (1000, 999, False),
+                             'mysql': (10000, 65535, True),
+                             'postgresql': (10000, 32767, True),
+                             'mssql': (1000, 2000, False),
+                             'sqlite': (None, 999, True),
+                             'oracle': (1000, 65535, True)}
+    # retrying_transaction重新执行整个事务的错误码(死锁, 序列化失败, 锁等待超时), 见error_code
+    _transaction_retry_codes = {'mysql': {1205, 1213},
+                                'postgresql': {'40001', '40P01'},
+                                'mssql': {1205},
+                                'oracle': {60, 8177},
+                                'sqlite': {5, 6, 517}}
 
     # lib模块的以下属性被下列方法使用：
     # lib.ProgrammingError: close
     # lib.InterfaceError, lib.OperationalError: ping, try_connect, try_execute, call_proc
     # lib.cursors.DictCursor: query, call_proc
+    # lib.cursors.SSCursor, lib.cursors.SSDictCursor: query(stream=True)
     # lib.connect: connect
 
     def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = None, user: Optional[str] = None,
@@ -61,7 +698,22 @@ class SqlClient(object):
                  escape_formatter: str = '{}', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
                  to_paramstyle: Optional[Paramstyle] = Paramstyle.format, try_reconnect: bool = True,
                  try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
-                 raise_error: bool = False, exc_info: Optional[bool] = None):
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 pool_size: Optional[int] = None, pool_timeout: Union[int, float, None] = 30,
+                 pool_max_lifetime: Union[int, float, None] = None, pool_max_idle: Union[int, float, None] = None,
+                 retry_policy: Optional[RetryPolicy] = None, instrumentation: Optional[Instrumentation] = None):
+        # query_cache_size: query方法预处理计划(paramstyle检测与改写)的LRU缓存大小, 为0或None时不缓存
+        # pool_size: 不为None时开启连接池模式(见ConnectionPool), 同一对象可供多个线程同时使用:
+        #            每个线程各自持有connection, autocommit, 事务状态; query, save_data调用期间从连接池取出连接, 结束后归还,
+        #            事务中(begin至commit/rollback, 含transaction和select_to_try)连接固定于本线程;
+        #            autocommit=False时连接在commit/rollback后归还; 取出已有连接时以ping做健康检查
+        # pool_timeout: 等待空闲连接的最长秒数, 超时raise lib.OperationalError
+        # pool_max_lifetime, pool_max_idle: 连接最长使用/空闲秒数, 超出后关闭并重建
+        # retry_policy: try_connect, try_execute的重试策略(见RetryPolicy), 为None时固定间隔time_sleep_connect秒重试
+        # instrumentation: query各阶段的计时回调(见Instrumentation), 为None时不计时
+        self.pool = ConnectionPool(pool_size, pool_timeout, pool_max_lifetime,
+                                   pool_max_idle) if pool_size else None
+        self._local = _ThreadConnectionState(autocommit) if pool_size else _ConnectionState(autocommit)
         if host is None:
             host = os.environ.get('DB_HOST')
         if port is None:
@@ -101,6 +753,9 @@ class SqlClient(object):
         self.time_sleep_connect = time_sleep_connect
         self.raise_error = raise_error
         self.exc_info = exc_info
+        self.query_cache = QueryCache(query_cache_size)
+        self.retry_policy = retry_policy
+        self.instrumentation = instrumentation
         self.connected = False
         self.connection = None
         if connect_now:
@@ -111,6 +766,40 @@ class SqlClient(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
+        if self.pool is not None:
+            self.pool.clear()
+
+    @property
+    def connection(self) -> Any:
+        return self._local.connection
+
+    @connection.setter
+    def connection(self, value: Any):
+        self._local.connection = value
+
+    @property
+    def connected(self) -> bool:
+        return self._local.connected
+
+    @connected.setter
+    def connected(self, value: bool):
+        self._local.connected = value
+
+    @property
+    def _autocommit(self) -> bool:
+        return self._local.autocommit
+
+    @_autocommit.setter
+    def _autocommit(self, value: bool):
+        self._local.autocommit = value
+
+    @property
+    def temp_autocommit(self) -> Optional[bool]:
+        return self._local.temp_autocommit
+
+    @temp_autocommit.setter
+    def temp_autocommit(self, value: Optional[bool]):
+        self._local.temp_autocommit = value
 
     def query(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
               chunksize: Optional[int] = None, not_one_by_one: bool = True, auto_format: bool = False,
@@ -120,9 +809,11 @@ class SqlClient(object):
               to_paramstyle: Union[Paramstyle, Notset, None] = NOTSET, keep_cursor: Optional[bool] = False,
               cursor: Any = None, try_times_connect: Union[int, float, None] = None,
               time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
-              exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None
-              ) -> Union[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], Generator],
-                         Tuple[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], Generator], Any]]:
+              exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None, stream: bool = False,
+              columnar: Union[bool, str] = False
+              ) -> Union[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], Generator, ColumnTable],
+                         Tuple[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], Generator, ColumnTable],
+                               Any]]:
         # args 支持单条记录: list/tuple/dict, 或多条记录: list/tuple/set[list/tuple/dict]
         # auto_format=True: 注意此时query会被format一次; args_to_dict视为False;
         #                   首条记录需为dict(not_one_by_one=False时所有记录均需为dict), 或者含除自增字段外所有字段并按顺序排好各字段值, 或者自行传入keys
@@ -130,13 +821,46 @@ class SqlClient(object):
         # args_to_dict=None: 不做dict和list之间转换; args_to_dict=False: dict强制转为list; args_to_dict=NOTSET: 读取默认配置
         # keep_cursor: 返回(result, cursor), 并且不自动关闭cursor;
         #              如果args为多条记录且not_one_by_one=False且设置了chunksize且fetchall=True(仅此情况会使用多个cursor), 则只会保留最后一个cursor
+        # stream=True: 设置了chunksize且fetchall=True且只执行一次时, 使用服务器端cursor逐块获取结果, 内存占用不随结果集大小增长
+        #              (mysql: 结果读完或cursor关闭前该连接不能执行其它语句)
+        # columnar=True: fetchall=True时返回按列存储的ColumnTable, 按chunksize(默认10000)分块fetchmany填充列缓冲区, 不再返回生成器;
+        #                columnar='numpy': 数值列转为numpy数组; dictionary视为False
+        # args为Generator等迭代器(多条记录)且fetchall=False时: 按chunksize(默认10000)条分块执行, 内存占用不随记录数增长,
+        #                                                     return各块累计的执行语句数; 出错重试只重试当前块
+        if self.pool is not None and not self._local.depth:
+            keep = keep_cursor or fetchall and chunksize is not None
+            with self._pool_session(keep):
+                result = self.query(query, args, fetchall, dictionary, chunksize, not_one_by_one, auto_format, keys,
+                                    commit, escape_auto_format, escape_formatter, empty_string_to_none, args_to_dict,
+                                    to_paramstyle, keep_cursor, cursor, try_times_connect, time_sleep_connect,
+                                    raise_error, exc_info, call, stream, columnar)
+                if keep:
+                    result = self._lease_connection(result, keep_cursor)
+            return result
+        if args is not None and not hasattr(args, '__getitem__') and hasattr(args, '__iter__'):  # set, Generator, range
+            args, rows = self._peek_rows(args)
+            if rows is not None and (fetchall or keep_cursor):
+                args = tuple(rows)
+            elif rows is not None:
+                count = 0
+                for chunk in iter(lambda: tuple(itertools.islice(rows, chunksize or 10000)), ()):
+                    if auto_format and keys is None and isinstance(chunk[0], dict):
+                        keys = tuple(chunk[0])  # 由首条记录确定keys, 各块一致
+                    count += self.query(query, chunk, False, dictionary, chunksize, not_one_by_one, auto_format, keys,
+                                        commit, escape_auto_format, escape_formatter, empty_string_to_none,
+                                        args_to_dict, to_paramstyle, False, cursor, try_times_connect,
+                                        time_sleep_connect, raise_error, exc_info, call)
+                return count
         if cursor is not None:
             self.set_connection()
+        if columnar:
+            dictionary = False
         if call is None:
-            call = functools.partial(self.try_execute, call=None)
-        if args and not hasattr(args, '__getitem__') and hasattr(args, '__iter__'):  # set, Generator, range
-            args = tuple(args)
+            call = functools.partial(self.try_execute, call=functools.partial(
+                self._execute_columnar, numpy=columnar == 'numpy') if columnar else None)
         if args is None or hasattr(args, '__len__') and not isinstance(args, str) and not args:
+            if stream and cursor is None and fetchall and chunksize is not None:
+                cursor = self._before_query_and_get_stream_cursor(fetchall, dictionary, chunksize)
             return call(query, args, fetchall, dictionary, chunksize, False, commit, keep_cursor, cursor,
                         try_times_connect, time_sleep_connect, raise_error, exc_info)
         if escape_auto_format is None:
@@ -147,60 +871,42 @@ class SqlClient(object):
             to_paramstyle = self.to_paramstyle
         if to_paramstyle is not None:
             args_to_dict = to_paramstyle in (Paramstyle.pyformat, Paramstyle.named)
-        from_paramstyle = self.judge_paramstyle(query, to_paramstyle)
-        if keys is None:
-            if args_to_dict is False:
-                if from_paramstyle in (Paramstyle.pyformat, Paramstyle.named, Paramstyle.numeric):
-                    keys = self._pattern[from_paramstyle].findall(query)
-            elif to_paramstyle in (Paramstyle.pyformat, Paramstyle.named) and from_paramstyle == Paramstyle.numeric:
-                keys = self._pattern[from_paramstyle].findall(query)
-        elif isinstance(keys, str):
+        if isinstance(keys, str):
             keys = tuple(key.strip() for key in keys.split(','))
-        nums = None
-        if to_paramstyle in (Paramstyle.format, Paramstyle.qmark) and from_paramstyle == Paramstyle.numeric:
-            nums = list(map(int, self._pattern[from_paramstyle].findall(query)))
-            if nums == sorted(nums):
-                nums = None
+        elif keys is not None and not isinstance(keys, tuple):
+            keys = tuple(keys)
+        timing = self.instrumentation is not None
+        if timing:
+            started = time.perf_counter()
+        from_paramstyle, keys, nums, query = self._prepare_query(query, to_paramstyle, args_to_dict, keys)
+        if timing:
+            started = self._instrument('paramstyle', query, started)
         args, keys, is_multiple, is_key_generated = self.standardize_args(args, None, empty_string_to_none,
                                                                           args_to_dict, True, keys, nums)
-        if from_paramstyle is None:
-            for pattern in self._pattern_esc.values():
-                query = pattern.sub(r'\1', query)
-        else:
-            query = self.transform_paramstyle(query, to_paramstyle, from_paramstyle)
+        if timing:
+            self._instrument('standardize', query, started, len(args) if is_multiple else 1)
+        if auto_format and escape_formatter is None:
+            escape_formatter = self.escape_formatter
         if not is_multiple or not_one_by_one:  # 执行一次
+            if stream and cursor is None and fetchall and chunksize is not None:
+                cursor = self._before_query_and_get_stream_cursor(fetchall, dictionary, chunksize)
             if auto_format:
-                if escape_formatter is None:
-                    escape_formatter = self.escape_formatter
-                if keys is None:
-                    arg = args[0] if is_multiple else args
-                    query = query.format('({})'.format(','.join(map(escape_formatter.format if escape_auto_format else
-                                                                    str, arg)))
-                                         if isinstance(arg, dict) and not is_key_generated else '',
-                                         ','.join(self.paramstyle_formatter(arg, to_paramstyle)))
-                else:
-                    query = query.format('({})'.format(','.join(map(escape_formatter.format, keys)
-                                                                if escape_auto_format else keys)),
-                                         ','.join(self.paramstyle_formatter(keys, to_paramstyle)))
+                query = self._format_auto_query(query, (args[0] if is_multiple else args) if keys is None else None,
+                                                keys, is_key_generated, to_paramstyle, escape_auto_format,
+                                                escape_formatter)
             return call(query, args, fetchall, dictionary, chunksize, is_multiple, commit, keep_cursor, cursor,
                         try_times_connect, time_sleep_connect, raise_error, exc_info)
         # 依次执行
         ori_query = query
         result = [] if fetchall else 0
-        if auto_format:
-            if escape_formatter is None:
-                escape_formatter = self.escape_formatter
-            if keys is not None:
-                query = query.format('({})'.format(','.join(map(escape_formatter.format, keys)
-                                                            if escape_auto_format else keys)),
-                                     ','.join(self.paramstyle_formatter(keys, to_paramstyle)))
+        if auto_format and keys is not None:
+            query = self._format_auto_query(query, None, keys, is_key_generated, to_paramstyle, escape_auto_format,
+                                            escape_formatter)
         cursor = self._before_query_and_get_cursor(fetchall, dictionary) if chunksize is None or not fetchall else None
         for arg in args:
             if auto_format and keys is None:
-                query = ori_query.format('({})'.format(','.join(map(escape_formatter.format if escape_auto_format else
-                                                                    str, arg)))
-                                         if isinstance(arg, dict) and not is_key_generated else '',
-                                         ','.join(self.paramstyle_formatter(arg, to_paramstyle)))
+                query = self._format_auto_query(ori_query, arg, None, is_key_generated, to_paramstyle,
+                                                escape_auto_format, escape_formatter)
             temp_result = call(query, arg, fetchall, dictionary, chunksize, not_one_by_one, commit, keep_cursor, cursor,
                                try_times_connect, time_sleep_connect, raise_error, exc_info)
             if keep_cursor:
@@ -223,20 +929,204 @@ class SqlClient(object):
                   escape_auto_format: Optional[bool] = None, escape_formatter: Optional[str] = None,
                   empty_string_to_none: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
                   time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
-                  exc_info: Union[bool, Notset, None] = NOTSET) -> Union[int, tuple, list]:
+                  exc_info: Union[bool, Notset, None] = NOTSET, batch_mode: Optional[str] = None,
+                  method: Optional[str] = None, chunksize: int = 10000) -> Union[int, tuple, list]:
         # data_list 支持单条记录: list/tuple/dict, 或多条记录: list/tuple/set[list/tuple/dict]
         # 首条记录需为dict(one_by_one=True时所有记录均需为dict), 或者含除自增字段外所有字段并按顺序排好各字段值, 或者自行传入keys
         # 默认not_one_by_one=False: 为了部分记录无法插入时能够单独跳过这些记录(有log)
         # fetchall=False: return成功执行语句数(executemany模式即not_one_by_one=True时按数据条数)
+        # batch_mode='values': 忽略not_one_by_one, 将多条记录拼成INSERT ... VALUES (...),(...)分块执行(按_values_batch_limits),
+        #                      某块出错时二分拆分以定位并跳过出错记录(有log); return成功插入的记录数
+        # method: 各模块特有的批量导入方式(mysql: 'load_data'; postgresql: 'copy'), 不支持的方式raise ValueError
+        # args亦支持Generator等迭代器: 预读首条记录确定keys, 每次只读入chunksize条执行(见query), return累计的记录数
+        if args is not None and not hasattr(args, '__getitem__') and hasattr(args, '__iter__'):  # set, Generator, range
+            args, rows = self._peek_rows(args)
+            if rows is not None:
+                args = rows
         if args is None or hasattr(args, '__len__') and not isinstance(args, str) and not args:
             return 0
+        if self.pool is not None and not self._local.depth:
+            with self._pool_session():
+                return self.save_data(args, table, statement, extra, not_one_by_one, keys, commit, escape_auto_format,
+                                      escape_formatter, empty_string_to_none, try_times_connect, time_sleep_connect,
+                                      raise_error, exc_info, batch_mode, method, chunksize)
+        if method == 'load_data' and self.dialect == 'mysql':
+            return self.load_data(args, table, statement, keys, commit, escape_auto_format, escape_formatter,
+                                  empty_string_to_none, chunksize, try_times_connect=try_times_connect,
+                                  time_sleep_connect=time_sleep_connect, raise_error=raise_error, exc_info=exc_info)
+        if method is not None:
+            raise ValueError(method)
+        if batch_mode == 'values':
+            if self._values_batch_limits.get(self.dialect, self._values_batch_limits[None]) is not None:
+                return self._save_data_values(args, table, statement, extra, keys, commit, escape_auto_format,
+                                              escape_formatter, empty_string_to_none, try_times_connect,
+                                              time_sleep_connect, raise_error, exc_info)
+            not_one_by_one = True  # 不支持多行VALUES的数据库(oracle)退回executemany
+        elif batch_mode is not None:
+            raise ValueError(batch_mode)
         query = '{} {}{{}} VALUES({{}}){}'.format(
             self.statement_save_data if statement is None else statement, self.table if table is None else table,
             ' {}'.format(extra) if extra is not None else '')
-        return self.query(query, args, False, False, None, not_one_by_one, True, keys, commit, escape_auto_format,
+        return self.query(query, args, False, False, chunksize, not_one_by_one, True, keys, commit, escape_auto_format,
                           escape_formatter, empty_string_to_none, False, NOTSET, False, None, try_times_connect,
                           time_sleep_connect, raise_error, exc_info, None)
 
+    def _save_data_values(self, args: Any, table: Optional[str] = None, statement: Optional[str] = None,
+                          extra: Optional[str] = None, keys: Union[str, Collection[str], None] = None,
+                          commit: Optional[bool] = None, escape_auto_format: Optional[bool] = None,
+                          escape_formatter: Optional[str] = None, empty_string_to_none: Optional[bool] = None,
+                          try_times_connect: Union[int, float, None] = None,
+                          time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                          exc_info: Union[bool, Notset, None] = NOTSET) -> int:
+        # save_data的batch_mode='values'模式
+        if escape_auto_format is None:
+            escape_auto_format = self.escape_auto_format
+        if escape_formatter is None:
+            escape_formatter = self.escape_formatter
+        if raise_error is None:
+            raise_error = self.raise_error
+        if isinstance(keys, str):
+            keys = tuple(key.strip() for key in keys.split(','))
+        # 逐条标准化(lazy), Generator等迭代器亦不会一次性读入
+        args, keys = self.standardize_args(args, True, empty_string_to_none, False, False, keys, lazy=True)
+        args = iter(args)
+        first = next(args, None)
+        if first is None:
+            return 0
+        _, _, _, query = self._prepare_query('{} {}{{}} VALUES{{}}{}'.format(
+            self.statement_save_data if statement is None else statement, self.table if table is None else table,
+            ' {}'.format(extra) if extra is not None else ''), self.to_paramstyle, False, None)
+        columns = '({})'.format(','.join(map(escape_formatter.format, keys) if escape_auto_format else keys)
+                                ) if keys is not None else ''
+        width = len(first)
+        max_rows, max_params, max_bytes = self._values_batch_limits.get(self.dialect, self._values_batch_limits[None])
+        max_rows = min(max_rows or max_params, max(max_params // width, 1))
+        count = 0
+        chunk = []
+        chunk_bytes = 0
+        try:
+            for row in itertools.chain((first,), args):
+                row_bytes = sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in row) + 3 * width
+                if chunk and (len(chunk) >= max_rows or chunk_bytes + row_bytes > max_bytes):
+                    count += self._execute_values_chunk(query, columns, chunk, width, commit, try_times_connect,
+                                                        time_sleep_connect, raise_error, exc_info)
+                    chunk = []
+                    chunk_bytes = 0
+                chunk.append(row)
+                chunk_bytes += row_bytes
+            if chunk:
+                count += self._execute_values_chunk(query, columns, chunk, width, commit, try_times_connect,
+                                                    time_sleep_connect, raise_error, exc_info)
+        except Exception as e:
+            # 非记录本身的错误(表不存在, 连接断开等)已由try_execute记录日志, 不再执行后续各块
+            if raise_error:
+                raise e
+        return count
+
+    def _execute_values_chunk(self, query: str, columns: str, chunk: Sequence[Sequence], width: int,
+                              commit: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
+                              time_sleep_connect: Union[int, float, None] = None, raise_error: bool = False,
+                              exc_info: Union[bool, Notset, None] = NOTSET) -> int:
+        # 执行一块多行VALUES语句, return成功插入的记录数
+        # 仅记录本身的错误(IntegrityError, DataError)时二分拆分, 直至定位到单条出错记录并跳过(raise_error时raise);
+        # 其他错误(OperationalError, InterfaceError, ProgrammingError等)直接raise, 由_save_data_values终止并只报告一次
+        to_paramstyle = self.to_paramstyle
+        params = len(chunk) * width
+        placeholders = iter(self.paramstyle_formatter(tuple(map(str, range(1, params + 1))), to_paramstyle))
+        row_placeholder = '({})'.format(','.join(('{}',) * width))
+        values = ','.join(row_placeholder.format(*itertools.islice(placeholders, width)) for _ in chunk)
+        chunk_args = tuple(itertools.chain.from_iterable(chunk))
+        if to_paramstyle in (Paramstyle.pyformat, Paramstyle.named):
+            chunk_args = dict(zip(map(str, range(1, params + 1)), chunk_args))
+        row_errors = tuple(getattr(self.lib, name) for name in ('IntegrityError', 'DataError')
+                           if hasattr(self.lib, name))
+        if exc_info is NOTSET:
+            exc_info = self.exc_info
+        try:
+            self.try_execute(query.format(columns, values), chunk_args, False, None, None, False, commit, False, None,
+                             try_times_connect, time_sleep_connect, True,
+                             (not raise_error if exc_info is None else exc_info) if len(chunk) == 1 else False)
+            return len(chunk)
+        except row_errors as e:
+            if raise_error:
+                raise e
+            if len(chunk) == 1:
+                return 0
+        middle = len(chunk) // 2
+        return (self._execute_values_chunk(query, columns, chunk[:middle], width, commit, try_times_connect,
+                                           time_sleep_connect, raise_error, exc_info) +
+                self._execute_values_chunk(query, columns, chunk[middle:], width, commit, try_times_connect,
+                                           time_sleep_connect, raise_error, exc_info))
+
+    def load_data(self, args: Any, table: Optional[str] = None, statement: Optional[str] = None,
+                  keys: Union[str, Collection[str], None] = None, commit: Optional[bool] = None,
+                  escape_auto_format: Optional[bool] = None, escape_formatter: Optional[str] = None,
+                  empty_string_to_none: Optional[bool] = None, chunksize: int = 10000,
+                  try_times_connect: Union[int, float, None] = None,
+                  time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                  exc_info: Union[bool, Notset, None] = NOTSET) -> int:
+        # mysql: 将数据逐块写入临时文件后以LOAD DATA LOCAL INFILE导入, return影响行数(cursor.rowcount)
+        # 需连接时开启local_infile且服务器开启local_infile
+        # args, table, keys等参数与save_data一致(table中{}需转义为{{}}), args亦支持Generator等迭代器
+        # statement: 含'REPLACE'时为REPLACE, 含'IGNORE'时为IGNORE, 否则按LOAD DATA LOCAL默认行为(遇重复记录跳过)
+        if self.pool is not None and not self._local.depth:
+            with self._pool_session():
+                return self.load_data(args, table, statement, keys, commit, escape_auto_format, escape_formatter,
+                                      empty_string_to_none, chunksize, try_times_connect, time_sleep_connect,
+                                      raise_error, exc_info)
+        if statement is None:
+            statement = self.statement_save_data
+        if escape_auto_format is None:
+            escape_auto_format = self.escape_auto_format
+        if escape_formatter is None:
+            escape_formatter = self.escape_formatter
+        if isinstance(keys, str):
+            keys = tuple(key.strip() for key in keys.split(','))
+        encoding = 'utf-8' if self.charset is None or self.charset.startswith('utf8') else self.charset
+        keys, chunks = self._standardize_args_chunks(args, keys, empty_string_to_none, False, chunksize)
+        f = tempfile.NamedTemporaryFile('wb', suffix='.tsv', delete=False)
+        path = f.name
+        try:  # 写入时出错(如args中的迭代器raise)也需删除临时文件
+            with f:
+                count = 0
+                for chunk in chunks:
+                    f.writelines(b'\t'.join(_load_data_encode(value, encoding) for value in row) + b'\n'
+                                 for row in chunk)
+                    count += len(chunk)
+            if not count:
+                return 0
+            _, _, _, query = self._prepare_query("LOAD DATA LOCAL INFILE {{}}{} INTO TABLE {}{{}}".format(
+                ' REPLACE' if 'REPLACE' in statement.upper() else ' IGNORE' if 'IGNORE' in statement.upper() else '',
+                self.table if table is None else table), self.to_paramstyle, False, None)
+            query = query.format("'{}'".format(path.replace('\\', '\\\\').replace("'", "\\'").replace('%', '%%')),
+                                 " CHARACTER SET {} FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY "
+                                 "'\\n'{}".format('utf8mb4' if encoding == 'utf-8' else self.charset, ' ({})'.format(
+                                     ','.join(map(escape_formatter.format, keys) if escape_auto_format else keys))
+                                 if keys is not None else ''))
+            return self.try_execute(query, (), False, None, None, False, commit, False, None, try_times_connect,
+                                    time_sleep_connect, raise_error, exc_info, self._execute_rowcount)
+        finally:
+            os.remove(path)
+
+    def _execute_rowcount(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
+                          chunksize: Optional[int] = None, many: bool = False, commit: Optional[bool] = None,
+                          keep_cursor: Optional[bool] = False, cursor: Any = None) -> int:
+        # 执行语句并return影响行数(cursor.rowcount), 由try_execute调用
+        ori_cursor = cursor
+        if cursor is None:
+            cursor = self._before_query_and_get_cursor(False, dictionary)
+        if self.instrumentation is not None:
+            started = time.perf_counter()
+        self._execute_statement(cursor, query, args)
+        if commit and not self._autocommit:
+            self.commit()
+        result = cursor.rowcount
+        if self.instrumentation is not None:
+            self._instrument('execute', query, started, result, len(query))
+        if ori_cursor is None:
+            cursor.close()
+        return result
+
     def select_to_try(self, table: Optional[str] = None, num: Union[int, str, None] = 1,
                       key_fields: Union[str, Iterable[str]] = 'id', extra_fields: Union[str, Iterable[str], None] = '',
                       tried_field: Optional[str] = None, tried: Union[int, str, Notset, None] = 'between',
@@ -250,8 +1140,9 @@ class SqlClient(object):
                       update_set: Optional[str] = None, update_where: Optional[str] = None, update_extra: str = '',
                       empty_string_to_none: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
                       time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
-                      exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None
-                      ) -> Union[int, tuple, list]:
+                      exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None,
+                      skip_locked: bool = False, nowait: bool = False, returning: bool = False,
+                      lease_seconds: Union[int, float, None] = None) -> Union[int, tuple, list]:
         # key_fields: update一句where部分使用
         # extra_fields: 不在update一句使用, return结果包含key_fields和extra_fields
         # tried_field, finished_field, next_time_field字段传入与否分别决定相关逻辑启用与否, 默认值None表示不启用
@@ -265,8 +1156,58 @@ class SqlClient(object):
         # select_where: 不为None则替换select一句的where部分(为''时删除where)
         # update_set: 不为None则替换update一句的set部分
         # update_where: 不为None则替换update一句的where部分
+        # skip_locked=True: 跳过已被其它事务锁定的行(FOR UPDATE SKIP LOCKED; sqlserver: READPAST), 多个进程并发领取时互不阻塞
+        # nowait=True: 遇到已被锁定的行时立即报错而不等待(FOR UPDATE NOWAIT); skip_locked, nowait仅lock=True时有效
+        # returning=True: postgresql, sqlserver以单条UPDATE ... RETURNING/OUTPUT语句完成选取和update(一次往返, 不显式开启事务),
+        #                 返回结果中被update的字段为update后的值, 不保证按select_extra排序;
+        #                 其它dialect或传入update_where时仍为begin, select, update, commit四步
+        # lease_seconds: 租约秒数, 不为None时next_time_field设为当前时间+lease_seconds(租约到期时间, 代替next_time_after),
+        #                需传入next_time_field; 租约到期仍未end_try的任务(如进程崩溃)由reclaim_expired回收
+        # 具体步骤见_select_to_try_steps
+        return self._run_steps(self._select_to_try_steps(
+            table, num, key_fields, extra_fields, tried_field, tried, tried_min, tried_max, tried_after, finished_field,
+            finished, next_time_field, next_time, next_time_after, lock, dictionary, autocommit_after, select_where,
+            select_extra, set_extra, update_set, update_where, update_extra, empty_string_to_none, try_times_connect,
+            time_sleep_connect, raise_error, exc_info, call, skip_locked, nowait, returning, lease_seconds))
+
+    def _run_steps(self, steps: Generator[Callable, Any, Any]) -> Any:
+        # 驱动步骤生成器(_select_to_try_steps, _end_try_steps): 生成器依次产出begin, query, commit等无参调用,
+        # 其结果send回生成器, return生成器的返回值 (异步版本以await驱动同一生成器)
+        result = None
+        while True:
+            try:
+                step = steps.send(result)
+            except StopIteration as e:
+                return e.value
+            result = step()
+
+    def _select_to_try_steps(self, table: Optional[str] = None, num: Union[int, str, None] = 1,
+                             key_fields: Union[str, Iterable[str]] = 'id',
+                             extra_fields: Union[str, Iterable[str], None] = '', tried_field: Optional[str] = None,
+                             tried: Union[int, str, Notset, None] = 'between', tried_min: Union[int, str, None] = 1,
+                             tried_max: Union[int, str, None] = 5, tried_after: Union[int, str, Notset, None] = '-',
+                             finished_field: Optional[str] = None, finished: Union[int, str, None] = 0,
+                             next_time_field: Optional[str] = None,
+                             next_time: Union[int, float, str, Notset, None] = None,
+                             next_time_after: Union[int, float, str, Notset, None] = NOTSET, lock: bool = True,
+                             dictionary: Optional[bool] = None, autocommit_after: Optional[bool] = None,
+                             select_where: Optional[str] = None, select_extra: str = '',
+                             set_extra: Optional[str] = '', update_set: Optional[str] = None,
+                             update_where: Optional[str] = None, update_extra: str = '',
+                             empty_string_to_none: Optional[bool] = None,
+                             try_times_connect: Union[int, float, None] = None,
+                             time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                             exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None,
+                             skip_locked: bool = False, nowait: bool = False, returning: bool = False,
+                             lease_seconds: Union[int, float, None] = None
+                             ) -> Generator[Callable, Any, Union[int, tuple, list]]:
+        # select_to_try的步骤生成器, 参数同select_to_try
         if table is None:
             table = self.table
+        if lease_seconds is not None:
+            if not next_time_field:
+                raise ValueError('lease_seconds requires next_time_field')
+            next_time_after = int(time.time() + lease_seconds)
         if isinstance(key_fields, str):
             key_fields_list = [key.strip() for key in key_fields.split(',')]
         else:
@@ -329,19 +1270,78 @@ class SqlClient(object):
                 select_where = ' ' + select_where
             elif not select_where.startswith(' where'):
                 select_where = ' where ' + select_where.lstrip(' ')
-        query = 'select {}{} from {}{}{}{}{}'.format(key_fields, ',' + extra_fields if extra_fields else '', table,
-                                                     select_where, select_extra, ' limit {}'.format(num) if num else '',
-                                                     ' for update' if lock else '')
-        transaction = self.begin()
-        result = self.query(query, args, fetchall=True, dictionary=dictionary, commit=False,
-                            empty_string_to_none=empty_string_to_none, try_times_connect=try_times_connect,
-                            time_sleep_connect=time_sleep_connect, raise_error=raise_error, exc_info=exc_info,
-                            call=call)
+        if returning and update_where is None and self.dialect in ('postgresql', 'mssql'):
+            update_set, update_args = self._select_to_try_update_set(tried_field, tried_after, next_time_field,
+                                                                     next_time_after, set_extra, update_set)
+            query = self._select_to_try_returning_query(
+                key_fields + (',' + extra_fields if extra_fields else ''), key_fields_list, table, select_where,
+                select_extra, num, lock, skip_locked, nowait, update_set, update_extra)
+            # sqlserver的CTE中select在前; postgresql的子查询在set之后
+            result = yield functools.partial(
+                self.query, query, args + update_args if self.dialect == 'mssql' else update_args + args,
+                fetchall=True, dictionary=dictionary, commit=True, empty_string_to_none=empty_string_to_none,
+                try_times_connect=try_times_connect, time_sleep_connect=time_sleep_connect, raise_error=raise_error,
+                exc_info=exc_info, call=call)
+            if autocommit_after is not None:
+                yield functools.partial(setattr, self, 'autocommit', autocommit_after)
+            return result
+        query, fetch_num = self._select_to_try_query(key_fields + (',' + extra_fields if extra_fields else ''), table,
+                                                     select_where, select_extra, num, lock, skip_locked, nowait)
+        transaction = yield self.begin
+        if fetch_num is None:
+            result = yield functools.partial(
+                self.query, query, args, fetchall=True, dictionary=dictionary, commit=False,
+                empty_string_to_none=empty_string_to_none, try_times_connect=try_times_connect,
+                time_sleep_connect=time_sleep_connect, raise_error=raise_error, exc_info=exc_info, call=call)
+        else:  # 只fetch前fetch_num行(加锁也只加在这些行上)
+            result = yield functools.partial(
+                self.query, query, args, fetchall=True, dictionary=dictionary, chunksize=fetch_num, commit=False,
+                empty_string_to_none=empty_string_to_none, keep_cursor=True, try_times_connect=try_times_connect,
+                time_sleep_connect=time_sleep_connect, raise_error=raise_error, exc_info=exc_info, call=call)
+            if result:
+                chunks, cursor = result
+                result = next(chunks, [])
+                cursor.close()
         if not result:
-            self.commit(transaction)
+            yield functools.partial(self.commit, transaction)
             if autocommit_after is not None:
-                self.autocommit = autocommit_after
+                yield functools.partial(setattr, self, 'autocommit', autocommit_after)
             return result
+        update_set, args = self._select_to_try_update_set(tried_field, tried_after, next_time_field, next_time_after,
+                                                          set_extra, update_set)
+        if update_where is None:
+            predicates = self._key_predicates(key_fields_list, result, dictionary)
+        elif update_where.startswith('where'):
+            predicates = ((update_where[5:].lstrip(' '), []),)
+        elif update_where.startswith(' where'):
+            predicates = ((update_where[6:].lstrip(' '), []),)
+        else:
+            predicates = ((update_where, []),)
+        for where, where_args in predicates:
+            is_success = yield functools.partial(
+                self.query, 'update {} set {} where {}{}'.format(table, update_set, where, update_extra),
+                args + where_args, fetchall=False, commit=False, empty_string_to_none=empty_string_to_none,
+                try_times_connect=try_times_connect, time_sleep_connect=time_sleep_connect, raise_error=raise_error,
+                exc_info=exc_info, call=call)
+            if not is_success:
+                break
+        if is_success:
+            yield functools.partial(self.commit, transaction)
+        else:
+            result = ()
+            yield functools.partial(self.rollback, transaction)
+        if autocommit_after is not None:
+            yield functools.partial(setattr, self, 'autocommit', autocommit_after)
+        return result
+
+    @staticmethod
+    def _select_to_try_update_set(tried_field: Optional[str], tried_after: Union[int, str, Notset, None],
+                                  next_time_field: Optional[str],
+                                  next_time_after: Union[int, float, str, Notset, None], set_extra: Optional[str],
+                                  update_set: Optional[str]) -> Tuple[str, list]:
+        # select_to_try的update一句的set部分; return (set部分, 参数)
+        if update_set is not None:
+            return update_set, []
         args = []
         if not tried_field or tried_after is NOTSET:
             update_tried = ''
@@ -369,30 +1369,73 @@ class SqlClient(object):
         else:
             update_next_time = next_time_field + '=%s'
             args.append(next_time_after)
-        if update_where is None:
-            update_where = ' or '.join((' and '.join(map('{}=%s'.format, key_fields_list)),) * len(result))
-            if dictionary:
-                args.extend(row[key] for row in result for key in key_fields_list)
-            else:
-                args.extend(row[i] for row in result for i in range(len(key_fields_list)))
-        elif update_where.startswith('where'):
-            update_where = update_where[5:].lstrip(' ')
-        elif update_where.startswith(' where'):
-            update_where = update_where[6:].lstrip(' ')
-        query = 'update {} set {} where {}{}'.format(table, ','.join(filter(None, (update_tried, update_next_time)))
-                                                            + set_extra if update_set is None else update_set,
-                                                     update_where, update_extra)
-        is_success = self.query(query, args, fetchall=False, commit=False, empty_string_to_none=empty_string_to_none,
-                                try_times_connect=try_times_connect, time_sleep_connect=time_sleep_connect,
-                                raise_error=raise_error, exc_info=exc_info, call=call)
-        if is_success:
-            self.commit(transaction)
+        return ','.join(filter(None, (update_tried, update_next_time))) + set_extra, args
+
+    def _select_to_try_query(self, fields: str, table: str, select_where: str, select_extra: str,
+                             num: Union[int, str, None], lock: bool, skip_locked: bool = False, nowait: bool = False
+                             ) -> Tuple[str, Optional[int]]:
+        # select_to_try的select语句(按dialect); return (query, fetch_num), fetch_num不为None时只fetch前fetch_num行
+        if self.dialect == 'mssql':  # TOP代替LIMIT, 以表提示加锁: UPDLOCK, ROWLOCK, READPAST(跳过锁定行)/NOWAIT
+            hints = ('updlock', 'rowlock', 'readpast' if skip_locked else 'nowait' if nowait else None)
+            return 'select {}{} from {}{}{}{}'.format(
+                'top {} '.format(num) if num else '', fields, table,
+                ' with ({})'.format(', '.join(filter(None, hints))) if lock else '', select_where, select_extra), None
+        if lock:
+            lock = ' for update skip locked' if skip_locked else ' for update nowait' if nowait else ' for update'
+        if self.dialect == 'oracle' and num:
+            # oracle不支持LIMIT, 且FOR UPDATE不能与FETCH FIRST同用; FOR UPDATE SKIP LOCKED在fetch时才加锁, 故只fetch前num行
+            if skip_locked and lock:
+                return 'select {} from {}{}{}{}'.format(fields, table, select_where, select_extra, lock), int(num)
+            if lock:
+                return 'select {} from {}{}{}{}'.format(fields, table, '{} and rownum <= {}'.format(
+                    select_where, num) if select_where else ' where rownum <= {}'.format(num), select_extra, lock), None
+            return 'select {} from {}{}{} fetch first {} rows only'.format(fields, table, select_where, select_extra,
+                                                                           num), None
+        return 'select {} from {}{}{}{}{}'.format(fields, table, select_where, select_extra,
+                                                 ' limit {}'.format(num) if num else '', lock or ''), None
+
+    def _select_to_try_returning_query(self, fields: str, key_fields_list: Iterable[str], table: str,
+                                       select_where: str, select_extra: str, num: Union[int, str, None], lock: bool,
+                                       skip_locked: bool, nowait: bool, update_set: str, update_extra: str) -> str:
+        # select_to_try(returning=True)的单条语句: 选取与update合并, 返回update后的fields
+        if self.dialect == 'mssql':  # 可更新的CTE: select top n ... with (锁提示), update ... output inserted.*
+            return 'with _to_try as ({}) update _to_try set {} output {}{}'.format(
+                self._select_to_try_query('*', table, select_where, select_extra, num, lock, skip_locked, nowait)[0],
+                update_set, ','.join('inserted.' + field.strip() for field in fields.split(',')),
+                ' where 1=1' + update_extra if update_extra else '')
+        # postgresql: update ... where (key_fields) in (select key_fields ... limit n for update skip locked) returning
+        key_fields = ','.join(key_fields_list)
+        return 'update {} set {} where ({}) in ({}){} returning {}'.format(
+            table, update_set, key_fields,
+            self._select_to_try_query(key_fields, table, select_where, select_extra, num, lock, skip_locked, nowait)[0],
+            update_extra, fields)
+
+    def _key_predicates(self, key_fields: Sequence[str], rows: Sequence, dictionary: Optional[bool] = None
+                        ) -> Generator[Tuple[str, list], None, None]:
+        # 按key_fields定位rows的where部分: 单个key为key IN (...), 复合key为(k1,k2) IN ((..),(..))(dialect不支持时以OR连接);
+        # 按_key_predicate_limits分块, 逐块yield (where部分, 参数); dictionary为None时按首条记录是否为dict判断
+        max_rows, max_params, row_value = self._key_predicate_limits.get(self.dialect,
+                                                                         self._key_predicate_limits[None])
+        size = max(max_params // len(key_fields), 1)
+        if max_rows is not None:
+            size = min(size, max_rows)
+        if dictionary is None:
+            dictionary = isinstance(rows[0], dict)
+        if dictionary:
+            values = [[row[key] for key in key_fields] for row in rows]
         else:
-            result = ()
-            self.rollback(transaction)
-        if autocommit_after is not None:
-            self.autocommit = autocommit_after
-        return result
+            values = [[row[i] for i in range(len(key_fields))] for row in rows]
+        for start in range(0, len(values), size):
+            chunk = values[start:start + size]
+            if len(key_fields) == 1:
+                where = '{} in ({})'.format(key_fields[0], ','.join(('%s',) * len(chunk)))
+            elif row_value:
+                where = '({}) in ({})'.format(','.join(key_fields), ','.join(
+                    ('({})'.format(','.join(('%s',) * len(key_fields))),) * len(chunk)))
+            else:
+                where = '({})'.format(' or '.join(('({})'.format(' and '.join(map('{}=%s'.format, key_fields))),)
+                                                  * len(chunk)))
+            yield where, list(itertools.chain.from_iterable(chunk))
 
     def end_try(self, result: Optional[Iterable], table: Optional[str] = None,
                 key_fields: Union[str, Iterable[str], None] = None, tried_field: Optional[str] = None,
@@ -406,6 +1449,24 @@ class SqlClient(object):
         # key_fields为''或None时, result需为dict或list[dict], key_fields取result的keys
         # tried_field, finished_field, next_time_field字段传入与否分别决定相关逻辑启用与否, 默认值None表示不启用
         # update_where: 不为None则替换update一句的where部分
+        # update一句以key IN (...)定位记录, 记录数超过_key_predicate_limits时分为多条语句(commit=True时在同一事务中执行)
+        return self._run_steps(self._end_try_steps(
+            result, table, key_fields, tried_field, tried, finished_field, finished, next_time_field, next_time,
+            commit, set_extra, update_set, update_where, update_extra, empty_string_to_none, try_times_connect,
+            time_sleep_connect, raise_error, exc_info, call))
+
+    def _end_try_steps(self, result: Optional[Iterable], table: Optional[str] = None,
+                       key_fields: Union[str, Iterable[str], None] = None, tried_field: Optional[str] = None,
+                       tried: Union[int, str, None] = 0, finished_field: Optional[str] = None,
+                       finished: Union[int, str, None] = 1, next_time_field: Optional[str] = None,
+                       next_time: Union[int, float, str, None] = '=0', commit: bool = True,
+                       set_extra: Optional[str] = '', update_set: Optional[str] = None,
+                       update_where: Optional[str] = None, update_extra: str = '',
+                       empty_string_to_none: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
+                       time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                       exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None
+                       ) -> Generator[Callable, Any, int]:
+        # end_try的步骤生成器, 参数同end_try
         result, _ = self.standardize_args(result, True, False, None, False)
         if not result:
             return 0
@@ -451,21 +1512,37 @@ class SqlClient(object):
             update_next_time = next_time_field + '=%s'
             args.append(next_time)
         if update_where is None:
-            update_where = ' or '.join((' and '.join(map('{}=%s'.format, key_fields)),) * len(result))
-            if isinstance(result[0], dict):
-                args.extend(row[key] for row in result for key in key_fields)
-            else:
-                args.extend(row[i] for row in result for i in range(len(key_fields)))
+            predicates = list(self._key_predicates(key_fields, result))
         elif update_where.startswith('where'):
-            update_where = update_where[5:].lstrip(' ')
+            predicates = [(update_where[5:].lstrip(' '), [])]
         elif update_where.startswith(' where'):
-            update_where = update_where[6:].lstrip(' ')
-        query = 'update {} set {} where {}{}'.format(table, ','.join(filter(None, (
-            update_tried, update_finished, update_next_time))) + set_extra if update_set is None else update_set,
-                                                     update_where, update_extra)
-        return self.query(query, args, fetchall=False, commit=commit, empty_string_to_none=empty_string_to_none,
-                          try_times_connect=try_times_connect, time_sleep_connect=time_sleep_connect,
-                          raise_error=raise_error, exc_info=exc_info, call=call)
+            predicates = [(update_where[6:].lstrip(' '), [])]
+        else:
+            predicates = [(update_where, [])]
+        if update_set is None:
+            update_set = ','.join(filter(None, (update_tried, update_finished, update_next_time))) + set_extra
+        else:
+            args = []
+        if len(predicates) == 1:
+            return (yield functools.partial(
+                self.query, 'update {} set {} where {}{}'.format(table, update_set, predicates[0][0], update_extra),
+                args + predicates[0][1], fetchall=False, commit=commit, empty_string_to_none=empty_string_to_none,
+                try_times_connect=try_times_connect, time_sleep_connect=time_sleep_connect, raise_error=raise_error,
+                exc_info=exc_info, call=call))
+        transaction = (yield self.begin) if commit else None
+        for where, where_args in predicates:
+            is_success = yield functools.partial(
+                self.query, 'update {} set {} where {}{}'.format(table, update_set, where, update_extra),
+                args + where_args, fetchall=False, commit=False, empty_string_to_none=empty_string_to_none,
+                try_times_connect=try_times_connect, time_sleep_connect=time_sleep_connect, raise_error=raise_error,
+                exc_info=exc_info, call=call)
+            if not is_success:
+                if commit:
+                    yield functools.partial(self.rollback, transaction)
+                return 0
+        if commit:
+            yield functools.partial(self.commit, transaction)
+        return 1
 
     def fail_try(self, result: Optional[Iterable], table: Optional[str] = None,
                  key_fields: Union[str, Iterable[str], None] = None, tried_field: Optional[str] = None,
@@ -497,8 +1574,67 @@ class SqlClient(object):
                             next_time, commit, set_extra, update_set, update_where, update_extra, empty_string_to_none,
                             try_times_connect, time_sleep_connect, raise_error, exc_info, call)
 
+    def reclaim_expired(self, table: Optional[str] = None, tried_field: Optional[str] = None,
+                        next_time_field: Optional[str] = None, tried: Union[int, str, None] = '-+1',
+                        next_time: Union[int, float, str, Notset, None] = NOTSET,
+                        finished_field: Optional[str] = None, finished: Union[int, str, None] = 0,
+                        set_extra: Optional[str] = '', update_extra: str = '', commit: bool = True,
+                        try_times_connect: Union[int, float, None] = None,
+                        time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                        exc_info: Union[bool, Notset, None] = NOTSET) -> int:
+        # 回收租约已到期的处理中任务(select_to_try(tried_after='-', lease_seconds=...)领取后未end_try, 如进程崩溃),
+        # 以一条update使其可被重新领取, return回收的记录数
+        # 处理中: tried_field<0 且 next_time_field<=当前时间 (finished_field传入时再加上finished_field=finished)
+        # tried: 默认值'-+1'表示取相反数加一(同fail_try, 计为一次失败的尝试), 传入'-'则恢复原状, 也可传入'=1'等
+        # next_time: 默认值NOTSET表示不修改(租约到期时间已<=当前时间, 可立即被领取), 传入300等则为当前时间+300秒
+        # 建议按task_index_sql建立索引, 使领取与回收均为索引范围扫描
+        if not tried_field or not next_time_field:
+            raise ValueError('reclaim_expired requires tried_field and next_time_field')
+        if table is None:
+            table = self.table
+        update_set, args = self._select_to_try_update_set(tried_field, tried, next_time_field, next_time, set_extra,
+                                                          None)
+        where = '{}<0 and {}<={}'.format(tried_field, next_time_field, int(time.time()))
+        if not finished_field:
+            pass
+        elif finished is None or finished == 'null':
+            where += ' and {} is null'.format(finished_field)
+        elif isinstance(finished, int):
+            where += ' and {}={}'.format(finished_field, finished)
+        else:
+            where += ' and {}=%s'.format(finished_field)
+            args.append(finished)
+        return self.query('update {} set {} where {}{}'.format(table, update_set, where, update_extra), args,
+                          fetchall=False, commit=commit, try_times_connect=try_times_connect,
+                          time_sleep_connect=time_sleep_connect, raise_error=raise_error, exc_info=exc_info,
+                          call=functools.partial(self.try_execute, call=self._execute_rowcount))
+
+    def task_index_sql(self, table: Optional[str] = None, tried_field: Optional[str] = None,
+                       finished_field: Optional[str] = None, next_time_field: Optional[str] = None,
+                       key_fields: Union[str, Iterable[str], None] = None, name: Optional[str] = None) -> str:
+        # select_to_try, reclaim_expired推荐的索引(按dialect), 用法: db.query(db.task_index_sql(...), fetchall=False)
+        # 字段顺序(finished_field, tried_field, next_time_field): finished_field等值, tried_field范围(between, <0),
+        # next_time_field在索引内过滤, 领取与回收均为索引范围扫描;
+        # postgresql, mssql以INCLUDE覆盖key_fields(mysql的InnoDB二级索引已包含主键)
+        if table is None:
+            table = self.table
+        fields = [field for field in (finished_field, tried_field, next_time_field) if field]
+        if not fields:
+            raise ValueError('task_index_sql requires at least one of finished_field, tried_field, next_time_field')
+        if name is None:
+            name = 'idx_{}_task'.format(re.sub(r'\W', '', table.rsplit('.', 1)[-1]))
+        if isinstance(key_fields, str):
+            key_fields = [key.strip() for key in key_fields.split(',')]
+        include = [key for key in key_fields or () if key not in fields]
+        return 'create index {}{} on {} ({}){}'.format(
+            'if not exists ' if self.dialect in ('postgresql', 'sqlite') else '', name, table, ', '.join(fields),
+            ' include ({})'.format(', '.join(include)) if include and self.dialect in ('postgresql', 'mssql') else '')
+
     def close(self, try_close: bool = True) -> None:
+        # 连接池模式: 只关闭本线程的连接(不在query等调用中时归还槽位), 连接池中的空闲连接由pool.clear()关闭
         self.connected = False
+        if self.pool is not None and self.connection is None:
+            return
         if try_close:
             try:
                 self.connection.close()
@@ -507,6 +1643,8 @@ class SqlClient(object):
                 pass
         else:
             self.connection.close()
+        if self.pool is not None and not self._local.depth:
+            self._release_connection()
 
     @property
     def autocommit(self) -> bool:
@@ -529,6 +1667,58 @@ class SqlClient(object):
             self.rollback(transaction)
             raise e
 
+    def retrying_transaction(self, fn: Callable, retries: int = 3,
+                             backoff: Union[int, float, Callable[[int], Union[int, float]], None] = 0.1,
+                             args: Iterable = (), kwargs: Optional[dict] = None) -> Any:
+        # 在事务(transaction)中执行fn(*args, **kwargs)并return其结果; 出现死锁或序列化失败(is_transaction_conflict)时
+        # 回滚并重新执行整个fn, 最多重试retries次, 仍失败或其它异常则raise
+        # backoff: 第n次重试前等待random.uniform(0, backoff * 2 ** (n - 1))秒; 也可为函数(n -> 秒数); 为None时不等待
+        # fn中的语句出错时直接raise(不受try_times_connect, raise_error影响), 故fn需可重复执行
+        if kwargs is None:
+            kwargs = {}
+        local = self._local
+        retrying = local.retrying
+        try_count = 0
+        while True:
+            local.retrying = True
+            try:
+                with self.transaction():
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if retrying or not self.is_transaction_conflict(e) or try_count >= retries:
+                    raise e
+                try_count += 1
+                sleep = self._transaction_backoff(backoff, try_count)
+                if self.log:
+                    self.logger.warning('{}(retry transaction({}), sleep {}): {}'.format(
+                        str(type(e))[8:-2], try_count, sleep, e))
+                if sleep:
+                    time.sleep(sleep)
+            finally:
+                local.retrying = retrying
+
+    def retry_transaction(self, retries: int = 3,
+                          backoff: Union[int, float, Callable[[int], Union[int, float]], None] = 0.1) -> Callable:
+        # retrying_transaction的装饰器形式: @db.retry_transaction(retries=5)
+        def decorator(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                return self.retrying_transaction(fn, retries, backoff, args, kwargs)
+            return wrapper
+        return decorator
+
+    def is_transaction_conflict(self, e: BaseException) -> bool:
+        return error_code(e) in self._transaction_retry_codes.get(self.dialect, ())
+
+    @staticmethod
+    def _transaction_backoff(backoff: Union[int, float, Callable[[int], Union[int, float]], None],
+                             try_count: int) -> Union[int, float, None]:
+        if backoff is None or not callable(backoff) and not backoff:
+            return None
+        if callable(backoff):
+            return backoff(try_count)
+        return round(random.uniform(0, backoff * 2 ** (try_count - 1)), 3)
+
     def begin(self) -> None:
         self.temp_autocommit = self._autocommit
         self.autocommit = False
@@ -540,6 +1730,8 @@ class SqlClient(object):
         if self.temp_autocommit is not None:
             self.autocommit = self.temp_autocommit
             self.temp_autocommit = None
+        if self.pool is not None and not self._local.depth:
+            self._release_connection()
 
     def rollback(self, transaction=None) -> None:
         if self.connection is not None:
@@ -547,6 +1739,8 @@ class SqlClient(object):
         if self.temp_autocommit is not None:
             self.autocommit = self.temp_autocommit
             self.temp_autocommit = None
+        if self.pool is not None and not self._local.depth:
+            self._release_connection()
 
     def connect(self) -> None:
         self.connection = self.lib.connect(host=self.host, port=self.port, user=self.user, password=self.password,
@@ -557,8 +1751,105 @@ class SqlClient(object):
         self.connect()
 
     def set_connection(self) -> None:
+        if self.instrumentation is not None:
+            started = time.perf_counter()
+        if self.pool is not None and not self._local.checked_out:
+            self._checkout_connection()
         if not self.connected or self.connection is None:
             self.try_connect()
+        if self.instrumentation is not None:
+            self._instrument('connect', None, started)
+
+    def _checkout_connection(self) -> None:
+        # 连接池模式: 为本线程取出连接; 取出已有连接时同步autocommit并ping做健康检查, 槽位为空时由set_connection新建连接
+        try:
+            entry = self.pool.get()
+        except queue.Empty:
+            raise self.lib.OperationalError('connection pool timeout ({}s)'.format(self.pool.timeout))
+        local = self._local
+        local.checked_out = True
+        local.created = time.time()
+        if entry is None:
+            return
+        connection, local.created, _, autocommit = entry
+        local.connection = connection
+        local.connected = True
+        if autocommit != local.autocommit:
+            local.autocommit, autocommit = autocommit, local.autocommit
+            self.autocommit = autocommit
+        local.depth += 1
+        try:
+            self.ping()
+        finally:
+            local.depth -= 1
+        if self.connection is not connection:
+            local.created = time.time()
+
+    def _release_connection(self) -> None:
+        # 连接池模式: 归还本线程的连接(事务中不归还); 已断开的连接关闭后以空槽位归还
+        local = self._local
+        if not local.checked_out or local.temp_autocommit is not None:
+            return
+        if local.connected and local.connection is not None:
+            self.pool.put((local.connection, local.created, time.time(), local.autocommit))
+        else:
+            if local.connection is not None:
+                ConnectionPool._close(local.connection)
+            self.pool.put(None)
+        local.connection = None
+        local.connected = False
+        local.checked_out = False
+
+    def _lease_connection(self, result: Any, keep_cursor: Optional[bool] = False) -> Any:
+        # 连接池模式: query返回生成器或保留cursor时, 将本线程的连接移交给返回值(见_PoolLease), 本线程之后的调用另取连接;
+        # 事务中(或非autocommit)连接仍固定于本线程, 由commit/rollback归还
+        local = self._local
+        if not local.checked_out or local.temp_autocommit is not None or not local.autocommit:
+            return result
+        entry = (local.connection, local.created, time.time(), local.autocommit) if (
+                local.connected and local.connection is not None) else None
+        local.connection = None
+        local.connected = False
+        local.checked_out = False
+        if keep_cursor:
+            result, cursor = result
+            return result, _LeasedCursor(cursor, _PoolLease(self.pool, entry))
+        if inspect.isgenerator(result):
+            return _PoolLease(self.pool, entry).generator(result)
+        if isinstance(result, list) and result and all(map(inspect.isgenerator, result)):
+            lease = _PoolLease(self.pool, entry, len(result))
+            return [lease.generator(each) for each in result]
+        self.pool.put(entry)
+        return result
+
+    @contextlib.contextmanager
+    def _pool_session(self, keep: bool = False):
+        # 连接池模式: query, save_data的调用期间, 结束时若不在事务中且为autocommit则归还连接
+        # keep: 返回生成器或cursor时不在此归还, 由_lease_connection移交给返回值(出错时没有返回值, 仍在此归还)
+        local = self._local
+        local.depth += 1
+        try:
+            yield
+        except BaseException:
+            keep = False
+            raise
+        finally:
+            local.depth -= 1
+            if not local.depth and not keep and local.autocommit:
+                self._release_connection()
+
+    def _retry_decision(self, e: BaseException, try_count_connect: int, try_times_connect: Union[int, float, None],
+                        time_sleep_connect: Union[int, float, None], started: float, in_transaction: bool = False,
+                        connecting: bool = False) -> Tuple[bool, Union[int, float, None], bool]:
+        # try_connect, try_execute第try_count_connect次失败后: return (是否放弃, 重试前等待秒数, 是否需重建连接)
+        # in_transaction: 事务中连接断开或死锁时之前的语句已丢失(死锁时数据库已回滚整个事务), 不能单独重试当前语句
+        if self.retry_policy is None:
+            return bool(try_times_connect and try_count_connect >= try_times_connect), time_sleep_connect, False
+        kind, sleep = self.retry_policy.next_delay(self, e, try_count_connect, started, try_times_connect,
+                                                   connecting)
+        reconnect = kind == RetryPolicy.DISCONNECT
+        give_up = sleep is None or in_transaction and kind in (RetryPolicy.DEADLOCK, RetryPolicy.DISCONNECT)
+        return give_up, sleep, reconnect
 
     def try_connect(self, try_reconnect: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
                     time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
@@ -573,17 +1864,25 @@ class SqlClient(object):
             raise_error = self.raise_error
         if exc_info is NOTSET:
             exc_info = self.exc_info
+        policy = self.retry_policy
+        started = time.monotonic()
         try_count_connect = 0
         while True:
             try:
+                if policy is not None:
+                    policy.check()
                 if try_reconnect:
                     self.reconnect()
                 else:
                     self.connect()
+                if policy is not None:
+                    policy.success()
                 return
             except (self.lib.InterfaceError, self.lib.OperationalError) as e:
                 try_count_connect += 1
-                if try_times_connect and try_count_connect >= try_times_connect:
+                give_up, sleep, _ = self._retry_decision(e, try_count_connect, try_times_connect,
+                                                         time_sleep_connect, started, connecting=True)
+                if give_up:
                     if self.log:
                         self.logger.error('{}(max retry({})): {}  (in try_connect)'.format(
                             str(type(e))[8:-2], try_count_connect, e),
@@ -593,10 +1892,12 @@ class SqlClient(object):
                     return
                 if self.log:
                     self.logger.error('{}(retry({}), sleep {}): {}  (in try_connect)'.format(
-                        str(type(e))[8:-2], try_count_connect, time_sleep_connect, e),
+                        str(type(e))[8:-2], try_count_connect, sleep, e),
                         exc_info=True if exc_info is None else exc_info)
-                if time_sleep_connect:
-                    time.sleep(time_sleep_connect)
+                if self.instrumentation is not None:
+                    self.instrumentation.record('reconnect', None, sleep or 0)
+                if sleep:
+                    time.sleep(sleep)
             except Exception as e:
                 if self.log:
                     self.logger.error('{}: {}  (in try_connect)'.format(str(type(e))[8:-2], e),
@@ -624,24 +1925,50 @@ class SqlClient(object):
             exc_info = self.exc_info
         if call is None:
             call = self.execute
+        if self._local.retrying:  # retrying_transaction中: 出错即raise, 由其重新执行整个事务
+            try_times_connect = 1
+            raise_error = True
+        policy = self.retry_policy
+        started = time.monotonic()
         ori_cursor = cursor
         if cursor is None:
             cursor = self._before_query_and_get_cursor(fetchall, dictionary)
         try_count_connect = 0
+        reconnect = False
         while True:
             try:
+                if policy is not None:
+                    policy.check()
+                    if reconnect:  # 连接已断开: 关闭后重建连接与cursor
+                        reconnect = False
+                        try:
+                            if cursor is not None:
+                                cursor.close()
+                            self.close()
+                        except Exception:
+                            pass
+                        cursor = self._before_query_and_get_cursor(fetchall, dictionary)
                 result = call(query, args, fetchall, dictionary, chunksize, many, commit, keep_cursor, cursor)
+                if policy is not None:
+                    policy.success()
+                if self.instrumentation is not None:
+                    self._record_statement(query, args, cursor, started, result, keep_cursor, try_count_connect)
                 if ori_cursor is None and (
                         chunksize is None or not fetchall) and cursor is not None and not keep_cursor:
                     cursor.close()
                 return result
             except (self.lib.InterfaceError, self.lib.OperationalError) as e:
                 try_count_connect += 1
-                if try_times_connect and try_count_connect >= try_times_connect:
+                give_up, sleep, reconnect = self._retry_decision(
+                    e, try_count_connect, try_times_connect, time_sleep_connect, started,
+                    not self._autocommit or ori_cursor is not None)
+                if give_up:
                     if self.log:
                         self.logger.error('{}(max retry({})): {}  {}'.format(
                             str(type(e))[8:-2], try_count_connect, e, self._query_log_text(query, args, cursor)),
                             exc_info=not raise_error if exc_info is None else exc_info)
+                    if self.instrumentation is not None:
+                        self._record_statement(query, args, cursor, started, None, False, try_count_connect - 1, e)
                     if raise_error:
                         if ori_cursor is None and cursor is not None:
                             cursor.close()
@@ -649,16 +1976,20 @@ class SqlClient(object):
                     break
                 if self.log:
                     self.logger.error('{}(retry({}), sleep {}): {}  {}'.format(
-                        str(type(e))[8:-2], try_count_connect, time_sleep_connect, e,
+                        str(type(e))[8:-2], try_count_connect, sleep, e,
                         self._query_log_text(query, args, cursor)), exc_info=True if exc_info is None else exc_info)
-                if time_sleep_connect:
-                    time.sleep(time_sleep_connect)
+                if self.instrumentation is not None:
+                    self.instrumentation.record('retry', fingerprint(query), sleep or 0)
+                if sleep:
+                    time.sleep(sleep)
             except Exception as e:
                 self.rollback()
                 if self.log:
                     self.logger.error('{}: {}  {}'.format(
                         str(type(e))[8:-2], e, self._query_log_text(query, args, cursor)),
                         exc_info=not raise_error if exc_info is None else exc_info)
+                if self.instrumentation is not None:
+                    self._record_statement(query, args, cursor, started, None, False, try_count_connect, e)
                 if raise_error:
                     if ori_cursor is None and cursor is not None:
                         cursor.close()
@@ -677,20 +2008,75 @@ class SqlClient(object):
         ori_cursor = cursor
         if cursor is None:
             cursor = self._before_query_and_get_cursor(fetchall, dictionary)
+        timing = self.instrumentation is not None
+        if timing:
+            started = time.perf_counter()
         if not many:
-            cursor.execute(query, args)
+            self._execute_statement(cursor, query, args)
         else:  # executemany: 一句插入多条记录, 当语句超出1024000字符时拆分成多个语句; 传单条记录需用列表包起来
             cursor.executemany(query, args)
         if commit and not self._autocommit:
             self.commit()
+        if timing:
+            started = self._instrument('execute', query, started, cursor.rowcount, len(query))
         result = (cursor.fetchall() if chunksize is None else self._fetchmany_generator(cursor, chunksize, keep_cursor)
                   ) if fetchall else len(args) if many and hasattr(args, '__len__') else 1
+        if timing and fetchall and chunksize is None:
+            self._instrument('fetch', query, started, len(result))
         if keep_cursor:
             return result, cursor
         if ori_cursor is None and (chunksize is None or not fetchall):
             cursor.close()
         return result
 
+    def _record_statement(self, query: str, args: Any, cursor: Any, started: float, result: Any = None,
+                          keep_cursor: Optional[bool] = False, retries: int = 0,
+                          error: Optional[BaseException] = None) -> None:
+        # 向instrumentation报告try_execute中一条语句的总耗时(自started(time.monotonic())起), 行数, 重试次数与异常
+        if keep_cursor and error is None:
+            result = result[0]
+        rows = result if isinstance(result, int) else len(result) if hasattr(result, '__len__') else None
+        self.instrumentation.record_statement(self, query, args, cursor, time.monotonic() - started, rows, retries,
+                                              error)
+
+    def _instrument(self, phase: str, query: Optional[str], started: float, rows: Optional[int] = None,
+                    nbytes: Optional[int] = None) -> float:
+        # 向instrumentation报告自started(time.perf_counter())起的耗时, return当前时间供下一阶段计时
+        now = time.perf_counter()
+        self.instrumentation.record(phase, None if query is None else fingerprint(query), now - started, rows, nbytes)
+        return now
+
+    def _execute_statement(self, cursor: Any, query: str, args: Any = None) -> None:
+        # execute, _execute_columnar, _execute_rowcount执行单条语句(非executemany), 子类可覆盖(如postgresql的prepare)
+        cursor.execute(query, args)
+
+    def _execute_columnar(self, query: str, args: Any = None, fetchall: bool = True,
+                          dictionary: Optional[bool] = None, chunksize: Optional[int] = None, many: bool = False,
+                          commit: Optional[bool] = None, keep_cursor: Optional[bool] = False, cursor: Any = None,
+                          numpy: bool = False) -> Union[int, ColumnTable, Tuple[Union[int, ColumnTable], Any]]:
+        # query(columnar=True)使用: 按chunksize(默认10000)分块fetchmany, 逐块填充ColumnTable
+        ori_cursor = cursor
+        if cursor is None:
+            cursor = self._before_query_and_get_cursor(fetchall, False)
+        if not many:
+            self._execute_statement(cursor, query, args)
+        else:
+            cursor.executemany(query, args)
+        if commit and not self._autocommit:
+            self.commit()
+        if not fetchall:
+            result = len(args) if many and hasattr(args, '__len__') else 1
+        elif cursor.description is None:
+            result = ColumnTable((), ())
+        else:
+            result = ColumnTable.from_chunks([column[0] for column in cursor.description], self._fetchmany_generator(
+                cursor, chunksize or 10000, True), numpy)
+        if keep_cursor:
+            return result, cursor
+        if ori_cursor is None:
+            cursor.close()
+        return result
+
     @staticmethod
     def _fetchmany_generator(cursor, chunksize, keep_cursor):
         while True:
@@ -719,128 +2105,188 @@ class SqlClient(object):
     def standardize_args(self, args: Any, to_multiple: Optional[bool] = None,
                          empty_string_to_none: Optional[bool] = None, args_to_dict: Union[bool, Notset, None] = NOTSET,
                          get_info: bool = False, keys: Optional[Iterable[str]] = None,
-                         nums: Optional[Iterable[int]] = None
-                         ) -> Union[Tuple[Union[Sequence, dict, None], Optional[Iterable[str]]],
-                                    Tuple[Union[Sequence, dict, None], Optional[Iterable[str]], bool, bool]]:
+                         nums: Optional[Iterable[int]] = None, lazy: bool = False
+                         ) -> Union[Tuple[Union[Sequence, dict, Iterable, None], Optional[Iterable[str]]],
+                                    Tuple[Union[Sequence, dict, Iterable, None], Optional[Iterable[str]], bool, bool]]:
         # get_info=True: 返回值除了args, keys以外还有: 是否multiple, 字典key是否为生成的
         # args_to_dict=None: 不做dict和list之间转换; args_to_dict=False: dict强制转为list; args_to_dict=NOTSET: 读取默认配置
         # 仅在args_to_dict=False且args为dict形式且keys为None时, keys会被修改
         # nums: from_paramstyle=Paramstyle.numeric且to_paramstyle为Paramstyle.format或Paramstyle.qmark且通配符乱序时, 传入通配符数字列表
+        # 由首条记录确定一次转换方式(见_standardize_plan), 再对每条记录执行同一个转换函数; 无需转换时原样返回args
+        # lazy=True: 多条记录时返回逐条转换的迭代器, 不复制整批数据; args为Generator等迭代器时只预读首条记录
         if args is None:
             return (None, keys) if not get_info else (None, keys, False, False)
+        rows = None
         if not hasattr(args, '__getitem__'):
             if hasattr(args, '__iter__'):  # set, Generator, range
-                args = tuple(args)
+                if lazy and to_multiple is not False:
+                    args = iter(args)
+                    first = next(args, NOTSET)
+                    if first is NOTSET:
+                        return ((), keys) if not get_info else ((), keys, False, False)
+                    if isinstance(first, str) or not hasattr(first, '__getitem__') and not hasattr(first, '__iter__'):
+                        args = (first,) + tuple(args)
+                    else:
+                        rows = itertools.chain((first,), args)
+                        to_multiple = True
+                else:
+                    args = tuple(args)
             else:  # int, etc.
                 args = (args,)
         elif isinstance(args, str):
             args = (args,)
         # else: dict, list, tuple, dataset/row, recordcollection/record
-        if not args:
-            return (args, keys) if not get_info else (args, keys, False, False)
-        if to_multiple is None:  # 检测是否multiple
-            to_multiple = not isinstance(args, dict) and not isinstance(args[0], str) and (
-                    hasattr(args[0], '__getitem__') or hasattr(args[0], '__iter__'))
+        if rows is None:
+            if not args:
+                return (args, keys) if not get_info else (args, keys, False, False)
+            if to_multiple is None:  # 检测是否multiple
+                to_multiple = not isinstance(args, dict) and not isinstance(args[0], str) and (
+                        hasattr(args[0], '__getitem__') or hasattr(args[0], '__iter__'))
+            if to_multiple and not isinstance(args, dict) and not isinstance(args[0], str) and (
+                    hasattr(args[0], '__getitem__') or hasattr(args[0], '__iter__')):
+                rows = args
+                first = args[0]
+            else:  # 单条记录
+                first = args
         if args_to_dict is NOTSET:
             args_to_dict = self.args_to_dict
         if empty_string_to_none is None:
             empty_string_to_none = self.empty_string_to_none
+        to_tuple = rows is not None and not hasattr(first, '__getitem__')
+        if to_tuple:
+            # list[set, Generator, range]: 首条记录先转为tuple以确定字段数, 所有记录均转为tuple
+            # mysqlclient, pymysql均只支持dict, list, tuple, 不支持set, Generator等
+            first = tuple(first)
+            rows = itertools.chain((first,), itertools.islice(rows, 1, None))
+        convert, keys, is_key_generated = self._standardize_plan(first, args_to_dict, keys, nums, empty_string_to_none)
+        if to_tuple:
+            convert = tuple if convert is None else functools.partial(_call_with_tuple, convert)
+        if rows is None:
+            if convert is not None:
+                args = convert(args)
+            if to_multiple:
+                args = (args,)
+        elif lazy:
+            args = iter(rows) if convert is None else map(convert, rows)
+        else:
+            args = rows if convert is None else tuple(map(convert, rows))
+        return (args, keys) if not get_info else (args, keys, to_multiple, is_key_generated)
+
+    @staticmethod
+    def _standardize_plan(first: Any, args_to_dict: Optional[bool] = None, keys: Optional[Iterable[str]] = None,
+                          nums: Optional[Iterable[int]] = None, empty_string_to_none: bool = True
+                          ) -> Tuple[Optional[Callable[[Any], Union[Sequence, dict]]], Optional[Iterable[str]], bool]:
+        # 由首条记录first确定每条记录的转换函数(None表示无需转换), return (转换函数, keys, 字典key是否为生成的)
+        # 非dict记录需可索引(set, Generator等由standardize_args先转为tuple); 其余记录按与首条记录相同的形式处理
+        if isinstance(first, dict):
+            if args_to_dict is False:
+                if keys is None:
+                    keys = tuple(first)
+                getter = _items_getter(keys)
+                return (lambda row: _empty_to_none(getter(row))) if empty_string_to_none else getter, keys, False
+            return _dict_empty_to_none if empty_string_to_none else None, keys, False
         is_key_generated = False
-        if not to_multiple:
-            if isinstance(args, dict):
-                if args_to_dict is False:
-                    if keys is None:
-                        keys = tuple(args)
-                    args = tuple(args[key] if args[key] != '' else None for key in keys
-                                 ) if empty_string_to_none else tuple(map(args.__getitem__, keys))
-                elif empty_string_to_none:
-                    args = {key: value if value != '' else None for key, value in args.items()}
+        if args_to_dict:
+            if keys is None:
+                to_dict_keys = tuple(map(str, range(1, len(first) + 1)))
+                is_key_generated = True
             else:
-                if args_to_dict:
-                    if keys is None:
-                        to_dict_keys = tuple(map(str, range(1, len(args) + 1)))
-                        is_key_generated = True
-                    else:
-                        to_dict_keys = keys
-                    args = {key: value if value != '' else None for key, value in zip(to_dict_keys, args)
-                            } if empty_string_to_none else dict(zip(to_dict_keys, args))
-                elif nums is not None:
-                    args = tuple(args[num] if args[num] != '' else None for num in nums
-                                 ) if empty_string_to_none else tuple(map(args.__getitem__, nums))
-                elif empty_string_to_none:
-                    args = tuple(each if each != '' else None for each in args)
+                to_dict_keys = keys
+            convert = (lambda row: dict(zip(to_dict_keys, _empty_to_none(row)))) if empty_string_to_none else (
+                lambda row: dict(zip(to_dict_keys, row)))
+        elif nums is not None:
+            getter = _items_getter(tuple(nums))
+            convert = (lambda row: _empty_to_none(getter(row))) if empty_string_to_none else getter
+        elif empty_string_to_none:
+            # list, tuple以外的记录(dataset/row, recordcollection/record等)转为tuple
+            convert = _empty_to_none if isinstance(first, (tuple, list)) else lambda row: _empty_to_none(tuple(row))
         else:
-            if isinstance(args, dict):
-                if args_to_dict is False:
-                    if keys is None:
-                        keys = tuple(args)
-                    args = (tuple(args[key] if args[key] != '' else None for key in keys),
-                            ) if empty_string_to_none else (tuple(map(args.__getitem__, keys)),)
-                else:
-                    args = ({key: value if value != '' else None for key, value in args.items()},
-                            ) if empty_string_to_none else (args,)
-            elif isinstance(args[0], dict):
-                if args_to_dict is False:
-                    if keys is None:
-                        keys = tuple(args[0])
-                    args = tuple(tuple(each[key] if each[key] != '' else None for key in keys) for each in args
-                                 ) if empty_string_to_none else tuple(
-                        tuple(map(each.__getitem__, keys)) for each in args)
-                elif empty_string_to_none:
-                    args = tuple({key: value if value != '' else None for key, value in each.items()} for each in args)
-            else:
-                if args_to_dict:
-                    if keys is None:
-                        to_dict_keys = tuple(map(str, range(1, len(args) + 1)))
-                        is_key_generated = True
-                    else:
-                        to_dict_keys = keys
-                    if isinstance(args[0], str):
-                        args = ({key: value if value != '' else None for key, value in zip(to_dict_keys, args)},
-                                ) if empty_string_to_none else (dict(zip(to_dict_keys, args)),)
-                    elif not hasattr(args[0], '__getitem__'):
-                        if hasattr(args[0], '__iter__'):  # list[set, Generator, range]
-                            # mysqlclient, pymysql均只支持dict, list, tuple, 不支持set, Generator等
-                            args = tuple({key: value if value != '' else None for key, value in zip(to_dict_keys, each)}
-                                         for each in args) if empty_string_to_none else tuple(
-                                dict(zip(to_dict_keys, each)) for each in args)
-                        else:  # list[int, etc.]
-                            args = ({key: value if value != '' else None for key, value in zip(to_dict_keys, args)},
-                                    ) if empty_string_to_none else (dict(zip(to_dict_keys, args)),)
-                    else:
-                        args = tuple({key: value if value != '' else None for key, value in zip(to_dict_keys, each)}
-                                     for each in args) if empty_string_to_none else tuple(dict(zip(to_dict_keys, each))
-                                                                                          for each in args)
-                elif nums is not None:
-                    if isinstance(args[0], str):
-                        args = (tuple(args[num] if args[num] != '' else None for num in nums),
-                                ) if empty_string_to_none else (tuple(map(args.__getitem__, nums)),)
-                    elif not hasattr(args[0], '__getitem__'):
-                        if hasattr(args[0], '__iter__'):  # list[set, Generator, range]
-                            # mysqlclient, pymysql均只支持dict, list, tuple, 不支持set, Generator等
-                            args = tuple(tuple(each[num] if each[num] != '' else None for num in nums) for each in
-                                         map(tuple, args)) if empty_string_to_none else tuple(
-                                tuple(map(each.__getitem__, nums)) for each in map(tuple, args))
-                        else:  # list[int, etc.]
-                            args = (tuple(args[num] if args[num] != '' else None for num in nums),
-                                    ) if empty_string_to_none else (tuple(map(args.__getitem__, nums)),)
-                    else:
-                        args = tuple(tuple(each[num] if each[num] != '' else None for num in nums) for each in args
-                                     ) if empty_string_to_none else tuple(
-                            tuple(map(each.__getitem__, nums)) for each in args)
-                elif isinstance(args[0], str):
-                    args = (tuple(each if each != '' else None for each in args),) if empty_string_to_none else (args,)
-                elif not hasattr(args[0], '__getitem__'):
-                    if hasattr(args[0], '__iter__'):  # list[set, Generator, range]
-                        # mysqlclient, pymysql均只支持dict, list, tuple, 不支持set, Generator等
-                        args = tuple(tuple(e if e != '' else None for e in each) for each in args
-                                     ) if empty_string_to_none else tuple(tuple(each) for each in args)
-                    else:  # list[int, etc.]
-                        args = (tuple(each if each != '' else None for each in args),) if empty_string_to_none else (
-                            args,)
-                elif empty_string_to_none:
-                    args = tuple(tuple(e if e != '' else None for e in each) for each in args)
-        return (args, keys) if not get_info else (args, keys, to_multiple, is_key_generated)
+            convert = None
+        return convert, keys, is_key_generated
+
+    @staticmethod
+    def _peek_rows(args: Iterable) -> Tuple[Optional[tuple], Optional[Iterable]]:
+        # 不可索引的可迭代对象(set, Generator, range等)预读首个元素:
+        # 为多条记录时return (None, 含首条记录的迭代器), 为单条记录或空时return (tuple, None)
+        args = iter(args)
+        first = next(args, NOTSET)
+        if first is NOTSET:
+            return (), None
+        if isinstance(first, str) or not hasattr(first, '__getitem__') and not hasattr(first, '__iter__'):
+            return (first,) + tuple(args), None
+        return None, itertools.chain((first,), args)
+
+    def _standardize_args_chunks(self, args: Any, keys: Optional[Iterable[str]] = None,
+                                 empty_string_to_none: Optional[bool] = None,
+                                 args_to_dict: Union[bool, Notset, None] = False, chunksize: int = 10000
+                                 ) -> Tuple[Optional[Iterable[str]], Iterable[Sequence]]:
+        # 以standardize_args(to_multiple=True, lazy=True)逐条转换, 按chunksize条分块, 不一次性复制整批数据
+        # return: (keys, 各块标准化后记录的迭代器); keys由首条记录确定(仅在args_to_dict=False且记录为dict且keys为None时被修改)
+        # args为单条记录时视为一条; 为Generator等不可索引的可迭代对象时只能迭代一次
+        if args is None:
+            return keys, iter(())
+        rows, keys = self.standardize_args(args, True, empty_string_to_none, args_to_dict, False, keys, lazy=True)
+        rows = iter(rows)
+        return keys, iter(lambda: tuple(itertools.islice(rows, chunksize)), ())
+
+    def _prepare_query(self, query: str, to_paramstyle: Optional[Paramstyle] = None,
+                       args_to_dict: Union[bool, Notset, None] = NOTSET, keys: Optional[Tuple[str, ...]] = None
+                       ) -> Tuple[Optional[Paramstyle], Optional[Tuple[str, ...]], Optional[list], str]:
+        # 返回预处理计划: (from_paramstyle, keys, nums, 改写后的query), 结果存入query_cache
+        # keys: 需预先转为tuple或None
+        cache_key = (query, to_paramstyle, args_to_dict, keys)
+        plan = self.query_cache.get(cache_key) if self.query_cache.maxsize else None
+        if plan is not None:
+            return plan
+        from_paramstyle = self.judge_paramstyle(query, to_paramstyle)
+        if keys is None:
+            if args_to_dict is False:
+                if from_paramstyle in (Paramstyle.pyformat, Paramstyle.named, Paramstyle.numeric):
+                    keys = tuple(self._pattern[from_paramstyle].findall(query))
+            elif to_paramstyle in (Paramstyle.pyformat, Paramstyle.named) and from_paramstyle == Paramstyle.numeric:
+                keys = tuple(self._pattern[from_paramstyle].findall(query))
+        nums = None
+        if to_paramstyle in (Paramstyle.format, Paramstyle.qmark) and from_paramstyle == Paramstyle.numeric:
+            nums = list(map(int, self._pattern[from_paramstyle].findall(query)))
+            if nums == sorted(nums):
+                nums = None
+        if from_paramstyle is None:
+            new_query = query
+            for pattern in self._pattern_esc.values():
+                new_query = pattern.sub(r'\1', new_query)
+        else:
+            new_query = self.transform_paramstyle(query, to_paramstyle, from_paramstyle)
+        plan = (from_paramstyle, keys, nums, new_query)
+        self.query_cache.put(cache_key, plan)
+        return plan
+
+    def _format_auto_query(self, query: str, arg: Union[Sequence, dict, None], keys: Optional[Tuple[str, ...]],
+                           is_key_generated: bool, to_paramstyle: Optional[Paramstyle], escape_auto_format: bool,
+                           escape_formatter: str) -> str:
+        # auto_format模式: 以keys(keys为None时以arg)填充query的字段与通配符部分, 结果存入query_cache
+        if keys is None:
+            signature = tuple(arg) if isinstance(arg, dict) and not is_key_generated else len(arg)
+        else:
+            signature = keys
+        cache_key = ('auto_format', query, to_paramstyle, signature, escape_auto_format, escape_formatter)
+        formatted_query = self.query_cache.get(cache_key) if self.query_cache.maxsize else None
+        if formatted_query is not None:
+            return formatted_query
+        if keys is None:
+            formatted_query = query.format('({})'.format(','.join(map(escape_formatter.format if escape_auto_format
+                                                                      else str, arg)))
+                                           if isinstance(arg, dict) and not is_key_generated else '',
+                                           ','.join(self.paramstyle_formatter(arg, to_paramstyle)))
+        else:
+            formatted_query = query.format('({})'.format(','.join(map(escape_formatter.format, keys)
+                                                                  if escape_auto_format else keys)),
+                                           ','.join(self.paramstyle_formatter(keys, to_paramstyle)))
+        self.query_cache.put(cache_key, formatted_query)
+        return formatted_query
+
+    def query_cache_info(self) -> dict:
+        # 返回query_cache的命中次数, 未命中次数, 最大条数, 当前条数
+        return self.query_cache.info()
 
     @classmethod
     def judge_paramstyle(cls, query: str, first: Optional[Paramstyle] = None) -> Optional[Paramstyle]:
@@ -907,6 +2353,16 @@ class SqlClient(object):
         self.set_connection()
         return self.connection.cursor(cursor_class)
 
+    def _before_query_and_get_stream_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None,
+                                            chunksize: Optional[int] = None) -> Any:
+        # 服务器端cursor(query方法stream=True时使用)
+        if fetchall and (self.dictionary if dictionary is None else dictionary):
+            cursor_class = self.lib.cursors.SSDictCursor
+        else:
+            cursor_class = self.lib.cursors.SSCursor
+        self.set_connection()
+        return self.connection.cursor(cursor_class)
+
     def _query_log_text(self, query: str, args: Any, cursor: Any = None) -> str:
         try:
             return 'formatted_query: {}'.format(self.format(query, args, True, cursor))
@@ -1,15 +1,18 @@
 # -*- coding: utf-8 -*-
 
 import functools
-from typing import Any, Union, Optional, Tuple, Iterable, Collection, Callable, Generator
+import itertools
+import time
+from typing import Any, Union, Optional, Tuple, List, Iterable, Collection, Callable, Sequence, Generator
 
 import cx_Oracle
 
-from .base import SqlClient as BaseSqlClient, Paramstyle, NOTSET, Notset
+from .base import SqlClient as BaseSqlClient, Paramstyle, NOTSET, Notset, RetryPolicy, Instrumentation
 
 
 class SqlClient(BaseSqlClient):
     lib = cx_Oracle
+    dialect = 'oracle'
 
     def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = 1521, user: Optional[str] = None,
                  password: Optional[str] = None, database: Optional[str] = None, charset: Optional[str] = 'utf8',
@@ -18,14 +21,21 @@ class SqlClient(BaseSqlClient):
                  escape_formatter: str = '"{}"', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
                  to_paramstyle: Optional[Paramstyle] = Paramstyle.numeric, try_reconnect: bool = True,
                  try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
-                 raise_error: bool = False, exc_info: Optional[bool] = None):
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 pool_size: Optional[int] = None, pool_timeout: Union[int, float, None] = 30,
+                 pool_max_lifetime: Union[int, float, None] = None, pool_max_idle: Union[int, float, None] = None,
+                 retry_policy: Optional[RetryPolicy] = None, instrumentation: Optional[Instrumentation] = None,
+                 stmtcachesize: Optional[int] = None):
         # oracle如果用双引号escape字段则区分大小写, 故默认escape_auto_format=False
         # oracle无replace语句; insert必须带into
         # 若database为空则host视为tnsname
+        # stmtcachesize: 每个连接的语句缓存大小(cx_Oracle默认20), 相同语句再次执行时复用已解析的游标; 缓存属于连接, 重连后重建
+        self.stmtcachesize = stmtcachesize
         super().__init__(host, port, user, password, database, charset, autocommit, connect_now, log, table,
                          statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
                          args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
-                         exc_info)
+                         exc_info, query_cache_size, pool_size, pool_timeout, pool_max_lifetime, pool_max_idle,
+                         retry_policy, instrumentation)
 
     @property
     def autocommit(self) -> bool:
@@ -41,6 +51,8 @@ class SqlClient(BaseSqlClient):
         self.connection = self.lib.connect(user=self.user, password=self.password, dsn='{}:{}/{}'.format(
             self.host, self.port, self.database) if self.database is not None else self.host, encoding=self.charset)
         self.connection.autocommit = self._autocommit
+        if self.stmtcachesize is not None:
+            self.connection.stmtcachesize = self.stmtcachesize
         self.connected = True
 
     def execute(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
@@ -49,28 +61,141 @@ class SqlClient(BaseSqlClient):
                 ) -> Union[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], Generator],
                            Tuple[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], Generator],
                                  cx_Oracle.Cursor]]:
-        # cx_Oracle.Cursor.execute不能传入None
         # execute执行后修改rowfactory才有效
         # fetchall=False: return成功执行语句数(executemany模式按数据条数)
         ori_cursor = cursor
         if cursor is None:
             cursor = self._before_query_and_get_cursor(fetchall, dictionary)
+        timing = self.instrumentation is not None
+        if timing:
+            started = time.perf_counter()
         if not many:
-            cursor.execute(query, () if args is None else args)
+            self._execute_statement(cursor, query, args)
         else:  # executemany: 一句插入多条记录, 当语句超出1024000字符时拆分成多个语句; 传单条记录需用列表包起来
             cursor.executemany(query, args)
         if commit and not self._autocommit:
             self.commit()
+        if timing:
+            started = self._instrument('execute', query, started, cursor.rowcount, len(query))
         if fetchall and (self.dictionary if dictionary is None else dictionary):
             cursor.rowfactory = lambda *args: dict(zip((col[0] for col in cursor.description), args))
         result = (cursor.fetchall() if chunksize is None else self._fetchmany_generator(cursor, chunksize, keep_cursor)
                   ) if fetchall else len(args) if many and hasattr(args, '__len__') else 1
+        if timing and fetchall and chunksize is None:
+            self._instrument('fetch', query, started, len(result))
         if keep_cursor:
             return result, cursor
         if ori_cursor is None and (chunksize is None or not fetchall):
             cursor.close()
         return result
 
+    def _execute_statement(self, cursor: cx_Oracle.Cursor, query: str, args: Any = None) -> None:
+        # cx_Oracle.Cursor.execute不能传入None
+        cursor.execute(query, () if args is None else args)
+
+    def save_data(self, args: Any, table: Optional[str] = None, statement: Optional[str] = None,
+                  extra: Optional[str] = None, not_one_by_one: Optional[bool] = False,
+                  keys: Union[str, Collection[str], None] = None, commit: Optional[bool] = None,
+                  escape_auto_format: Optional[bool] = None, escape_formatter: Optional[str] = None,
+                  empty_string_to_none: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
+                  time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                  exc_info: Union[bool, Notset, None] = NOTSET, batch_mode: Optional[str] = None,
+                  method: Optional[str] = None, chunksize: int = 10000) -> Union[int, tuple, list]:
+        # 增加method='array_dml'(batch_mode='values'时亦使用): 以array_dml方法批量执行, 跳过出错记录(有log)
+        if method == 'array_dml' or method is None and batch_mode == 'values':
+            return self.array_dml(args, table, statement, extra, keys, commit, escape_auto_format, escape_formatter,
+                                  empty_string_to_none, chunksize, try_times_connect=try_times_connect,
+                                  time_sleep_connect=time_sleep_connect, raise_error=raise_error,
+                                  exc_info=exc_info)[0]
+        return super().save_data(args, table, statement, extra, not_one_by_one, keys, commit, escape_auto_format,
+                                 escape_formatter, empty_string_to_none, try_times_connect, time_sleep_connect,
+                                 raise_error, exc_info, batch_mode, method, chunksize)
+
+    def array_dml(self, args: Any, table: Optional[str] = None, statement: Optional[str] = None,
+                  extra: Optional[str] = None, keys: Union[str, Collection[str], None] = None,
+                  commit: Optional[bool] = None, escape_auto_format: Optional[bool] = None,
+                  escape_formatter: Optional[str] = None, empty_string_to_none: Optional[bool] = None,
+                  chunksize: int = 10000, query: Optional[str] = None,
+                  try_times_connect: Union[int, float, None] = None,
+                  time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                  exc_info: Union[bool, Notset, None] = NOTSET) -> Tuple[int, List[Tuple[int, Any, str]]]:
+        # cx_Oracle数组DML: 按chunksize分块executemany(batcherrors=True), 以首块数据预先setinputsizes
+        # 出错记录不影响同块其它记录, 逐条log并返回
+        # return: (成功记录数, [(出错记录序号, 记录, 错误信息), ...]); 整块执行失败时该块记录不计入成功数(有log)
+        # args, table, statement, extra, keys等参数与save_data一致
+        # query: 不为None时替换save_data生成的语句(通配符需与args对应, 如'update t set b=:2 where a=:1')
+        if self.pool is not None and not self._local.depth:
+            with self._pool_session():
+                return self.array_dml(args, table, statement, extra, keys, commit, escape_auto_format,
+                                      escape_formatter, empty_string_to_none, chunksize, query, try_times_connect,
+                                      time_sleep_connect, raise_error, exc_info)
+        if escape_auto_format is None:
+            escape_auto_format = self.escape_auto_format
+        if escape_formatter is None:
+            escape_formatter = self.escape_formatter
+        if isinstance(keys, str):
+            keys = tuple(key.strip() for key in keys.split(','))
+        keys, chunks = self._standardize_args_chunks(args, keys, empty_string_to_none, False, chunksize)
+        first = next(chunks, None)
+        if not first:
+            return 0, []
+        if query is None:
+            _, _, _, query = self._prepare_query('{} {}{{}} VALUES({{}}){}'.format(
+                self.statement_save_data if statement is None else statement, self.table if table is None else table,
+                ' {}'.format(extra) if extra is not None else ''), self.to_paramstyle, False, None)
+            query = self._format_auto_query(query, first[0] if keys is None else None, keys, False,
+                                            self.to_paramstyle, escape_auto_format, escape_formatter)
+        else:
+            _, _, _, query = self._prepare_query(query, self.to_paramstyle, False, None)
+        cursor = self._before_query_and_get_cursor(False)
+        sizes = None
+        count = 0
+        offset = 0
+        errors = []
+        for chunk in itertools.chain((first,), chunks):
+            chunk_sizes = self._array_dml_input_sizes(chunk)
+            new_sizes = chunk_sizes if sizes is None else tuple(
+                old if size is None or old is not None and old >= size else size
+                for size, old in zip(chunk_sizes, sizes))
+            if new_sizes != sizes:  # 后续块字符串更长时重新声明
+                sizes = new_sizes
+                cursor.setinputsizes(*sizes)
+            chunk_errors = []
+            count += self.try_execute(query, chunk, False, None, None, True, commit, False, cursor, try_times_connect,
+                                      time_sleep_connect, raise_error, exc_info,
+                                      functools.partial(self._executemany_batcherrors, errors=chunk_errors))
+            for error in chunk_errors:
+                errors.append((offset + error.offset, chunk[error.offset], error.message))
+                if self.log:
+                    self.logger.error('{}(batch error, offset {}): {}  {}'.format(
+                        str(type(error))[8:-2], offset + error.offset, error.message,
+                        self._query_log_text(query, chunk[error.offset], cursor)))
+            offset += len(chunk)
+        cursor.close()
+        return count, errors
+
+    @staticmethod
+    def _array_dml_input_sizes(chunk: Sequence[Sequence]) -> Tuple[Optional[int], ...]:
+        # 数组DML的setinputsizes参数: 字符串列取块内最大长度, 其余列为None(由cx_Oracle推断)
+        sizes = []
+        for column in zip(*chunk):
+            lengths = [len(value) for value in column if isinstance(value, str)]
+            sizes.append(max(lengths) if lengths else None)
+        return tuple(sizes)
+
+    def _executemany_batcherrors(self, query: str, args: Any = None, fetchall: bool = True,
+                                 dictionary: Optional[bool] = None, chunksize: Optional[int] = None, many: bool = True,
+                                 commit: Optional[bool] = None, keep_cursor: Optional[bool] = False,
+                                 cursor: Optional[cx_Oracle.Cursor] = None, errors: Optional[list] = None) -> int:
+        # executemany(batcherrors=True), 出错记录(cx_Oracle._Error)追加至errors, return成功记录数
+        cursor.executemany(query, args, batcherrors=True)
+        batch_errors = cursor.getbatcherrors()
+        if commit and not self._autocommit:
+            self.commit()
+        if errors is not None:
+            errors.extend(batch_errors)
+        return len(args) - len(batch_errors)
+
     def format(self, query: str, args: Any, raise_error: Optional[bool] = None,
                cursor: Optional[cx_Oracle.Cursor] = None) -> str:
         # cx_Oracle.Connection没有literal和escape, 暂不借鉴mysql实现
@@ -88,6 +213,14 @@ class SqlClient(BaseSqlClient):
         self.set_connection()
         return self.connection.cursor()
 
+    def _before_query_and_get_stream_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None,
+                                            chunksize: Optional[int] = None) -> cx_Oracle.Cursor:
+        # cx_Oracle的cursor本身即按arraysize逐块从服务器读取结果
+        cursor = self._before_query_and_get_cursor(fetchall, dictionary)
+        if chunksize is not None:
+            cursor.arraysize = chunksize
+        return cursor
+
     def _callproc(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
                   chunksize: Optional[int] = None, many: bool = False, commit: Optional[bool] = None,
                   keep_cursor: Optional[bool] = False, cursor: Optional[cx_Oracle.Cursor] = None,
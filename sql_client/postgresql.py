@@ -1,15 +1,131 @@
 # -*- coding: utf-8 -*-
 
-from typing import Any, Union, Optional
+import io
+import re
+import queue
+import functools
+import threading
+import uuid
+import itertools
+import collections
+import weakref
+from typing import Any, Union, Optional, Tuple, Iterable, Collection, Callable, Generator
 
 import psycopg2.extras
 import psycopg2.extensions
 
-from .base import SqlClient as BaseSqlClient, Paramstyle
+from .base import SqlClient as BaseSqlClient, Paramstyle, NOTSET, Notset, RetryPolicy, Instrumentation, QueryCache
+
+_copy_escape_table = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+_copy_unescape_pattern = re.compile(r'\\(.)')
+_copy_unescape_map = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+_prepare_pattern = re.compile(r'%%|%\(([^)]+)\)s|%s')
+_preparable_pattern = re.compile(r'\s*(select|insert|update|delete|values|with)\b', re.I)
+_copy_query_pattern = re.compile(r'\s*(select|with|values|table)\b', re.I)
+
+
+def _copy_encode(value: Any) -> str:
+    # 按COPY text格式编码单个值
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.translate(_copy_escape_table)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    return str(value).translate(_copy_escape_table)
+
+
+def _prepare_plan(query: str) -> Optional[Tuple[str, Union[int, list]]]:
+    # 将format/pyformat参数的语句改写为PREPARE所用的$n参数: return (改写后语句, 参数个数或参数名列表), 两种参数混用时return None
+    names = []
+    count = 0
+
+    def repl(match):
+        nonlocal count
+        if match.group() == '%%':
+            return '%'
+        if match.group(1) is None:
+            count += 1
+            return '${}'.format(count)
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return '${}'.format(names.index(match.group(1)) + 1)
+
+    text = _prepare_pattern.sub(repl, query)
+    if count and names:
+        return None
+    return text, names or count
+
+
+def _copy_decode(value: str) -> Optional[str]:
+    # 按COPY text格式解码单个值
+    if value == '\\N':
+        return None
+    if '\\' not in value:
+        return value
+    return _copy_unescape_pattern.sub(lambda m: _copy_unescape_map.get(m.group(1), m.group(1)), value)
+
+
+class _CopyInStream(object):
+    # 供cursor.copy_expert按需read的文件对象: 从记录迭代器增量编码COPY text格式数据, 不在内存中保存整批数据
+
+    def __init__(self, rows: Iterable[Iterable]):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.count = 0
+
+    def read(self, size: int = -1) -> str:
+        pieces = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = '\t'.join(map(_copy_encode, row)) + '\n'
+            pieces.append(line)
+            length += len(line)
+            self.count += 1
+        data = ''.join(pieces)
+        if size < 0 or length <= size:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def _put_unless_stopped(data_queue: queue.Queue, item: Any, stopped: threading.Event) -> bool:
+    # copy_out读取线程向有界队列放入item, 生成器被关闭(stopped)后不再阻塞等待; return是否已放入
+    while not stopped.is_set():
+        try:
+            data_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class _CopyOutWriter(io.TextIOBase):
+    # 供cursor.copy_expert写入的文件对象: 将COPY ... TO STDOUT的数据放入有界队列, 由copy_out的生成器消费
+
+    def __init__(self, data_queue: queue.Queue, stopped: threading.Event):
+        super().__init__()
+        self._queue = data_queue
+        self._stopped = stopped
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: str) -> int:
+        if not _put_unless_stopped(self._queue, data, self._stopped):
+            raise IOError('copy_out stopped')
+        return len(data)
 
 
 class SqlClient(BaseSqlClient):
     lib = psycopg2
+    dialect = 'postgresql'
 
     def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = 5432, user: Optional[str] = None,
                  password: Optional[str] = None, database: Optional[str] = None, charset: Optional[str] = None,
@@ -18,13 +134,27 @@ class SqlClient(BaseSqlClient):
                  escape_formatter: str = '"{}"', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
                  to_paramstyle: Optional[Paramstyle] = Paramstyle.format, try_reconnect: bool = True,
                  try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
-                 raise_error: bool = False, exc_info: Optional[bool] = None):
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 pool_size: Optional[int] = None, pool_timeout: Union[int, float, None] = 30,
+                 pool_max_lifetime: Union[int, float, None] = None, pool_max_idle: Union[int, float, None] = None,
+                 retry_policy: Optional[RetryPolicy] = None, instrumentation: Optional[Instrumentation] = None,
+                 prepare: Union[bool, int] = False, prepare_cache_size: int = 100):
         # postgresql如果用双引号escape字段则区分大小写, 故默认escape_auto_format=False
         # postgresql无replace语句; insert必须带into
+        # prepare: 为True时带参数的语句(select, insert, update, delete, values, with)首次执行即PREPARE为服务器端预备语句,
+        #          之后以EXECUTE执行, 省去服务器重复解析与规划; 为整数n时同一语句执行满n次才PREPARE
+        #          (executemany与stream的命名cursor照常执行)
+        # prepare_cache_size: 每个连接最多保留的预备语句数, 超出时DEALLOCATE最久未用的; 预备语句属于连接, 重连后重新PREPARE
+        self.prepare = int(prepare)
+        self.prepare_cache_size = prepare_cache_size
+        self._prepare_plans = QueryCache(prepare_cache_size)
+        self._prepare_names = itertools.count()
+        self._prepared = weakref.WeakKeyDictionary()
         super().__init__(host, port, user, password, database, charset, autocommit, connect_now, log, table,
                          statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
                          args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
-                         exc_info)
+                         exc_info, query_cache_size, pool_size, pool_timeout, pool_max_lifetime, pool_max_idle,
+                         retry_policy, instrumentation)
 
     @property
     def autocommit(self) -> bool:
@@ -43,14 +173,19 @@ class SqlClient(BaseSqlClient):
         self.set_connection()
 
     def connect(self) -> None:
+        if self.connection is not None:
+            self._prepared.pop(self.connection, None)
         self.connection = self.lib.connect(host=self.host, port=self.port, user=self.user, password=self.password,
                                            database=self.database)
         self.connection.autocommit = self._autocommit
         self.connected = True
 
     def ping(self) -> None:
-        # psycopg2.connection没有ping
+        # psycopg2.connection没有ping, 以closed属性判断连接是否已关闭
         self.set_connection()
+        if self.connection is not None and self.connection.closed:
+            self.close()
+            self.try_connect()
 
     def format(self, query: str, args: Any, raise_error: Optional[bool] = None,
                cursor: Optional[psycopg2.extensions.cursor] = None) -> str:
@@ -75,6 +210,57 @@ class SqlClient(BaseSqlClient):
                 raise e
             return query
 
+    def _execute_statement(self, cursor: psycopg2.extensions.cursor, query: str, args: Any = None) -> None:
+        # prepare: 改为EXECUTE预备语句; 命名cursor(DECLARE)不支持EXECUTE, 照常执行
+        if self.prepare and args and cursor.name is None:
+            prepared = self._prepared_statement(cursor, query, args)
+            if prepared is not None:
+                name, query, args = prepared
+                try:
+                    cursor.execute(query, args)
+                except self.lib.Error as e:
+                    if getattr(e, 'pgcode', None) == '26000':  # 预备语句已不存在(如执行过DISCARD ALL), 下次重新PREPARE
+                        self._prepared.get(cursor.connection, {}).pop(name, None)
+                    raise e
+                return
+        cursor.execute(query, args)
+
+    def _prepared_statement(self, cursor: psycopg2.extensions.cursor, query: str, args: Any
+                            ) -> Optional[Tuple[str, str, list]]:
+        # return (预备语句名, EXECUTE语句, 参数), 不使用预备语句时return None
+        # _prepare_plans: {query: [执行次数, 预备语句名, PREPARE语句, 参数个数或参数名列表]}
+        plan = self._prepare_plans.get(query)
+        if plan is None:
+            plan = [0, None, None, None]
+            if _preparable_pattern.match(query):
+                prepare_plan = _prepare_plan(query)
+                if prepare_plan is not None:
+                    plan[1:] = 'sql_client_{}'.format(next(self._prepare_names)), prepare_plan[0], prepare_plan[1]
+            self._prepare_plans.put(query, plan)
+        if plan[1] is None:
+            return None
+        plan[0] += 1
+        if plan[0] < self.prepare:
+            return None
+        _, name, text, keys = plan
+        if isinstance(keys, list):
+            if not isinstance(args, dict):
+                return None
+            args = [args[key] for key in keys]
+        elif isinstance(args, dict) or len(args) != keys:
+            return None
+        prepared = self._prepared.get(cursor.connection)
+        if prepared is None:
+            prepared = self._prepared[cursor.connection] = collections.OrderedDict()
+        if name in prepared:
+            prepared.move_to_end(name)
+        else:
+            cursor.execute('PREPARE {} AS {}'.format(name, text))
+            prepared[name] = None
+            if len(prepared) > self.prepare_cache_size:
+                cursor.execute('DEALLOCATE {}'.format(prepared.popitem(last=False)[0]))
+        return name, 'EXECUTE {} ({})'.format(name, ', '.join(['%s'] * len(args))), args
+
     def _before_query_and_get_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None
                                      ) -> psycopg2.extensions.cursor:
         if fetchall and (self.dictionary if dictionary is None else dictionary):
@@ -83,3 +269,176 @@ class SqlClient(BaseSqlClient):
             cursor_class = None
         self.set_connection()
         return self.connection.cursor(cursor_factory=cursor_class)
+
+    def _before_query_and_get_stream_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None,
+                                            chunksize: Optional[int] = None) -> psycopg2.extensions.cursor:
+        # psycopg2的命名cursor即服务器端cursor; autocommit时需withhold(DECLARE ... WITH HOLD)
+        if fetchall and (self.dictionary if dictionary is None else dictionary):
+            cursor_class = self.lib.extras.DictCursor
+        else:
+            cursor_class = None
+        self.set_connection()
+        cursor = self.connection.cursor('sql_client_{}'.format(uuid.uuid4().hex), cursor_factory=cursor_class,
+                                        withhold=self._autocommit)
+        if chunksize is not None:
+            cursor.itersize = chunksize
+        return cursor
+
+    def save_data(self, args: Any, table: Optional[str] = None, statement: Optional[str] = None,
+                  extra: Optional[str] = None, not_one_by_one: Optional[bool] = False,
+                  keys: Union[str, Collection[str], None] = None, commit: Optional[bool] = None,
+                  escape_auto_format: Optional[bool] = None, escape_formatter: Optional[str] = None,
+                  empty_string_to_none: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
+                  time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                  exc_info: Union[bool, Notset, None] = NOTSET, batch_mode: Optional[str] = None,
+                  method: Optional[str] = None, chunksize: int = 10000) -> Union[int, tuple, list]:
+        # 增加method='copy': 以copy_in流式导入(忽略statement, extra, not_one_by_one, batch_mode)
+        if method == 'copy':
+            return self.copy_in(args, table, keys, commit, escape_auto_format, escape_formatter, empty_string_to_none,
+                                chunksize, try_times_connect=try_times_connect, time_sleep_connect=time_sleep_connect,
+                                raise_error=raise_error, exc_info=exc_info)
+        return super().save_data(args, table, statement, extra, not_one_by_one, keys, commit, escape_auto_format,
+                                 escape_formatter, empty_string_to_none, try_times_connect, time_sleep_connect,
+                                 raise_error, exc_info, batch_mode, method, chunksize)
+
+    def copy_in(self, args: Any, table: Optional[str] = None, keys: Union[str, Collection[str], None] = None,
+                commit: Optional[bool] = None, escape_auto_format: Optional[bool] = None,
+                escape_formatter: Optional[str] = None, empty_string_to_none: Optional[bool] = None,
+                chunksize: int = 10000, size: int = 65536, try_times_connect: Union[int, float, None] = None,
+                time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
+                exc_info: Union[bool, Notset, None] = NOTSET) -> int:
+        # 以COPY ... FROM STDIN流式导入数据, return导入的记录数
+        # args: 与save_data一致, 亦支持Generator等迭代器(此时不重试, 因无法重新迭代)
+        # chunksize: 每次标准化(standardize_args)的记录数; size: 每次向服务器发送的字符数
+        if self.pool is not None and not self._local.depth:
+            with self._pool_session():
+                return self.copy_in(args, table, keys, commit, escape_auto_format, escape_formatter,
+                                    empty_string_to_none, chunksize, size, try_times_connect, time_sleep_connect,
+                                    raise_error, exc_info)
+        if table is None:
+            table = self.table
+        if escape_auto_format is None:
+            escape_auto_format = self.escape_auto_format
+        if escape_formatter is None:
+            escape_formatter = self.escape_formatter
+        if isinstance(keys, str):
+            keys = tuple(key.strip() for key in keys.split(','))
+        if not hasattr(args, '__getitem__') and hasattr(args, '__iter__'):  # Generator等只能迭代一次
+            try_times_connect = 1
+        elif args is None or hasattr(args, '__len__') and not isinstance(args, str) and not args:
+            return 0
+        keys, chunks = self._standardize_args_chunks(args, keys, empty_string_to_none, False, chunksize)
+        if hasattr(args, '__getitem__'):  # 重试时重新标准化
+            get_rows = functools.partial(self._iter_copy_rows, args, keys, empty_string_to_none, chunksize)
+        else:
+            rows = (row for chunk in chunks for row in chunk)
+            get_rows = functools.partial(iter, rows)
+        query = 'COPY {}{} FROM STDIN'.format(table, '({})'.format(','.join(
+            map(escape_formatter.format, keys) if escape_auto_format else keys)) if keys is not None else '')
+        return self.try_execute(query, None, False, None, None, False, commit, False, None, try_times_connect,
+                                time_sleep_connect, raise_error, exc_info,
+                                functools.partial(self._copy_in, get_rows=get_rows, size=size))
+
+    def _iter_copy_rows(self, args: Any, keys: Optional[Iterable[str]] = None,
+                        empty_string_to_none: Optional[bool] = None, chunksize: int = 10000) -> Iterable[Iterable]:
+        _, chunks = self._standardize_args_chunks(args, keys, empty_string_to_none, False, chunksize)
+        return (row for chunk in chunks for row in chunk)
+
+    def _copy_in(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
+                 chunksize: Optional[int] = None, many: bool = False, commit: Optional[bool] = None,
+                 keep_cursor: Optional[bool] = False, cursor: Optional[psycopg2.extensions.cursor] = None,
+                 get_rows: Optional[Callable[[], Iterable[Iterable]]] = None, size: int = 65536) -> int:
+        # copy_in的执行部分, 由try_execute调用
+        ori_cursor = cursor
+        if cursor is None:
+            cursor = self._before_query_and_get_cursor(False, dictionary)
+        stream = _CopyInStream(get_rows())
+        cursor.copy_expert(query, stream, size)
+        if commit and not self._autocommit:
+            self.commit()
+        if ori_cursor is None:
+            cursor.close()
+        return stream.count
+
+    def copy_out(self, query: str, args: Any = None, raw: bool = False, chunksize: Optional[int] = None,
+                 empty_string_to_none: Optional[bool] = None, size: int = 65536, queue_size: int = 64
+                 ) -> Generator[Union[str, Tuple[Optional[str], ...], list], None, None]:
+        # 以COPY (query) TO STDOUT流式导出查询结果的生成器, 内存占用不随结果集大小增长
+        # query: 查询语句(以select, with, values, table开头)或表名(可含列名列表), 通配符及args与query方法一致
+        # raw=True: 逐块yield COPY text格式原始文本; raw=False: 逐条yield记录tuple(值均为str或None)
+        # chunksize: raw=False时若传入, 则每chunksize条记录yield一个list
+        # size: 每次从服务器读取的字节数; queue_size: 读取线程与生成器之间缓冲的最大块数
+        # 调用时即取得连接与cursor, 连接池模式下连接随生成器耗尽/关闭归还(见_lease_connection)
+        if self.pool is not None and not self._local.depth:
+            with self._pool_session(True):
+                return self._lease_connection(self.copy_out(query, args, raw, chunksize, empty_string_to_none, size,
+                                                            queue_size))
+        if args is not None:
+            to_paramstyle = self.to_paramstyle
+            args_to_dict = self.args_to_dict if to_paramstyle is None else to_paramstyle in (Paramstyle.pyformat,
+                                                                                                Paramstyle.named)
+            _, keys, nums, query = self._prepare_query(query, to_paramstyle, args_to_dict, None)
+            args, _ = self.standardize_args(args, False, empty_string_to_none, args_to_dict, False, keys, nums)
+        cursor = self._before_query_and_get_cursor(False)
+        if args is not None:
+            query = cursor.mogrify(query, args).decode(psycopg2.extensions.encodings[self.connection.encoding])
+        query = 'COPY {} TO STDOUT'.format('({})'.format(query) if _copy_query_pattern.match(query) else query)
+        return self._copy_out_generator(self.connection, cursor, query, raw, chunksize, size, queue_size,
+                                        self._autocommit)
+
+    @staticmethod
+    def _copy_out_generator(connection: psycopg2.extensions.connection, cursor: psycopg2.extensions.cursor,
+                            query: str, raw: bool = False, chunksize: Optional[int] = None, size: int = 65536,
+                            queue_size: int = 64, autocommit: bool = True
+                            ) -> Generator[Union[str, Tuple[Optional[str], ...], list], None, None]:
+        # copy_out的生成器部分: 只使用传入的connection与cursor(连接池模式下生成器可能在其它线程中消费)
+        data_queue = queue.Queue(queue_size)
+        stopped = threading.Event()
+        completed = threading.Event()
+
+        def produce():
+            try:
+                cursor.copy_expert(query, _CopyOutWriter(data_queue, stopped), size)
+                completed.set()
+                _put_unless_stopped(data_queue, None, stopped)
+            except Exception as e:
+                _put_unless_stopped(data_queue, e, stopped)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        finished = False
+        try:
+            rest = ''
+            rows = []
+            while True:
+                data = data_queue.get()
+                if data is None:
+                    finished = True
+                    break
+                if isinstance(data, Exception):
+                    raise data
+                if raw:
+                    yield data
+                    continue
+                lines = (rest + data).split('\n')
+                rest = lines.pop()
+                for line in lines:
+                    row = tuple(map(_copy_decode, line.split('\t')))
+                    if chunksize is None:
+                        yield row
+                    else:
+                        rows.append(row)
+                        if len(rows) >= chunksize:
+                            yield rows
+                            rows = []
+            if rows:
+                yield rows
+        finally:
+            if not finished:
+                # 生成器被提前关闭或出错: 中止仍在进行的COPY; 被取消或出错的事务已不可用, 须回滚
+                stopped.set()
+                connection.cancel()
+                thread.join()
+                if not autocommit and not completed.is_set():
+                    connection.rollback()
+            cursor.close()
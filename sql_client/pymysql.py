@@ -4,11 +4,12 @@ from typing import Union, Optional
 
 import pymysql
 
-from .base import SqlClient as BaseSqlClient, Paramstyle, NOTSET, Notset
+from .base import SqlClient as BaseSqlClient, Paramstyle, NOTSET, Notset, RetryPolicy, Instrumentation
 
 
 class SqlClient(BaseSqlClient):
     lib = pymysql
+    dialect = 'mysql'
 
     def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = 3306, user: Optional[str] = None,
                  password: Optional[str] = None, database: Optional[str] = None, charset: Optional[str] = 'utf8mb4',
@@ -17,11 +18,25 @@ class SqlClient(BaseSqlClient):
                  escape_formatter: str = '`{}`', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
                  to_paramstyle: Optional[Paramstyle] = Paramstyle.format, try_reconnect: bool = True,
                  try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
-                 raise_error: bool = False, exc_info: Optional[bool] = None):
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 pool_size: Optional[int] = None, pool_timeout: Union[int, float, None] = 30,
+                 pool_max_lifetime: Union[int, float, None] = None, pool_max_idle: Union[int, float, None] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 local_infile: bool = False):
+        # local_infile: 连接时开启LOAD DATA LOCAL INFILE(load_data方法, save_data方法method='load_data'时需要)
+        self.local_infile = local_infile
         super().__init__(host, port, user, password, database, charset, autocommit, connect_now, log, table,
                          statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
                          args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
-                         exc_info)
+                         exc_info, query_cache_size, pool_size, pool_timeout, pool_max_lifetime, pool_max_idle,
+                         retry_policy, instrumentation)
+
+    def connect(self) -> None:
+        self.connection = self.lib.connect(host=self.host, port=self.port, user=self.user, password=self.password,
+                                           database=self.database, charset=self.charset, autocommit=self._autocommit,
+                                           local_infile=self.local_infile)
+        self.connected = True
 
     def reconnect(self, exc_info: Union[bool, Notset, None] = NOTSET) -> None:
         if self.connection is not None:
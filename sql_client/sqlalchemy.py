@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
 import functools
 from typing import Any, Union, Optional, Tuple, List, Iterable, Collection, Callable, Generator
 
 import tablib
 import sqlalchemy
 
-from .base import SqlClient as BaseSqlClient, Paramstyle, NOTSET, Notset
-from ._records import RecordCollection, Record
+from .base import (SqlClient as BaseSqlClient, Paramstyle, NOTSET, Notset, ColumnTable, RetryPolicy, Instrumentation,
+                   QueryCache)
+from ._records import RecordCollection, records
 
 
 class SqlClient(BaseSqlClient):
@@ -25,13 +27,17 @@ class SqlClient(BaseSqlClient):
                  try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
                  raise_error: bool = False, exc_info: Optional[bool] = None, origin_result: bool = False,
                  dataset: bool = False, is_pool: bool = False, pool_size: int = 1, engine_kwargs: Optional[dict] = None,
-                 **kwargs):
+                 query_cache_size: Optional[int] = 256, retry_policy: Optional[RetryPolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None, prepare: bool = False,
+                 prepare_cache_size: int = 256, **kwargs):
         # dialect也可输入完整url; 或者将完整url存于环境变量：DATABASE_URL
         # 完整url格式：dialect[+driver]://user:password@host/dbname[?key=value..]
         # 对user和password影响sqlalchemy解析url的字符进行转义(sqlalchemy解析完url会对user和password解转义) (若从dialect或环境变量传入整个url, 需提前转义好)
         # sqlalchemy不会对database进行解转义, 故database含?时需移至engine_kwargs['connect_args']['database']
         # sqlalchemy 1.3: database含@时也需移至engine_kwargs['connect_args']['database']
         # 优先级: dictionary > origin_result > dataset
+        # prepare: 缓存语句的TextClause(省去重复解析:name参数)并开启compiled_cache, 重复语句跳过sqlalchemy的编译;
+        #          prepare_cache_size为两者的大小; 编译结果与连接无关, 重连后仍有效(服务器端预备语句见postgresql, oracle模块)
         if engine_kwargs is None:
             engine_kwargs = {}
         if dialect is None:
@@ -93,6 +99,10 @@ class SqlClient(BaseSqlClient):
         if charset is not None:
             kwargs['charset' if dialect != 'oracle' else 'encoding'] = charset
         engine_kwargs.setdefault('execution_options', {})['autocommit'] = autocommit
+        if prepare:
+            engine_kwargs['execution_options'].setdefault('compiled_cache',
+                                                          sqlalchemy.util.LRUCache(prepare_cache_size))
+        self._text_cache = QueryCache(prepare_cache_size) if prepare else None
         if kwargs:
             if engine_kwargs.get('connect_args'):
                 engine_kwargs['connect_args'].update(kwargs)
@@ -114,7 +124,8 @@ class SqlClient(BaseSqlClient):
         super().__init__(host, port, user, password, database, charset, autocommit, connect_now, log, table,
                          statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
                          args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
-                         exc_info)
+                         exc_info, query_cache_size, retry_policy=retry_policy,
+                         instrumentation=instrumentation)
 
     def query(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
               chunksize: Optional[int] = None, not_one_by_one: bool = True, auto_format: bool = False,
@@ -125,11 +136,12 @@ class SqlClient(BaseSqlClient):
               cursor: None = None, try_times_connect: Union[int, float, None] = None,
               time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
               exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None,
-              origin_result: Optional[bool] = None, dataset: Optional[bool] = None
+              origin_result: Optional[bool] = None, dataset: Optional[bool] = None, stream: bool = False,
+              columnar: Union[bool, str] = False
               ) -> Union[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], RecordCollection,
-                               tablib.Dataset, Generator],
+                               tablib.Dataset, Generator, ColumnTable],
                          Tuple[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], RecordCollection,
-                                     tablib.Dataset, Generator], sqlalchemy.engine.ResultProxy]]:
+                                     tablib.Dataset, Generator, ColumnTable], sqlalchemy.engine.ResultProxy]]:
         # sqlalchemy无cursor; 增加origin_result, dataset参数
         # args 支持单条记录: list/tuple/dict, 或多条记录: list/tuple/set[list/tuple/dict]
         # auto_format=True: 注意此时query会被format一次; args_to_dict视为False;
@@ -138,8 +150,15 @@ class SqlClient(BaseSqlClient):
         # args_to_dict=None: 不做dict和list之间转换; args_to_dict=False: dict强制转为list; args_to_dict=NOTSET: 读取默认配置
         # keep_cursor: 返回(result, cursor), 并且不自动关闭cursor;
         #              如果args为多条记录且not_one_by_one=False且设置了chunksize且fetchall=True(仅此情况会使用多个cursor), 则只会保留最后一个cursor
+        # stream=True: 设置了chunksize且fetchall=True时, 以execution_options(stream_results=True)使用服务器端cursor逐块获取结果
+        # columnar=True: fetchall=True时返回按列存储的ColumnTable(见base.query); 此时origin_result, dataset无效
         if call is None:
-            call = functools.partial(self.try_execute, call=None, origin_result=origin_result, dataset=dataset)
+            if columnar:
+                call = functools.partial(self.try_execute, call=functools.partial(
+                    self._execute_columnar, numpy=columnar == 'numpy', stream=stream))
+            else:
+                call = functools.partial(self.try_execute, call=None, origin_result=origin_result, dataset=dataset,
+                                         stream=stream)
         return super().query(query, args, fetchall, dictionary, chunksize, not_one_by_one, auto_format, keys, commit,
                              escape_auto_format, escape_formatter, empty_string_to_none, args_to_dict, to_paramstyle,
                              keep_cursor, cursor, try_times_connect, time_sleep_connect, raise_error, exc_info, call)
@@ -158,7 +177,9 @@ class SqlClient(BaseSqlClient):
                       empty_string_to_none: Optional[bool] = None, try_times_connect: Union[int, float, None] = None,
                       time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
                       exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None,
-                      origin_result: Optional[bool] = None, dataset: Optional[bool] = None
+                      origin_result: Optional[bool] = None, dataset: Optional[bool] = None,
+                      skip_locked: bool = False, nowait: bool = False, returning: bool = False,
+                      lease_seconds: Union[int, float, None] = None
                       ) -> Union[int, tuple, list, RecordCollection, tablib.Dataset]:
         # 增加origin_result, dataset参数
         # key_fields: update一句where部分使用
@@ -174,13 +195,21 @@ class SqlClient(BaseSqlClient):
         # select_where: 不为None则替换select一句的where部分(为''时删除where)
         # update_set: 不为None则替换update一句的set部分
         # update_where: 不为None则替换update一句的where部分
+        # skip_locked=True: 跳过已被其它事务锁定的行(FOR UPDATE SKIP LOCKED; mssql: READPAST), 多个进程并发领取时互不阻塞
+        # nowait=True: 遇到已被锁定的行时立即报错而不等待(FOR UPDATE NOWAIT); skip_locked, nowait仅lock=True时有效
+        # returning=True: postgresql, mssql以单条UPDATE ... RETURNING/OUTPUT语句完成选取和update(一次往返, 不显式开启事务),
+        #                 返回结果中被update的字段为update后的值, 不保证按select_extra排序;
+        #                 其它dialect或传入update_where时仍为begin, select, update, commit四步
+        # lease_seconds: 租约秒数, 不为None时next_time_field设为当前时间+lease_seconds(租约到期时间, 代替next_time_after),
+        #                需传入next_time_field; 租约到期仍未end_try的任务(如进程崩溃)由reclaim_expired回收
         if call is None:
             call = functools.partial(self.try_execute, call=None, origin_result=origin_result, dataset=dataset)
         return super().select_to_try(table, num, key_fields, extra_fields, tried_field, tried, tried_min, tried_max,
                                      tried_after, finished_field, finished, next_time_field, next_time, next_time_after,
                                      lock, dictionary, autocommit_after, select_where, select_extra, set_extra,
                                      update_set, update_where, update_extra, empty_string_to_none, try_times_connect,
-                                     time_sleep_connect, raise_error, exc_info, call)
+                                     time_sleep_connect, raise_error, exc_info, call, skip_locked, nowait,
+                                     returning, lease_seconds)
 
     def close(self, try_close: bool = True) -> None:
         self.connected = False
@@ -250,27 +279,27 @@ class SqlClient(BaseSqlClient):
                     try_times_connect: Union[int, float, None] = None,
                     time_sleep_connect: Union[int, float, None] = None, raise_error: Optional[bool] = None,
                     exc_info: Union[bool, Notset, None] = NOTSET, call: Optional[Callable] = None,
-                    origin_result: Optional[bool] = None, dataset: Optional[bool] = None
+                    origin_result: Optional[bool] = None, dataset: Optional[bool] = None, stream: bool = False
                     ) -> Union[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], RecordCollection,
                                      tablib.Dataset, Generator],
                                Tuple[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], RecordCollection,
                                            tablib.Dataset, Generator], sqlalchemy.engine.ResultProxy]]:
-        # 增加origin_result, dataset参数
+        # 增加origin_result, dataset, stream参数
         # fetchall=False: return成功执行语句数(executemany模式按数据条数)
         if call is None:
-            call = functools.partial(self.execute, origin_result=origin_result, dataset=dataset)
+            call = functools.partial(self.execute, origin_result=origin_result, dataset=dataset, stream=stream)
         return super().try_execute(query, args, fetchall, dictionary, chunksize, many, commit, keep_cursor, cursor,
                                    try_times_connect, time_sleep_connect, raise_error, exc_info, call)
 
     def execute(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
                 chunksize: Optional[int] = None, many: bool = False, commit: Optional[bool] = None,
                 keep_cursor: Optional[bool] = False, cursor: None = None, origin_result: Optional[bool] = None,
-                dataset: Optional[bool] = None
+                dataset: Optional[bool] = None, stream: bool = False
                 ) -> Union[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], RecordCollection,
                                  tablib.Dataset, Generator],
                            Tuple[Union[int, list, tuple, Tuple[Union[tuple, list, dict, Any]], RecordCollection,
                                        tablib.Dataset, Generator], sqlalchemy.engine.ResultProxy]]:
-        # 覆盖调用逻辑; 增加origin_result, dataset参数
+        # 覆盖调用逻辑; 增加origin_result, dataset, stream参数
         # fetchall=False: return成功执行语句数(many模式按数据条数)
         if dictionary is None:
             dictionary = self.dictionary
@@ -279,47 +308,105 @@ class SqlClient(BaseSqlClient):
         if dataset is None:
             dataset = self.dataset
         self.set_connection()
+        if stream and fetchall and chunksize is not None:
+            connection = self.connection.execution_options(stream_results=True)
+        else:
+            connection = self.connection
+        timing = self.instrumentation is not None
+        if timing:
+            started = time.perf_counter()
         if args is None:
-            cursor = self.connection.execute(sqlalchemy.text(query))
+            cursor = connection.execute(self._text(query))
         elif not many:
             if isinstance(args, dict):
-                cursor = self.connection.execute(sqlalchemy.text(query), **args)
+                cursor = connection.execute(self._text(query), **args)
             else:
-                cursor = self.connection.execute(sqlalchemy.text(query % args))
+                cursor = connection.execute(sqlalchemy.text(query % args))
         else:
-            cursor = self.connection.execute(sqlalchemy.text(query), *args)
+            cursor = connection.execute(self._text(query), *args)
         if commit and not self._autocommit:
             self.commit()
+        if timing:
+            started = self._instrument('execute', query, started, cursor.rowcount, len(query))
         if not fetchall:
             result = len(args) if many and hasattr(args, '__len__') else 1
         elif origin_result and not dictionary:
             result = (list(cursor) if chunksize is None else map(list, self._fetchmany_generator(
                 cursor, chunksize, keep_cursor))) if cursor.returns_rows else []
+            if timing and chunksize is None:
+                self._instrument('fetch', query, started, len(result))
         elif chunksize is not None and cursor.returns_rows:
             if dictionary:
-                result = (RecordCollection(Record(cursor.keys(), row) for row in result).all(as_dict=True) for result in
+                result = (RecordCollection(records(cursor.keys(), result)).all(as_dict=True) for result in
                           self._fetchmany_generator(cursor, chunksize, keep_cursor))
             elif dataset:
-                result = (RecordCollection(Record(cursor.keys(), row) for row in result).dataset for result in
+                result = (RecordCollection(records(cursor.keys(), result)).dataset for result in
                           self._fetchmany_generator(cursor, chunksize, keep_cursor))
             else:
-                result = (RecordCollection(Record(cursor.keys(), row) for row in result) for result in
+                result = (RecordCollection(records(cursor.keys(), result)) for result in
                           self._fetchmany_generator(cursor, chunksize, keep_cursor))
         else:
             if cursor.returns_rows:
-                result = RecordCollection(Record(cursor.keys(), row) for row in cursor)
+                rows = cursor
+                if timing:  # 分开计时fetch与convert
+                    rows = cursor.fetchall()
+                    started = self._instrument('fetch', query, started, len(rows))
+                result = RecordCollection(records(cursor.keys(), rows))
             else:
                 result = RecordCollection()
             if dictionary:
                 result = result.all(as_dict=True)
             elif dataset:
                 result = result.dataset
+            if timing:
+                self._instrument('convert', query, started, len(result))
         if keep_cursor:
             return result, cursor
         if chunksize is None or not fetchall:
             cursor.close()
         return result
 
+    def _execute_columnar(self, query: str, args: Any = None, fetchall: bool = True,
+                          dictionary: Optional[bool] = None, chunksize: Optional[int] = None, many: bool = False,
+                          commit: Optional[bool] = None, keep_cursor: Optional[bool] = False, cursor: None = None,
+                          numpy: bool = False, stream: bool = False
+                          ) -> Union[int, ColumnTable, Tuple[Union[int, ColumnTable], sqlalchemy.engine.ResultProxy]]:
+        # sqlalchemy无cursor; 增加stream参数
+        result, cursor = self.execute(query, args, fetchall, False, chunksize or 10000, many, commit, True, None, True,
+                                      False, stream)
+        if fetchall:
+            result = ColumnTable.from_chunks(cursor.keys() if cursor.returns_rows else (), result, numpy)
+        if keep_cursor:
+            return result, cursor
+        cursor.close()
+        return result
+
+    def _text(self, query: str) -> sqlalchemy.sql.elements.TextClause:
+        if self._text_cache is None:
+            return sqlalchemy.text(query)
+        text = self._text_cache.get(query)
+        if text is None:
+            text = sqlalchemy.text(query)
+            self._text_cache.put(query, text)
+        return text
+
+    def _execute_rowcount(self, query: str, args: Any = None, fetchall: bool = True, dictionary: Optional[bool] = None,
+                          chunksize: Optional[int] = None, many: bool = False, commit: Optional[bool] = None,
+                          keep_cursor: Optional[bool] = False, cursor: None = None) -> int:
+        # sqlalchemy无cursor
+        self.set_connection()
+        if self.instrumentation is not None:
+            started = time.perf_counter()
+        cursor = self.connection.execute(self._text(query), args) if args else self.connection.execute(
+            self._text(query))
+        if commit and not self._autocommit:
+            self.commit()
+        result = cursor.rowcount
+        if self.instrumentation is not None:
+            self._instrument('execute', query, started, result, len(query))
+        cursor.close()
+        return result
+
     def ping(self) -> None:
         # sqlalchemy没有ping
         self.set_connection()
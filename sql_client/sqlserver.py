@@ -4,11 +4,12 @@ from typing import Any, Union, Optional
 
 import pymssql
 
-from .base import SqlClient as BaseSqlClient, Paramstyle
+from .base import SqlClient as BaseSqlClient, Paramstyle, RetryPolicy, Instrumentation
 
 
 class SqlClient(BaseSqlClient):
     lib = pymssql
+    dialect = 'mssql'
 
     def __init__(self, host: Optional[str] = None, port: Union[int, str, None] = 1433, user: Optional[str] = None,
                  password: Optional[str] = None, database: Optional[str] = None, charset: Optional[str] = 'utf8',
@@ -17,12 +18,17 @@ class SqlClient(BaseSqlClient):
                  escape_formatter: str = '[{}]', empty_string_to_none: bool = True, args_to_dict: Optional[bool] = None,
                  to_paramstyle: Optional[Paramstyle] = Paramstyle.format, try_reconnect: bool = True,
                  try_times_connect: Union[int, float] = 3, time_sleep_connect: Union[int, float] = 3,
-                 raise_error: bool = False, exc_info: Optional[bool] = None):
+                 raise_error: bool = False, exc_info: Optional[bool] = None, query_cache_size: Optional[int] = 256,
+                 pool_size: Optional[int] = None, pool_timeout: Union[int, float, None] = 30,
+                 pool_max_lifetime: Union[int, float, None] = None, pool_max_idle: Union[int, float, None] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 instrumentation: Optional[Instrumentation] = None):
         # sqlserver无replace语句
         super().__init__(host, port, user, password, database, charset, autocommit, connect_now, log, table,
                          statement_save_data, dictionary, escape_auto_format, escape_formatter, empty_string_to_none,
                          args_to_dict, to_paramstyle, try_reconnect, try_times_connect, time_sleep_connect, raise_error,
-                         exc_info)
+                         exc_info, query_cache_size, pool_size, pool_timeout, pool_max_lifetime, pool_max_idle,
+                         retry_policy, instrumentation)
 
     def begin(self) -> None:
         # sqlserver库无begin, 只有commit和rollback
@@ -59,3 +65,8 @@ class SqlClient(BaseSqlClient):
             self.dictionary = dictionary
         self.set_connection()
         return self.connection.cursor()
+
+    def _before_query_and_get_stream_cursor(self, fetchall: bool = True, dictionary: Optional[bool] = None,
+                                            chunksize: Optional[int] = None) -> pymssql.Cursor:
+        # pymssql没有服务器端cursor, 但fetchmany本身即逐块从服务器读取结果
+        return self._before_query_and_get_cursor(fetchall, dictionary)
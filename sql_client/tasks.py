@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import atexit
+import threading
+import collections
+import concurrent.futures
+from typing import Any, Union, Optional, Iterable, Callable, Tuple
+
+from .base import SqlClient
+
+
+class TaskRunner(object):
+    # 围绕任务表协议(select_to_try -> 处理 -> end_try/fail_try)的任务循环:
+    # 按batch_size批量领取任务, 交给线程池/进程池并发处理(func(row)), 处理完成的任务攒批后以一条end_try/fail_try提交;
+    # 自适应轮询: 上次领取满额时立即再次领取, 领取为空时等待时间从poll_interval起按backoff倍数增长至max_poll_interval
+    # db: 仅在调用run的线程中使用
+    # func: 处理单个任务(select_to_try返回的一行), 正常返回视为成功(end_try), raise视为失败(fail_try);
+    #       executor='process'时func与行需可pickle
+    # workers: 并发数; executor: 'thread', 'process', 或者自行传入concurrent.futures.Executor(不会被关闭)
+    # batch_size: 每次领取的最大任务数; 在途(已领取未完成)任务至多2 * workers个, 即每次领取min(batch_size, 空余名额)个
+    # tried_field, finished_field, next_time_field: 同时传给select_to_try, end_try, fail_try, cancel_try
+    # select_kwargs, end_kwargs, fail_kwargs: 分别额外传给select_to_try, end_try, fail_try的参数(如lock, skip_locked, tried)
+    # flush_size, flush_interval: 完成的任务达到flush_size条或距上次提交超过flush_interval秒时提交
+    # max_tasks: 领取任务总数上限, 达到后处理完已领取的任务即结束; stop_when_idle: 领取为空且没有处理中的任务时结束
+    # stop()或run中出错时: 尚未开始处理的任务以cancel_try恢复原状, 已开始的任务等待完成并提交
+
+    def __init__(self, db: SqlClient, func: Callable[[Any], Any], table: Optional[str] = None, batch_size: int = 10,
+                 workers: int = 4, executor: Union[str, concurrent.futures.Executor] = 'thread',
+                 key_fields: Union[str, Iterable[str]] = 'id', extra_fields: Union[str, Iterable[str], None] = '',
+                 tried_field: Optional[str] = None, finished_field: Optional[str] = None,
+                 next_time_field: Optional[str] = None, select_kwargs: Optional[dict] = None,
+                 end_kwargs: Optional[dict] = None, fail_kwargs: Optional[dict] = None, flush_size: int = 100,
+                 flush_interval: Union[int, float] = 1, poll_interval: Union[int, float] = 0.1,
+                 max_poll_interval: Union[int, float] = 30, backoff: Union[int, float] = 2,
+                 max_tasks: Optional[int] = None, stop_when_idle: bool = False, log: bool = True):
+        self.db = db
+        self.func = func
+        self.table = db.table if table is None else table
+        self.batch_size = batch_size
+        self.workers = workers
+        self.executor = executor
+        self.key_fields = [key.strip() for key in key_fields.split(',')] if isinstance(key_fields, str) else list(
+            key_fields)
+        self.extra_fields = extra_fields
+        self.tried_field = tried_field
+        self.finished_field = finished_field
+        self.next_time_field = next_time_field
+        self.select_kwargs = {} if select_kwargs is None else select_kwargs
+        self.end_kwargs = {} if end_kwargs is None else end_kwargs
+        self.fail_kwargs = {} if fail_kwargs is None else fail_kwargs
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.max_tasks = max_tasks
+        self.stop_when_idle = stop_when_idle
+        self.log = log
+        if log:
+            self.logger = logging.getLogger(__name__)
+        self._stop_event = threading.Event()
+        self.completions = self._completion_buffer()
+        self._reset_metrics()
+
+    def _completion_buffer(self) -> 'CompletionBuffer':
+        # 由run所在线程检查提交条件, 不启动后台线程, 保证db只在该线程中使用
+        return CompletionBuffer(self.db, self.table, self.key_fields, self.tried_field, self.finished_field,
+                                self.next_time_field, self.end_kwargs, self.fail_kwargs, None, self.flush_size,
+                                self.flush_interval, False, self.log)
+
+    def run(self) -> dict:
+        # 阻塞运行直至stop()或满足max_tasks, stop_when_idle条件, return metrics()
+        # 每次run使用新的CompletionBuffer(上次run结束时已close), 故同一TaskRunner可多次run
+        self._stop_event.clear()
+        self._reset_metrics()
+        self.completions = self._completion_buffer()
+        if isinstance(self.executor, str):
+            executor = (concurrent.futures.ProcessPoolExecutor if self.executor == 'process' else
+                        concurrent.futures.ThreadPoolExecutor)(self.workers)
+        else:
+            executor = self.executor
+        pending = {}
+        interval = self.poll_interval
+        try:
+            while not self._stop_event.is_set():
+                # 保持至多两倍workers个任务在途, 使处理线程/进程不因等待领取而空闲
+                num = min(self.batch_size, self.workers * 2 - len(pending))
+                if self.max_tasks is not None:
+                    num = min(num, self.max_tasks - self._metrics['claimed'])
+                    if num <= 0 and not pending:
+                        break
+                rows = self._claim(num) if num > 0 else ()
+                for row in rows:
+                    pending[executor.submit(self.func, row)] = (row, time.monotonic())
+                if rows and len(rows) >= num:
+                    interval = self.poll_interval
+                    timeout = 0
+                elif rows or num <= 0:
+                    interval = self.poll_interval
+                    timeout = self.flush_interval
+                else:
+                    if not pending and self.stop_when_idle:
+                        break
+                    timeout = interval
+                    interval = min(interval * self.backoff, self.max_poll_interval)
+                if pending:
+                    done, _ = concurrent.futures.wait(pending, timeout,
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                    self._complete(done, pending)
+                elif timeout:
+                    self._stop_event.wait(timeout)
+                self.flush(False)
+        finally:
+            cancelled = [pending.pop(future)[0] for future in tuple(pending) if future.cancel()]
+            if pending:
+                self._complete(concurrent.futures.wait(pending)[0], pending)
+            if cancelled:
+                self.completions.cancel(cancelled)
+            self.completions.close()
+            if isinstance(self.executor, str):
+                executor.shutdown()
+            self._metrics['end'] = time.monotonic()
+        return self.metrics()
+
+    def stop(self) -> None:
+        # 可在其它线程或func中调用
+        self._stop_event.set()
+
+    def flush(self, force: bool = True) -> None:
+        # 提交已完成的任务(见CompletionBuffer); force=False时仅在达到flush_size或flush_interval时提交
+        self.completions.flush(force)
+
+    def metrics(self) -> dict:
+        # claimed: 领取任务数; succeeded, failed: 处理成功, 失败数; claims: 领取次数; empty_claims: 领取为空的次数;
+        # claim_conflicts: 领取时select_to_try出错(锁等待超时, 死锁, nowait等)的次数;
+        # throughput: 每秒处理完成的任务数; latency_avg, latency_max: 单个任务从提交处理到完成的平均, 最大秒数;
+        # claim_latency_avg: 单次领取的平均秒数
+        metrics = dict(self._metrics)
+        elapsed = (metrics.pop('end') or time.monotonic()) - metrics.pop('start')
+        completed = metrics['succeeded'] + metrics['failed']
+        metrics['elapsed'] = elapsed
+        metrics['throughput'] = completed / elapsed if elapsed > 0 else 0.0
+        metrics['latency_avg'] = metrics.pop('latency_total') / completed if completed else 0.0
+        metrics['claim_latency_avg'] = metrics.pop('claim_latency_total') / metrics['claims'] if metrics[
+            'claims'] else 0.0
+        return metrics
+
+    def _reset_metrics(self) -> None:
+        self._metrics = {'claimed': 0, 'succeeded': 0, 'failed': 0, 'claims': 0, 'empty_claims': 0,
+                         'claim_conflicts': 0, 'latency_total': 0.0, 'latency_max': 0.0, 'claim_latency_total': 0.0,
+                         'start': time.monotonic(), 'end': None}
+
+    def _claim(self, num: int) -> Any:
+        kwargs = {'raise_error': True}
+        kwargs.update(self.select_kwargs)
+        start = time.monotonic()
+        try:
+            rows = self.db.select_to_try(self.table, num, self.key_fields, self.extra_fields, self.tried_field,
+                                         finished_field=self.finished_field, next_time_field=self.next_time_field,
+                                         **kwargs)
+        except Exception as e:
+            self._metrics['claim_conflicts'] += 1
+            if self.log:
+                self.logger.error('{}: {}  (in TaskRunner._claim)'.format(str(type(e))[8:-2], e))
+            rows = ()
+        self._metrics['claims'] += 1
+        self._metrics['claim_latency_total'] += time.monotonic() - start
+        if rows:
+            self._metrics['claimed'] += len(rows)
+        else:
+            self._metrics['empty_claims'] += 1
+        return rows
+
+    def _complete(self, done: Iterable[concurrent.futures.Future], pending: dict) -> None:
+        now = time.monotonic()
+        for future in done:
+            row, start = pending.pop(future)
+            latency = now - start
+            self._metrics['latency_total'] += latency
+            if latency > self._metrics['latency_max']:
+                self._metrics['latency_max'] = latency
+            if future.exception() is None:
+                self._metrics['succeeded'] += 1
+                self.completions.end([row])
+            else:
+                self._metrics['failed'] += 1
+                self.completions.fail([row])
+                if self.log:
+                    e = future.exception()
+                    self.logger.error('{}: {}  (in TaskRunner, row: {})'.format(str(type(e))[8:-2], e, row))
+
+
+class CompletionBuffer(object):
+    # end_try, fail_try, cancel_try的攒批提交: 多次(可跨线程)end, fail, cancel的记录按目标状态分组累积,
+    # 某组达到flush_size条, 或距上次提交超过flush_interval秒(timer=True时由后台线程定时检查)时, 每组以一条end_try/fail_try/cancel_try
+    # 提交(记录数超过单条语句上限时end_try在同一事务中分多条语句执行); close(), with语句退出及进程退出(atexit)时提交剩余记录
+    # 提交出错(raise)或失败(return 0)的组放回待提交记录, 下次flush时重试; close()之后加入的记录立即提交
+    # db: 提交在调用end, fail, cancel, flush的线程或后台线程中进行(已加锁串行), 需为连接池模式(pool_size)或仅供本对象使用
+    # tried_field, finished_field, next_time_field: 传给end_try, fail_try; cancel_try只传入tried_field以恢复原状
+    # end_kwargs, fail_kwargs, cancel_kwargs: 分别额外传给end_try, fail_try, cancel_try的参数
+    # written: 各组已成功提交的记录数
+
+    def __init__(self, db: SqlClient, table: Optional[str] = None, key_fields: Union[str, Iterable[str]] = 'id',
+                 tried_field: Optional[str] = None, finished_field: Optional[str] = None,
+                 next_time_field: Optional[str] = None, end_kwargs: Optional[dict] = None,
+                 fail_kwargs: Optional[dict] = None, cancel_kwargs: Optional[dict] = None, flush_size: int = 100,
+                 flush_interval: Union[int, float, None] = 1, timer: bool = True, log: bool = True):
+        self.db = db
+        self.table = db.table if table is None else table
+        self.key_fields = [key.strip() for key in key_fields.split(',')] if isinstance(key_fields, str) else list(
+            key_fields)
+        self.tried_field = tried_field
+        self.finished_field = finished_field
+        self.next_time_field = next_time_field
+        self.kwargs = {'end': {} if end_kwargs is None else end_kwargs,
+                       'fail': {} if fail_kwargs is None else fail_kwargs,
+                       'cancel': {} if cancel_kwargs is None else cancel_kwargs}
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.timer = timer
+        self.log = log
+        if log:
+            self.logger = logging.getLogger(__name__)
+        self.written = {'end': 0, 'fail': 0, 'cancel': 0}
+        self._pending = {'end': [], 'fail': [], 'cancel': []}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+        self._registered = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        # 尚未提交的记录数
+        return sum(map(len, self._pending.values()))
+
+    def end(self, rows: Any) -> None:
+        # rows: 单条或多条记录, 格式同end_try的result
+        self._add('end', rows)
+
+    def fail(self, rows: Any) -> None:
+        self._add('fail', rows)
+
+    def cancel(self, rows: Any) -> None:
+        self._add('cancel', rows)
+
+    def flush(self, force: bool = True) -> int:
+        # 提交累积的记录, return本次成功提交的记录数; force=False时仅提交达到flush_size或flush_interval的组
+        with self._flush_lock:
+            with self._lock:
+                expired = force or self.flush_interval is not None and \
+                          time.monotonic() - self._last_flush >= self.flush_interval
+                batches = []
+                for group, rows in self._pending.items():
+                    if rows and (expired or len(rows) >= self.flush_size):
+                        batches.append((group, rows))
+                        self._pending[group] = []
+                if expired:
+                    self._last_flush = time.monotonic()
+            written = 0
+            for i, (group, rows) in enumerate(batches):
+                try:
+                    if group == 'cancel':
+                        result = self.db.cancel_try(rows, self.table, self.key_fields, self.tried_field,
+                                                    **self.kwargs[group])
+                    else:
+                        result = getattr(self.db, group + '_try')(
+                            rows, self.table, self.key_fields, self.tried_field, finished_field=self.finished_field,
+                            next_time_field=self.next_time_field, **self.kwargs[group])
+                except BaseException:
+                    # 出错的组及之后尚未提交的组放回待提交记录, 异常继续抛出
+                    self._restore(batches[i:])
+                    raise
+                if result:
+                    written += len(rows)
+                    self.written[group] += len(rows)
+                else:  # 提交失败(raise_error=False), 留待下次提交
+                    self._restore([(group, rows)])
+            return written
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        atexit.unregister(self.close)
+        self.flush()
+
+    def _restore(self, batches: Iterable[Tuple[str, list]]) -> None:
+        # 未成功提交的记录放回对应组的最前面
+        with self._lock:
+            for group, rows in batches:
+                self._pending[group][:0] = rows
+
+    def _add(self, group: str, rows: Any) -> None:
+        # close()之后加入的记录不再攒批, 立即提交
+        rows, _ = self.db.standardize_args(rows, True, False, None, False)
+        if not rows:
+            return
+        with self._lock:
+            pending = self._pending[group]
+            pending.extend(rows)
+            full = len(pending) >= self.flush_size
+            closed = self._closed.is_set()
+            if not self._registered and not closed:
+                self._registered = True
+                atexit.register(self.close)
+                if self.timer and self.flush_interval is not None:
+                    self._thread = threading.Thread(target=self._run_timer, name='CompletionBuffer', daemon=True)
+                    self._thread.start()
+        if closed:
+            self.flush()
+        elif full or not self.timer:
+            self.flush(False)
+
+    def _run_timer(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush(False)
+            except Exception as e:
+                if self.log:
+                    self.logger.error('{}: {}  (in CompletionBuffer._run_timer)'.format(str(type(e))[8:-2], e))
+
+
+class TaskPrefetcher(object):
+    # select_to_try的预取迭代器(见iter_tasks): 后台线程按批领取任务放入本地缓冲区, 缓冲区少于low_watermark条时补足到prefetch条,
+    # 迭代逐条取出; 领取为空时等待时间从poll_interval起按backoff倍数增长至max_poll_interval
+    # 预取的任务与select_to_try领取的任务相同(tried_field, next_time_field等已标记为处理中), 取出后由调用方end_try/fail_try
+    # db: 在后台线程中使用, 需为连接池模式(pool_size)或仅供本对象使用
+    # stop_when_idle: 领取为空且缓冲区已取完时结束迭代, 否则一直等待新任务直至close()
+    # close(): 停止预取, 缓冲区中尚未取出的任务以cancel_try恢复原状; 也可用with语句
+
+    def __init__(self, db: SqlClient, table: Optional[str] = None, prefetch: int = 10,
+                 low_watermark: Optional[int] = None, key_fields: Union[str, Iterable[str]] = 'id',
+                 extra_fields: Union[str, Iterable[str], None] = '', tried_field: Optional[str] = None,
+                 finished_field: Optional[str] = None, next_time_field: Optional[str] = None,
+                 select_kwargs: Optional[dict] = None, poll_interval: Union[int, float] = 0.1,
+                 max_poll_interval: Union[int, float] = 30, backoff: Union[int, float] = 2,
+                 stop_when_idle: bool = False, log: bool = True):
+        # low_watermark: 默认为prefetch的一半(至少为1)
+        self.db = db
+        self.table = db.table if table is None else table
+        self.prefetch = prefetch
+        self.low_watermark = max(prefetch // 2, 1) if low_watermark is None else low_watermark
+        self.key_fields = [key.strip() for key in key_fields.split(',')] if isinstance(key_fields, str) else list(
+            key_fields)
+        self.extra_fields = extra_fields
+        self.tried_field = tried_field
+        self.finished_field = finished_field
+        self.next_time_field = next_time_field
+        self.select_kwargs = {} if select_kwargs is None else select_kwargs
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.stop_when_idle = stop_when_idle
+        self.log = log
+        if log:
+            self.logger = logging.getLogger(__name__)
+        self.claims = 0
+        self.claimed = 0
+        self._buffer = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._exhausted = False
+        self._thread = threading.Thread(target=self._refill, name='TaskPrefetcher', daemon=True)
+        self._thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        with self._condition:
+            while not self._buffer:
+                if self._closed or self._exhausted:
+                    raise StopIteration
+                self._condition.wait()
+            row = self._buffer.popleft()
+            if len(self._buffer) < self.low_watermark:
+                self._condition.notify_all()
+            return row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        # 缓冲区中尚未取出的任务数
+        return len(self._buffer)
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        rows = list(self._buffer)
+        self._buffer.clear()
+        if rows:
+            self.db.cancel_try(rows, self.table, self.key_fields, self.tried_field)
+
+    def _refill(self) -> None:
+        kwargs = {'raise_error': True}
+        kwargs.update(self.select_kwargs)
+        interval = self.poll_interval
+        while True:
+            with self._condition:
+                while not self._closed and len(self._buffer) >= self.low_watermark:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                num = self.prefetch - len(self._buffer)
+            try:
+                rows = self.db.select_to_try(self.table, num, self.key_fields, self.extra_fields, self.tried_field,
+                                             finished_field=self.finished_field,
+                                             next_time_field=self.next_time_field, **kwargs)
+            except Exception as e:
+                if self.log:
+                    self.logger.error('{}: {}  (in TaskPrefetcher._refill)'.format(str(type(e))[8:-2], e))
+                rows = ()
+            self.claims += 1
+            with self._condition:
+                if rows:
+                    self.claimed += len(rows)
+                    self._buffer.extend(rows)
+                    self._condition.notify_all()
+                    interval = self.poll_interval
+                    if len(rows) >= num:
+                        continue
+                elif self.stop_when_idle and not self._buffer:
+                    self._exhausted = True
+                    self._condition.notify_all()
+                    return
+                # 领取不足或为空: 等待后再领取(close时提前唤醒)
+                self._condition.wait(interval)
+                if not rows:
+                    interval = min(interval * self.backoff, self.max_poll_interval)
+
+
+def iter_tasks(db: SqlClient, table: Optional[str] = None, prefetch: int = 10, low_watermark: Optional[int] = None,
+               key_fields: Union[str, Iterable[str]] = 'id', extra_fields: Union[str, Iterable[str], None] = '',
+               tried_field: Optional[str] = None, finished_field: Optional[str] = None,
+               next_time_field: Optional[str] = None, select_kwargs: Optional[dict] = None,
+               poll_interval: Union[int, float] = 0.1, max_poll_interval: Union[int, float] = 30,
+               backoff: Union[int, float] = 2, stop_when_idle: bool = False, log: bool = True) -> TaskPrefetcher:
+    # 逐条迭代任务, 每次select_to_try领取prefetch条, 分摊单条领取的往返开销; 参数见TaskPrefetcher
+    # with iter_tasks(db, 'my_table', prefetch=50, tried_field='tried') as tasks:
+    #     for row in tasks: ...
+    return TaskPrefetcher(db, table, prefetch, low_watermark, key_fields, extra_fields, tried_field, finished_field,
+                          next_time_field, select_kwargs, poll_interval, max_poll_interval, backoff, stop_when_idle,
+                          log)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import concurrent.futures
+import threading
 import sys
 import os
 from typing import Any
@@ -75,6 +77,96 @@ class SqlClientTestCase(unittest.TestCase):
                                               self.table.replace('{', '{{').replace('}', '}}').replace('?', '\?')))
         self._test_query([['5', '6'], ['11', '12'], ['9', '10'], ['7', '8']], 'select * from {}'.format(self.table))
 
+    def test_save_data_values(self):
+        self.assertEqual(3, self.db.save_data([(1, 2), (3, 4), (5, '')], self.table.replace(
+            '{', '{{').replace('}', '}}').replace('?', r'\?'), batch_mode='values'))
+        self._test_query([['1', '2'], ['3', '4'], ['5', None]], 'select * from {}'.format(self.table))
+
+    def test_save_data_values_error(self):
+        table = 'test_values_unique'
+        self.db.query('drop table if exists {}'.format(table), fetchall=False)
+        self.db.query('create table {} (a varchar(255) NOT NULL PRIMARY KEY,b varchar(255) NULL)'.format(table),
+                      fetchall=False)
+        try:
+            # 块内一条记录违反主键约束: 二分拆分后仅跳过该记录
+            self.assertEqual(3, self.db.save_data([(1, 2), (3, 4), (1, 6), (5, 6)], table, batch_mode='values',
+                                                  raise_error=False))
+            self._test_query([['1', '2'], ['3', '4'], ['5', '6']], 'select * from {} order by a'.format(table))
+            with self.assertRaises(Exception):
+                self.db.save_data([(7, 8), (7, 8)], table, batch_mode='values')
+            # 表不存在等非记录本身的错误: 不拆分, 直接终止
+            self.assertEqual(0, self.db.save_data([(1, 2)] * 3, 'no_table', batch_mode='values', raise_error=False))
+        finally:
+            self.db.query('drop table {}'.format(table), fetchall=False)
+
+    def test_query_cache(self):
+        self.db.query_cache.clear()
+        for _ in range(3):
+            self._test_query(1, 'insert into {} values (%s,%s)'.format(self.table), ('1', '2'), fetchall=False)
+        self.assertEqual(2, self.db.query_cache_info()['hits'])
+        self._subtest_query([['1', '2']] * 3, 'select * from {}'.format(self.table))
+
+    def test_query_stream(self):
+        self.db.save_data([(1, 2), (3, 4), (5, 6)], self.table.replace(
+            '{', '{{').replace('}', '}}').replace('?', r'\?'), not_one_by_one=True)
+        self.assertEqual([2, 1], [len(chunk) for chunk in self.db.query(
+            'select * from {}'.format(self.table), chunksize=2, stream=True)])
+        self._subtest_query([['1', '2'], ['3', '4'], ['5', '6']], 'select * from {}'.format(self.table))
+
+    def test_query_columnar(self):
+        self.db.save_data([(1, 2), (3, None)], self.table.replace(
+            '{', '{{').replace('}', '}}').replace('?', r'\?'), not_one_by_one=True)
+        table = self.db.query('select * from {}'.format(self.table), columnar=True, chunksize=1)
+        self.assertEqual(2, len(table))
+        self.assertEqual(['1', '3'], table.column(0))
+        self.assertEqual([('1', '2'), ('3', None)], table.rows())
+        query = 'select case when b is null then null else 7 end from {} order by a'.format(self.table)
+        table = self.db.query(query, columnar=True)
+        self.assertEqual([7, None], table.column(0))
+        self.assertEqual([0, 1], list(table.mask(0)))
+        table = self.db.query(query, columnar='numpy')
+        self.assertEqual('int64', table[0].dtype.name)
+        self.assertEqual([7, None], table.column(0))
+        self.assertEqual([False, True], table.mask(0).tolist())
+        # 各数据库小数字面量的类型不同(Decimal或float), float列直接由from_chunks构造
+        table = sql_client.base.ColumnTable.from_chunks(['x', 'y'], [[(1, 1.5), (None, None)], [(2, 2)]], True)
+        self.assertEqual([1, None, 2], table.column('x'))
+        self.assertEqual('float64', table['y'].dtype.name)
+        self.assertEqual([1.5, None, 2.0], table.column('y'))
+        self.assertEqual([False, True, False], table.mask('y').tolist())
+
+    def test_pool(self):
+        pool_db = self.module.SqlClient(try_times_connect=1, raise_error=True, pool_size=2, **self.account,
+                                        **self.extra_kwargs)
+        if pool_db.pool is None:  # sqlalchemy使用自身的连接池(is_pool)
+            pool_db.close()
+            self.skipTest('no built-in connection pool')
+        with pool_db, concurrent.futures.ThreadPoolExecutor(4) as executor:
+            list(executor.map(lambda i: pool_db.save_data((i, i), self.table.replace('{', '{{').replace(
+                '}', '}}').replace('?', r'\?')), range(8)))
+            self.assertEqual(0, pool_db.pool.info()['in_use'])
+        self.assertEqual(8, len(self.db.query('select * from {}'.format(self.table))))
+
+    def test_pool_release(self):
+        pool_db = self.module.SqlClient(try_times_connect=1, raise_error=True, pool_size=1, pool_timeout=1,
+                                        **self.account, **self.extra_kwargs)
+        if pool_db.pool is None:
+            pool_db.close()
+            self.skipTest('no built-in connection pool')
+        self.db.save_data([(1, 2), (3, 4)], self.table.replace('{', '{{').replace('}', '}}').replace('?', r'\?'))
+        with pool_db:
+            # 返回生成器的调用所在线程退出后, 连接随生成器耗尽归还
+            thread = threading.Thread(target=lambda: list(pool_db.query('select * from {}'.format(self.table),
+                                                                        chunksize=1)))
+            thread.start()
+            thread.join()
+            self.assertEqual(0, pool_db.pool.info()['in_use'])
+            result, cursor = pool_db.query('select * from {}'.format(self.table), keep_cursor=True)
+            self.assertEqual(1, pool_db.pool.info()['in_use'])
+            cursor.close()
+            self.assertEqual(0, pool_db.pool.info()['in_use'])
+            self.assertEqual(2, len(pool_db.query('select * from {}'.format(self.table))))
+
     def test_autocommit(self):
         new_db = self.module.SqlClient(try_times_connect=1, raise_error=True, **self.account, **self.extra_kwargs)
         self.db.save_data((13, 14), self.table.replace('{', '{{').replace('}', '}}').replace('?', '\?'))
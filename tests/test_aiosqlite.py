@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import asyncio
+import json
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import sql_client.aiosqlite
+
+
+class AsyncSqlClientAiosqliteTestCase(unittest.IsolatedAsyncioTestCase):
+    table = 'test_table'
+
+    async def asyncSetUp(self) -> None:
+        self.db = sql_client.aiosqlite.AsyncSqlClient(try_times_connect=1, raise_error=True)
+        await self.db.query('create table {} (id integer primary key, a varchar(255) NULL, tried int default 0, '
+                            'finished int default 0)'.format(self.table), fetchall=False)
+
+    async def asyncTearDown(self) -> None:
+        await self.db.close()
+
+    async def test_query(self):
+        self.assertEqual(1, await self.db.query('insert into {} (a) values (%s)'.format(self.table), ('1',),
+                                                fetchall=False))
+        self.assertEqual([(1, '1')], await self.db.query('select id, a from {} where a=:a'.format(self.table),
+                                                         {'a': '1'}))
+        self.assertEqual([[{'a': '1'}], []], await self.db.query(
+            'select a from {} where id=%s'.format(self.table), [(1,), (2,)], not_one_by_one=False, dictionary=True))
+        self.assertEqual([[(1,)]], [chunk async for chunk in await self.db.query(
+            'select id from {}'.format(self.table), chunksize=1)])
+
+    async def test_save_data(self):
+        self.assertEqual(2, await self.db.save_data([{'a': '1'}, {'a': ''}], self.table))
+        self.assertEqual(2, await self.db.save_data([(None, '3', 0, 0), (None, '4', 0, 0)], self.table,
+                                                    batch_mode='values'))
+        self.assertEqual([('1',), (None,), ('3',), ('4',)], await self.db.query('select a from {}'.format(self.table)))
+        self.assertEqual(5, await self.db.save_data(({'a': str(i)} for i in range(5)), self.table, not_one_by_one=True,
+                                                    chunksize=2))
+        self.assertEqual(0, await self.db.save_data(iter(()), self.table))
+        self.assertEqual(3, await self.db.query('delete from {} where a=%s'.format(self.table),
+                                                ((str(i),) for i in range(3)), fetchall=False, chunksize=2))
+        self.assertEqual([(5,)], await self.db.query('select count(*) from {}'.format(self.table)))
+        with self.assertRaises(NotImplementedError):
+            self.db.load_data([{'a': '1'}], self.table)
+
+    async def test_select_to_try(self):
+        await self.db.save_data([{'a': '1'}, {'a': '2'}, {'a': '3'}], self.table)
+        result = await self.db.select_to_try(self.table, 2, 'id', 'a', tried_field='tried', tried=0, tried_after='+1',
+                                             lock=False)
+        self.assertEqual([(1, '1'), (2, '2')], result)
+        self.assertEqual(1, await self.db.end_try(result, self.table, 'id', finished_field='finished'))
+        self.assertEqual([(1, 1, 1), (2, 1, 1), (3, 0, 0)], await self.db.query(
+            'select id, tried, finished from {}'.format(self.table)))
+
+    async def test_standardize_args(self):
+        rows = [{'a': '1', 'b': ''}, {'a': '', 'b': 2}]
+        self.assertEqual(((('1', None), (None, 2)), ('a', 'b')), self.db.standardize_args(rows, None, True, False))
+        self.assertEqual((({'1': 1, '2': None, '3': 'x'},), None, True, True), self.db.standardize_args(
+            [(1, '', 'x')], None, True, True, True))
+        self.assertEqual(((('x', 1),), None), self.db.standardize_args([(1, '', 'x')], None, False, False,
+                                                                        nums=[2, 0]))
+        args, keys = self.db.standardize_args(iter(rows), None, True, False, lazy=True)
+        self.assertEqual(('a', 'b'), keys)
+        self.assertEqual([('1', None)], [next(args)])
+        self.assertEqual([(None, 2)], list(args))
+
+    async def test_transaction(self):
+        async with self.db.transaction():
+            await self.db.save_data({'a': '1'}, self.table)
+        with self.assertRaises(KeyError):
+            async with self.db.transaction():
+                await self.db.save_data({'a': '2'}, self.table)
+                raise KeyError
+        self.assertEqual([('1',)], await self.db.query('select a from {}'.format(self.table)))
+        self.assertTrue(self.db.autocommit)
+
+    async def test_retry_policy(self):
+        policy = sql_client.RetryPolicy(base=0.01, breaker_threshold=2, breaker_reset=60)
+        db = sql_client.aiosqlite.AsyncSqlClient(try_times_connect=3, raise_error=True, log=False,
+                                                 retry_policy=policy)
+        self.assertEqual([(1,)], await db.query('select 1'))
+        with self.assertRaises(db.lib.OperationalError) as cm:
+            await db.query('select * from no_table')
+        self.assertEqual(policy.FATAL, policy.classify(db, cm.exception))
+        policy.failure()
+        policy.failure()
+        with self.assertRaises(sql_client.CircuitOpenError):
+            await db.query('select 1')
+        await db.close()
+        e = db.lib.OperationalError('database is locked')
+        e.sqlite_errorcode = 5
+        self.assertEqual((False, 0, False), db._retry_decision(e, 1, 3, 0, time.monotonic()))
+        self.assertTrue(db._retry_decision(e, 1, 3, 0, time.monotonic(), True)[0])
+        policy = sql_client.RetryPolicy(breaker_threshold=1, breaker_reset=0.05)
+        policy.failure()
+        await asyncio.sleep(0.06)
+        policy.check()
+        with self.assertRaises(sql_client.CircuitOpenError):
+            policy.check()
+        policy.success()
+        policy.check()
+
+    async def test_retrying_transaction(self):
+        calls = []
+
+        @self.db.retry_transaction(retries=2, backoff=None)
+        async def work(a):
+            await self.db.save_data({'a': a}, self.table)
+            calls.append(a)
+            if len(calls) < 3:
+                e = self.db.lib.OperationalError('database is locked')
+                e.sqlite_errorcode = 5
+                raise e
+            return len(calls)
+
+        self.assertEqual(3, await work('1'))
+        self.assertEqual([('1',)], await self.db.query('select a from {}'.format(self.table)))
+        with self.assertRaises(self.db.lib.OperationalError):
+            await self.db.retrying_transaction(self.db.query, args=('select * from no_table',))
+
+    async def test_instrumentation(self):
+        instrumentation = sql_client.HistogramInstrumentation()
+        self.db.instrumentation = instrumentation
+        await self.db.save_data([{'a': '1'}, {'a': '2'}], self.table)
+        for i in range(3):
+            await self.db.query('select a from {} where id=%s'.format(self.table), (i,))
+        stats = instrumentation.snapshot()['select a from {} where id=?'.format(self.table)]
+        self.assertEqual({'paramstyle', 'standardize', 'execute', 'fetch'}, set(stats))
+        self.assertEqual(3, stats['execute']['count'])
+        self.assertEqual(2, stats['fetch']['rows'])
+        self.assertGreaterEqual(instrumentation.percentile('select a from {} where id=?'.format(self.table),
+                                                           'execute', 99), 0)
+
+    async def test_statement_stats(self):
+        stats = sql_client.StatementStats(max_statements=10)
+        self.db.instrumentation = stats
+        await self.db.save_data([{'a': '1'}, {'a': '2'}], self.table)
+        for i in range(4):
+            await self.db.query('select a from {} where id=%s'.format(self.table), (i % 2 + 1,))
+        with self.assertRaises(self.db.lib.OperationalError):
+            await self.db.query('select * from no_table')
+        entry = stats.get('select a from {} where id=?'.format(self.table))
+        self.assertEqual((4, 4, 0, 0), (entry['calls'], entry['rows'], entry['retries'], entry['errors']))
+        self.assertLessEqual(entry['p95'], entry['max'])
+        self.assertEqual(1, stats.get('select * from no_table')['errors'])
+        self.assertEqual(entry, stats.top(1, 'calls')[0])
+        self.assertEqual(3, len(json.loads(stats.dump())))
+
+
+if __name__ == '__main__':
+    unittest.main()
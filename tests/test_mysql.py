@@ -35,6 +35,19 @@ class SqlClientMysqlclientTestCase(tests.base_case.SqlClientTestCase):
             '}', '}}').replace('?', '\?').replace('%', '%%')))
         self._test_query([['5', '6'], ['11', '12'], ['9', '10'], ['7', '8']], 'select * from {}'.format(self.table))
 
+    def test_save_data_values(self):
+        self.assertEqual(3, self.db.save_data([(1, 2), (3, 4), (5, '')], self.table.replace('{', '{{').replace(
+            '}', '}}').replace('?', r'\?').replace('%', '%%'), batch_mode='values'))
+        self._test_query([['1', '2'], ['3', '4'], ['5', None]], 'select * from {}'.format(self.table))
+
+    def test_load_data(self):
+        db = self.module.SqlClient(try_times_connect=1, raise_error=True, local_infile=True, **self.account,
+                                   **self.extra_kwargs)
+        self.assertEqual(2, db.save_data([{'a': 1, 'b': 'x\ty'}, {'a': 3, 'b': ''}], self.table.replace(
+            '{', '{{').replace('}', '}}').replace('?', r'\?').replace('%', '%%'), method='load_data'))
+        self._test_query([['1', 'x\ty'], ['3', None]], 'select * from {}'.format(self.table))
+        db.close()
+
     def test_isolation_level(self):
         version = self._query_middleware('SELECT VERSION()')[0][0].split('.')
         version[2] = version[2].split('-')[0]
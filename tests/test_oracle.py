@@ -34,6 +34,22 @@ class SqlClientOracleTestCase(tests.base_case.SqlClientTestCase):
         self._subtest_query(1, 'select * from {}'.format(self.table), to_result_class=False, fetchall=False,
                             dictionary=True)
 
+    def test_array_dml(self):
+        count, errors = self.db.array_dml([(1, 2), (3, ''), ('5' * 300, 6)], self.table)
+        self.assertEqual(2, count)
+        self.assertEqual([(2, ('5' * 300, 6))], [error[:2] for error in errors])
+        self._subtest_query([['1', '2'], ['3', None]], 'select * from {}'.format(self.table),
+                            result_factory=lambda x: sorted(x))
+
+    def test_pool_release(self):
+        super().test_pool_release()
+        with self.module.SqlClient(try_times_connect=1, raise_error=True, pool_size=1, pool_timeout=1,
+                                   **self.account) as pool_db:
+            self.assertEqual((1, []), pool_db.array_dml([(5, 6)], self.table))
+            self.assertEqual(0, pool_db.pool.info()['in_use'])
+            self.assertEqual(1, pool_db.save_data([(7, 8)], self.table, batch_mode='values'))
+            self.assertEqual(0, pool_db.pool.info()['in_use'])
+
 
 class SqlClientSqlalchemyTestCase(tests.base_case.SqlClientTestCase):
     env = env.oracle
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import threading
+import time
 import sys
 import os
 
@@ -19,6 +21,42 @@ class SqlClientPostgresqlTestCase(tests.base_case.SqlClientTestCase):
     def test_isolation_level(self):
         self._test_query([['READ COMMITTED']], 'show transaction isolation level')
 
+    def test_copy(self):
+        self.assertEqual(2, self.db.save_data([(1, 2), (3, '')], self.table, method='copy'))
+        self._test_query([['1', '2'], ['3', None]], 'select * from {}'.format(self.table))
+        self.assertEqual([('1', '2'), ('3', None)], list(self.db.copy_out('select * from {}'.format(self.table))))
+
+    def test_copy_out_close(self):
+        # 提前关闭生成器时读取线程已读完(结束标记因队列满而等待)或仍在读取, 均不应阻塞
+        self.db.save_data([(i, i) for i in range(5)], self.table, method='copy')
+        for queue_size in (4, 1):
+            rows = self.db.copy_out('select * from {}'.format(self.table), queue_size=queue_size)
+            self.assertEqual(2, len(next(rows)))
+            time.sleep(0.5)
+            thread = threading.Thread(target=rows.close, daemon=True)
+            thread.start()
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(5, len(self.db.query('select * from {}'.format(self.table))))
+
+    def test_pool_release(self):
+        super().test_pool_release()
+        with self.module.SqlClient(try_times_connect=1, raise_error=True, pool_size=1, pool_timeout=1,
+                                   **self.account) as pool_db:
+            self.assertEqual(1, pool_db.save_data([(5, 6)], self.table, method='copy'))
+            self.assertEqual(0, pool_db.pool.info()['in_use'])
+            rows = pool_db.copy_out('select * from {}'.format(self.table))
+            self.assertEqual(1, pool_db.pool.info()['in_use'])
+            self.assertEqual(3, len(list(rows)))
+            self.assertEqual(0, pool_db.pool.info()['in_use'])
+
+    def test_prepare(self):
+        with self.module.SqlClient(try_times_connect=1, raise_error=True, prepare=2, **self.account) as db:
+            db.save_data([('1', '2'), ('3', '4')], self.table)
+            for a, b in (('1', '2'), ('3', '4'), ('1', '2')):
+                self._test_query([[b]], 'select b from {} where a=%s'.format(self.table), (a,), query_func=db.query)
+            self._test_query([[1]], 'select count(*) from pg_prepared_statements', query_func=db.query)
+
 
 class SqlClientSqlalchemyTestCase(tests.base_case.SqlClientTestCase):
     env = env.postgresql
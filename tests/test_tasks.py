@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import tempfile
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import sql_client.sqlalchemy
+import sql_client.tasks
+
+
+def _process(row):
+    if row[1] == 'bad':
+        raise ValueError(row[1])
+    return row
+
+
+class TaskRunnerTestCase(unittest.TestCase):
+    table = 'test_table'
+
+    def setUp(self) -> None:
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.db = self._connect()
+        self.db.query('create table {} (id integer primary key, a varchar(255) NULL, tried int default 1, '
+                      'finished int default 0, next_time int default 0)'.format(self.table), fetchall=False)
+        self.db.save_data([{'a': str(i)} for i in range(23)] + [{'a': 'bad'}], self.table)
+
+    def tearDown(self) -> None:
+        self.db.close()
+        os.remove(self.path)
+
+    def _connect(self):
+        # TaskPrefetcher在后台线程中使用连接
+        return sql_client.sqlalchemy.SqlClient('sqlite:///' + self.path, try_times_connect=1, raise_error=True,
+                                               engine_kwargs={'connect_args': {'check_same_thread': False}})
+
+    def _count(self, where):
+        return self.db.query('select count(*) from {} where {}'.format(self.table, where))[0][0]
+
+    def test_run(self):
+        runner = sql_client.tasks.TaskRunner(
+            self.db, _process, self.table, batch_size=5, workers=2, extra_fields='a', tried_field='tried',
+            finished_field='finished', next_time_field='next_time', select_kwargs={'lock': False}, flush_size=4,
+            poll_interval=0.01, stop_when_idle=True)
+        metrics = runner.run()
+        self.assertEqual((24, 23, 1), (metrics['claimed'], metrics['succeeded'], metrics['failed']))
+        self.assertEqual(23, self._count('finished=1 and tried=0'))
+        self.assertEqual(1, self._count("finished=0 and tried=2 and next_time>0 and a='bad'"))
+
+    def test_max_tasks(self):
+        runner = sql_client.tasks.TaskRunner(
+            self.db, _process, self.table, batch_size=4, workers=1, extra_fields='a', tried_field='tried',
+            finished_field='finished', select_kwargs={'lock': False}, max_tasks=6)
+        self.assertEqual(6, runner.run()['claimed'])
+        self.assertEqual(6, self._count('finished=1'))
+        self.assertEqual(18, self._count('tried=1'))
+
+    def test_run_twice(self):
+        # 第二次run仍攒批提交: 每次run结束时以一条end_try提交全部完成的任务
+        runner = sql_client.tasks.TaskRunner(
+            self.db, _process, self.table, batch_size=3, workers=1, extra_fields='a', tried_field='tried',
+            finished_field='finished', select_kwargs={'lock': False}, flush_size=100, flush_interval=60, max_tasks=6)
+        end_try = self.db.end_try
+        calls = []
+        self.db.end_try = lambda rows, *args, **kwargs: calls.append(len(rows)) or end_try(rows, *args, **kwargs)
+        self.assertEqual(6, runner.run()['succeeded'])
+        self.assertEqual(6, runner.run()['succeeded'])
+        self.assertEqual([6, 6], calls)
+        self.assertEqual(12, self._count('finished=1'))
+
+    def test_iter_tasks(self):
+        db = self._connect()
+        with sql_client.tasks.iter_tasks(db, self.table, prefetch=5, low_watermark=2, extra_fields='a',
+                                         tried_field='tried', select_kwargs={'lock': False}, poll_interval=0.01,
+                                         stop_when_idle=True) as tasks:
+            rows = [next(tasks) for _ in range(7)]
+        db.close()
+        self.assertEqual([str(i) for i in range(7)], [row[1] for row in rows])
+        self.assertEqual(7, self._count('tried=-1'))
+        self.assertEqual(17, self._count('tried=1'))
+        with sql_client.tasks.iter_tasks(self.db, self.table, prefetch=10, tried_field='tried',
+                                         select_kwargs={'lock': False}, stop_when_idle=True) as tasks:
+            self.assertEqual(17, len(list(tasks)))
+        self.assertEqual(24, self._count('tried=-1'))
+
+    def test_completion_buffer(self):
+        self.db.query('update {} set tried=-1'.format(self.table), fetchall=False)
+        with sql_client.tasks.CompletionBuffer(self.db, self.table, tried_field='tried', finished_field='finished',
+                                               flush_size=10, flush_interval=None) as completions:
+            completions.end([[i] for i in range(1, 10)])
+            completions.fail([23])
+            completions.cancel([[24]])
+            self.assertEqual(11, len(completions))
+            completions.end(10)
+            self.assertEqual(10, self._count('finished=1'))
+            self.assertEqual(2, len(completions))
+        self.assertEqual({'end': 10, 'fail': 1, 'cancel': 1}, completions.written)
+        self.assertEqual(10, self._count('finished=1 and tried=0'))
+        self.assertEqual(1, self._count('id=23 and tried=2'))
+        self.assertEqual(1, self._count('id=24 and tried=1'))
+
+    def test_completion_buffer_failure(self):
+        completions = sql_client.tasks.CompletionBuffer(self.db, 'no_table', tried_field='tried', flush_size=10,
+                                                        flush_interval=None)
+        completions.end([[1], [2]])
+        completions.fail([3])
+        with self.assertRaises(Exception):
+            completions.flush()
+        self.assertEqual(3, len(completions))
+        self.assertEqual({'end': 0, 'fail': 0, 'cancel': 0}, completions.written)
+        completions.table = self.table
+        completions.close()
+        self.assertEqual(0, len(completions))
+        completions.end([4])
+        self.assertEqual(0, len(completions))
+        self.assertEqual({'end': 3, 'fail': 1, 'cancel': 0}, completions.written)
+        self.assertEqual(3, self._count('id in (1, 2, 4) and tried=0'))
+
+    def test_reclaim_expired(self):
+        self.db.query(self.db.task_index_sql(self.table, 'tried', 'finished', 'next_time'), fetchall=False)
+        self.assertEqual(3, len(self.db.select_to_try(self.table, 3, tried_field='tried', next_time_field='next_time',
+                                                      lock=False, lease_seconds=-1)))
+        self.assertEqual(2, len(self.db.select_to_try(self.table, 2, tried_field='tried', next_time_field='next_time',
+                                                      lock=False, lease_seconds=600)))
+        self.assertEqual(3, self.db.reclaim_expired(self.table, 'tried', 'next_time', finished_field='finished'))
+        self.assertEqual(3, self._count('tried=2'))
+        self.assertEqual(2, self._count('tried=-1'))
+        self.assertEqual(0, self.db.reclaim_expired(self.table, 'tried', 'next_time'))
+
+
+if __name__ == '__main__':
+    unittest.main()